@@ -6,7 +6,8 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_wtf.csrf import CSRFProtect
 
 import os
-import sqlalchemy
+
+from DinhoFlix import banco, metricas
 
 # ===============================
 # CRIAÇÃO DA APLICAÇÃO
@@ -32,7 +33,7 @@ app.config['SECRET_KEY'] = '29cecf8afd6176f06bb3f55472d490d1'
 
 # Banco de dados (sempre dentro de /instance)
 if os.getenv("DATABASE_URL"):
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URL")
+    app.config['SQLALCHEMY_DATABASE_URI'] = banco.normalizar_url(os.getenv("DATABASE_URL"))
 else:
     app.config['SQLALCHEMY_DATABASE_URI'] = (
         'sqlite:///' + os.path.join(app.instance_path, 'SiteTeste.db')
@@ -41,10 +42,162 @@ else:
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['REMEMBER_COOKIE_DURATION'] = timedelta(days=7)
 
+# Senhas (ver senhas.py): custo do bcrypt e pool que roda os hashes. Mudar o
+# custo vale para contas novas e, no próximo login, para as existentes.
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('SENHA_CUSTO', 12))
+app.config['SENHAS_WORKERS'] = int(os.getenv('SENHAS_WORKERS', max((os.cpu_count() or 2) // 2, 1)))
+app.config['SENHAS_FILA_MAXIMA'] = 32  # logins esperando o pool antes de responder 503
+app.config['SENHAS_ESPERA'] = 10       # segundos
+
+# Aplica as migrações pendentes (ver migracoes.py) ao importar a aplicação
+app.config['MIGRAR_AO_INICIAR'] = os.getenv('MIGRAR_AO_INICIAR', '1') == '1'
+
+# Feed paginado por cursor
+app.config['FEED_TAMANHO_PAGINA'] = 20
+app.config['EM_ALTA_JANELA'] = 12 * 3600  # segundos de novidade que valem 10x engajamento
+
+# Feed e explorar renderizados em partes (ver renderizacao.py): o topo da
+# página sai antes das consultas, os primeiros FEED_PRIMEIRO_BLOCO cards
+# logo em seguida e o resto da página depois
+app.config['RENDER_EM_PARTES'] = os.getenv('RENDER_EM_PARTES', '1') == '1'
+app.config['RENDER_PARTES_BUFFER'] = 16 * 1024  # bytes juntados antes de cada envio
+app.config['FEED_PRIMEIRO_BLOCO'] = 5
+
+# Comentários carregados sob demanda, em páginas
+app.config['COMENTARIOS_TAMANHO_PAGINA'] = 10
+
+# Vídeos por página no perfil e usuários por página em /usuarios
+app.config['PERFIL_TAMANHO_PAGINA'] = 12
+app.config['USUARIOS_TAMANHO_PAGINA'] = 24
+
+# Processamento de vídeos em segundo plano
+app.config['PROCESSAMENTO_WORKERS'] = int(os.getenv('PROCESSAMENTO_WORKERS', 2))
+app.config['PROCESSAMENTO_TIMEOUT'] = 30 * 60  # segundos por chamada do ffmpeg
+app.config['PROCESSAMENTO_SINCRONO'] = False
+# Um vídeo "processando" há mais que isso teve o job interrompido (processo
+# reciclado ou encerrado) e volta para a fila; passa do pior caso de um job
+# (normalizar + capa, cada chamada do ffmpeg até PROCESSAMENTO_TIMEOUT)
+app.config['PROCESSAMENTO_TRAVA_VALIDADE'] = 3 * app.config['PROCESSAMENTO_TIMEOUT']
+app.config['PROCESSAMENTO_VARREDURA'] = 60  # segundos entre buscas de vídeos pendentes/travados
+
+# Upload de vídeo em partes (retomável)
+app.config['UPLOAD_TAMANHO_PARTE'] = 5 * 1024 * 1024
+app.config['UPLOAD_VIDEO_TAMANHO_MAXIMO'] = app.config['MAX_CONTENT_LENGTH']
+
+# Onde ficam vídeos, capas e fotos (ver armazenamento.py): 'local' (static/)
+# ou 's3' (bucket S3 ou compatível; precisa do boto3 e das credenciais nas
+# variáveis AWS_* de sempre). Arquivos sem referência só são apagados por
+# `flask limpar-midia` depois de ARMAZENAMENTO_CARENCIA segundos.
+app.config['ARMAZENAMENTO_TIPO'] = os.getenv('ARMAZENAMENTO_TIPO', 'local')
+app.config['ARMAZENAMENTO_S3_BUCKET'] = os.getenv('ARMAZENAMENTO_S3_BUCKET')
+app.config['ARMAZENAMENTO_S3_ENDPOINT'] = os.getenv('ARMAZENAMENTO_S3_ENDPOINT')  # ex.: MinIO local
+app.config['ARMAZENAMENTO_S3_URL_PUBLICA'] = os.getenv('ARMAZENAMENTO_S3_URL_PUBLICA')
+app.config['ARMAZENAMENTO_S3_PREFIXO'] = os.getenv('ARMAZENAMENTO_S3_PREFIXO', '')
+app.config['ARMAZENAMENTO_CARENCIA'] = 24 * 3600
+
+# Entrega de mídia: None (o próprio app), 'x-accel' (nginx) ou 'x-sendfile'
+app.config['MIDIA_OFFLOAD'] = os.getenv('MIDIA_OFFLOAD') or None
+app.config['MIDIA_X_ACCEL_PREFIXO'] = '/_midia/'
+
+# Variantes responsivas (WebP/AVIF) de capas e fotos de perfil
+app.config['IMAGENS_LARGURAS'] = [160, 320, 640, 1280]
+
+# Variantes HLS geradas no processamento: (altura, bitrate de vídeo)
+app.config['HLS_ATIVO'] = True
+app.config['HLS_ESCADA'] = [
+    (240, 400_000),
+    (480, 1_000_000),
+    (720, 2_500_000),
+    (1080, 5_000_000),
+]
+
+# Busca textual (ver busca.py)
+app.config['BUSCA_TAMANHO_PAGINA'] = 20
+
+# Pool de conexões, por processo do gunicorn. Cada thread web e cada worker
+# de processamento de vídeo pode segurar uma conexão ao mesmo tempo.
+app.config['GUNICORN_THREADS'] = int(os.getenv('GUNICORN_THREADS', 4))
+app.config['BANCO_POOL_TAMANHO'] = int(os.getenv(
+    'BANCO_POOL_TAMANHO',
+    app.config['GUNICORN_THREADS'] + app.config['PROCESSAMENTO_WORKERS']
+))
+app.config['BANCO_POOL_EXCEDENTE'] = int(os.getenv('BANCO_POOL_EXCEDENTE', 2))
+app.config['BANCO_POOL_ESPERA'] = 10      # segundos esperando conexão livre
+app.config['BANCO_POOL_RECICLAR'] = 1800  # segundos até reabrir uma conexão
+app.config['BANCO_SQLITE_ESPERA'] = 5000  # ms esperando o lock de escrita
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = banco.opcoes_engine(app.config)
+
+# Cache do feed e dos cards: None, 'memoria' (LRU de cada processo) ou
+# 'redis' (compartilhado). Com vários workers em 'memoria', uma alteração só
+# invalida o processo que a recebeu; os outros ficam no máximo
+# CACHE_FEED_TTL segundos desatualizados.
+app.config['CACHE_TIPO'] = os.getenv('CACHE_TIPO', 'memoria') or None
+app.config['CACHE_REDIS_URL'] = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+app.config['CACHE_MAXIMO'] = 2048
+app.config['CACHE_FEED_TTL'] = 30
+app.config['CACHE_FRAGMENTO_TTL'] = 10 * 60
+app.config['USUARIO_CACHE_TTL'] = 60  # current_user sem consulta ao banco
+
+# Atualizações em tempo real (SSE, ver tempo_real.py): broker None (só o
+# próprio processo) ou 'redis' (todos os workers). Cada conexão ocupa uma
+# thread do worker durante TEMPO_REAL_DURACAO; o Procfile soma
+# TEMPO_REAL_MAX_CONEXOES às GUNICORN_THREADS, então streams abertos não
+# tiram threads das páginas (e não usam conexões do banco)
+app.config['TEMPO_REAL_BROKER'] = os.getenv('TEMPO_REAL_BROKER') or None
+app.config['TEMPO_REAL_REDIS_URL'] = os.getenv('TEMPO_REAL_REDIS_URL', app.config['CACHE_REDIS_URL'])
+app.config['TEMPO_REAL_MAX_CONEXOES'] = int(os.getenv('TEMPO_REAL_MAX_CONEXOES', 16))
+app.config['TEMPO_REAL_HEARTBEAT'] = 15  # segundos
+app.config['TEMPO_REAL_DURACAO'] = 120   # segundos até o navegador reconectar
+
+# Escrita adiada de likes e comentários (ver escrita_adiada.py): None (cada
+# interação faz o próprio commit), 'memoria' (fila do processo; o que não
+# foi gravado se perde se ele cair) ou 'arquivo' (fila também num log local,
+# reaplicado quando um processo sobe)
+app.config['ESCRITA_ADIADA'] = os.getenv('ESCRITA_ADIADA') or None
+app.config['ESCRITA_ADIADA_PASTA'] = os.path.join(app.instance_path, 'escrita_adiada')
+app.config['ESCRITA_ADIADA_INTERVALO'] = 0.5  # segundos entre gravações
+app.config['ESCRITA_ADIADA_LOTE'] = 500       # eventos na fila que antecipam a gravação
+
+# Limites de requisições (ver limites.py): backend None, 'memoria' (cada
+# processo conta o seu) ou 'redis' (contagem única entre os workers).
+# Regra -> (capacidade da rajada, fichas repostas por segundo).
+app.config['LIMITES_TIPO'] = os.getenv('LIMITES_TIPO', 'memoria') or None
+app.config['LIMITES_REDIS_URL'] = os.getenv('LIMITES_REDIS_URL', app.config['CACHE_REDIS_URL'])
+app.config['LIMITES_MAXIMO'] = 10_000  # baldes guardados na memória
+app.config['LIMITES'] = {         # por usuário (ou IP)
+    'curtir': (30, 2),
+    'comentar': (10, 0.2),        # depois da rajada, 1 a cada 5 s
+    'upload': (5, 1 / 120),       # depois da rajada, 1 a cada 2 min
+    'upload_parte': (30, 2),      # partes de 5 MB: ~10 MB/s depois da rajada
+}
+app.config['LIMITES_ROTA'] = {    # somando todos os usuários
+    'curtir': (400, 200),
+    'comentar': (200, 50),
+}
+
+# Métricas por requisição (ver metricas.py), expostas em /metrics. Com
+# METRICAS_TOKEN definido, /metrics e /saude/banco exigem
+# "Authorization: Bearer <token>".
+app.config['METRICAS_ATIVAS'] = os.getenv('METRICAS_ATIVAS', '1') == '1'
+app.config['METRICAS_LENTA_MS'] = int(os.getenv('METRICAS_LENTA_MS', 500))
+app.config['METRICAS_N_MAIS_1'] = 10  # repetições da mesma consulta numa requisição
+app.config['METRICAS_SERVER_TIMING'] = os.getenv('METRICAS_SERVER_TIMING') == '1'
+app.config['METRICAS_TOKEN'] = os.getenv('METRICAS_TOKEN')
+
 # ===============================
 # EXTENSÕES
 # ===============================
 database = SQLAlchemy(app)
+
+with app.app_context():
+    if banco.eh_sqlite(app.config['SQLALCHEMY_DATABASE_URI']):
+        banco.configurar_sqlite(database.engine, app.config['BANCO_SQLITE_ESPERA'])
+    monitor_pool = banco.MonitorPool(database.engine)
+    monitor_requisicoes = (
+        metricas.MonitorRequisicoes(app, database.engine)
+        if app.config['METRICAS_ATIVAS'] else None
+    )
+
 bcrypt = Bcrypt(app)
 
 login_manager = LoginManager(app)
@@ -58,22 +211,37 @@ login_manager.login_message_category = 'alert-info'
 from DinhoFlix import models
 
 # ===============================
-# CRIAÇÃO / VERIFICAÇÃO DO BANCO
+# CRIAÇÃO / MIGRAÇÃO DO BANCO
 # ===============================
-engine = sqlalchemy.create_engine(app.config['SQLALCHEMY_DATABASE_URI'])
-inspector = sqlalchemy.inspect(engine)
+# Com vários processos (gunicorn), prefira MIGRAR_AO_INICIAR=0 e rodar
+# `flask --app main migrar` uma vez antes de subir (release do Procfile).
+from DinhoFlix import migracoes
 
-if not inspector.has_table("usuario"):
+if app.config['MIGRAR_AO_INICIAR']:
     with app.app_context():
-        database.create_all()
-        print("✅ Banco de dados criado com sucesso!")
-else:
-    print("ℹ️ Banco de dados já existente.")
+        migracoes.aplicar_migracoes()
 
 # ===============================
 # IMPORTAÇÃO DAS ROTAS
 # ===============================
 
-from DinhoFlix.routes import curtir
-app.jinja_env.globals.update(curtir=curtir)
+from DinhoFlix.imagens import srcset_imagem
+from DinhoFlix.armazenamento import url_midia
+from DinhoFlix.cache import chave_card, fragmento_cache
+from DinhoFlix.escrita_adiada import curtidos_usuario
+from DinhoFlix.renderizacao import descarregar
+from DinhoFlix.processamento import formatar_duracao
+app.jinja_env.globals.update(
+    descarregar=descarregar,
+    formatar_duracao=formatar_duracao,
+    curtidos_usuario=curtidos_usuario,
+    srcset_imagem=srcset_imagem,
+    url_midia=url_midia,
+    chave_card=chave_card,
+    fragmento_cache=fragmento_cache
+)
 from DinhoFlix import routes
+from DinhoFlix import processamento
+
+from DinhoFlix import escrita_adiada
+escrita_adiada.retomar()
@@ -0,0 +1,499 @@
+import hashlib
+import mimetypes
+import os
+import re
+import secrets
+import shutil
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import url_for
+from sqlalchemy import bindparam, delete, func, insert, select, update
+
+from DinhoFlix import app, database
+from DinhoFlix.interacoes import insert_ignorando_conflito
+from DinhoFlix.midia import CACHE_IMUTAVEL
+from DinhoFlix.models import ArquivoMidia, Usuario, Video
+
+
+# ===============================
+# ARMAZENAMENTO DE MÍDIA
+# ===============================
+# Todo arquivo enviado ou gerado recebe o nome do próprio conteúdo:
+#   <pasta>/<sha256>.<extensão>
+# O mesmo arquivo enviado duas vezes vira um arquivo só. A tabela
+# arquivo_midia conta quantas linhas apontam para cada um; excluir um vídeo
+# ou trocar a foto de perfil só desconta a referência. Quem apaga do disco é
+# `flask limpar-midia`, depois de ARMAZENAMENTO_CARENCIA sem referências,
+# levando junto os derivados:
+#   <pasta>/<sha256>-<largura>.<formato>  variantes responsivas (imagens.py)
+#   <pasta>/<sha256>-variantes.json       registro dessas variantes
+#   hls/<sha256>/...                      variantes HLS (processamento.py)
+#
+# Onde os bytes ficam é decidido pelo backend (ARMAZENAMENTO_TIPO).
+
+TAMANHO_BLOCO = 64 * 1024
+
+# Nomes gerados pelo app: token_hex(8) (arquivos antigos) ou sha256. Os
+# demais (default.jpg, benchmark.mp4...) não entram na contagem e nunca são
+# apagados pela limpeza.
+BASE_GERADA = re.compile(r'[0-9a-f]{16}|[0-9a-f]{64}')
+NOME_GERADO = re.compile(rf'^(?P<base>{BASE_GERADA.pattern})(?:-\d+|-variantes)?\.\w+$')
+
+# Colunas que referenciam arquivos: pasta -> colunas
+REFERENCIAS = {
+    'videos': [Video.arquivo_video],
+    'thumbnails': [Video.thumbnail],
+    'fotos_perfil': [Usuario.foto_perfil],
+}
+
+
+# ===============================
+# BACKENDS
+# ===============================
+# Todos têm a mesma interface, sobre chaves "<pasta>/<nome>":
+#   gravar(chave, origem)  move o arquivo local origem para o armazenamento
+#   info(chave)            (tamanho, modificado_em) ou None se não existe
+#   caminho_local(chave)   contexto com um caminho local para ler o arquivo
+#   listar(prefixo)        (chave, tamanho, modificado_em) de cada arquivo
+#   apagar(*chaves)
+#   url(chave)
+
+class ArmazenamentoLocal:
+    """Arquivos em static/, entregues por midia.py (ou pelo proxy na frente)."""
+
+    em_disco = True
+
+    def __init__(self, raiz):
+        self.raiz = os.path.normpath(raiz)
+
+    def caminho(self, chave):
+        return os.path.join(self.raiz, *chave.split('/'))
+
+    def gravar(self, chave, origem):
+        destino = self.caminho(chave)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        shutil.move(origem, destino)
+
+    def info(self, chave):
+        try:
+            estado = os.stat(self.caminho(chave))
+        except FileNotFoundError:
+            return None
+        return estado.st_size, datetime.fromtimestamp(estado.st_mtime, timezone.utc)
+
+    @contextmanager
+    def caminho_local(self, chave):
+        yield self.caminho(chave)
+
+    def listar(self, prefixo):
+        pasta, _, inicio = prefixo.rpartition('/')
+        raiz_pasta = self.caminho(pasta)
+
+        for atual, _, arquivos in os.walk(raiz_pasta):
+            relativa = os.path.relpath(atual, self.raiz).replace(os.sep, '/')
+            for nome in arquivos:
+                chave = f'{relativa}/{nome}'
+                if chave.startswith(prefixo):
+                    estado = os.stat(os.path.join(atual, nome))
+                    yield chave, estado.st_size, datetime.fromtimestamp(estado.st_mtime, timezone.utc)
+
+    def apagar(self, *chaves):
+        pastas = set()
+        for chave in chaves:
+            try:
+                os.remove(self.caminho(chave))
+            except FileNotFoundError:
+                pass
+            pastas.add(os.path.dirname(self.caminho(chave)))
+
+        # Pastas do HLS que ficaram vazias (static/<pasta> fica)
+        for pasta in sorted(pastas, key=len, reverse=True):
+            while os.path.dirname(pasta) != self.raiz and os.path.isdir(pasta) and not os.listdir(pasta):
+                os.rmdir(pasta)
+                pasta = os.path.dirname(pasta)
+
+    def url(self, chave):
+        return url_for('static', filename=chave)
+
+
+class ArmazenamentoS3:
+    """
+    Bucket S3 ou compatível (MinIO, R2...) sobre qualquer cliente com a
+    interface do boto3 (upload_file, download_file, head_object,
+    list_objects_v2, delete_objects, generate_presigned_url).
+
+    Com url_publica (bucket público ou CDN na frente) os links são diretos;
+    sem ela, cada link é uma URL assinada. O HLS só funciona com url_publica:
+    o player resolve os segmentos relativos à playlist, sem assinatura.
+    """
+
+    em_disco = False
+
+    def __init__(self, cliente, bucket, url_publica=None, prefixo='', validade_url=3600):
+        self.cliente = cliente
+        self.bucket = bucket
+        self.url_publica = url_publica.rstrip('/') if url_publica else None
+        self.prefixo = prefixo
+        self.validade_url = validade_url
+
+    def gravar(self, chave, origem):
+        self.cliente.upload_file(origem, self.bucket, self.prefixo + chave, ExtraArgs={
+            'ContentType': mimetypes.guess_type(chave)[0] or 'application/octet-stream',
+            'CacheControl': CACHE_IMUTAVEL,
+        })
+        os.remove(origem)
+
+    def info(self, chave):
+        try:
+            cabecalho = self.cliente.head_object(Bucket=self.bucket, Key=self.prefixo + chave)
+        except Exception as erro:
+            # botocore.exceptions.ClientError, sem importar o botocore aqui
+            resposta = getattr(erro, 'response', None) or {}
+            if str(resposta.get('Error', {}).get('Code')) in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+        return cabecalho['ContentLength'], cabecalho['LastModified']
+
+    @contextmanager
+    def caminho_local(self, chave):
+        with temporario(os.path.splitext(chave)[1]) as caminho:
+            self.cliente.download_file(self.bucket, self.prefixo + chave, caminho)
+            yield caminho
+
+    def listar(self, prefixo):
+        parametros = {'Bucket': self.bucket, 'Prefix': self.prefixo + prefixo}
+        while True:
+            resposta = self.cliente.list_objects_v2(**parametros)
+            for objeto in resposta.get('Contents', []):
+                yield objeto['Key'][len(self.prefixo):], objeto['Size'], objeto['LastModified']
+
+            if not resposta.get('IsTruncated'):
+                return
+            parametros['ContinuationToken'] = resposta['NextContinuationToken']
+
+    def apagar(self, *chaves):
+        # delete_objects aceita até 1000 chaves por chamada
+        for inicio in range(0, len(chaves), 1000):
+            self.cliente.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': self.prefixo + chave} for chave in chaves[inicio:inicio + 1000]],
+                'Quiet': True,
+            })
+
+    def url(self, chave):
+        if self.url_publica:
+            return f'{self.url_publica}/{self.prefixo}{chave}'
+        return self.cliente.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': self.prefixo + chave},
+            ExpiresIn=self.validade_url
+        )
+
+
+def criar_armazenamento():
+    if app.config['ARMAZENAMENTO_TIPO'] == 's3':
+        import boto3  # dependência opcional, só para o armazenamento em bucket
+        cliente = boto3.client('s3', endpoint_url=app.config['ARMAZENAMENTO_S3_ENDPOINT'])
+        return ArmazenamentoS3(
+            cliente,
+            app.config['ARMAZENAMENTO_S3_BUCKET'],
+            app.config['ARMAZENAMENTO_S3_URL_PUBLICA'],
+            app.config['ARMAZENAMENTO_S3_PREFIXO']
+        )
+
+    return ArmazenamentoLocal(app.static_folder)
+
+
+# Trocável em tempo de execução (ex.: ArmazenamentoS3(cliente do moto, 'bucket'))
+armazenamento = criar_armazenamento()
+
+
+# ===============================
+# GRAVAÇÃO
+# ===============================
+@contextmanager
+def temporario(extensao=''):
+    """Caminho livre em instance/midia_tmp; o que sobrar nele é apagado na saída."""
+    pasta = os.path.join(app.instance_path, 'midia_tmp')
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, secrets.token_hex(8) + extensao)
+
+    try:
+        yield caminho
+    finally:
+        if os.path.isdir(caminho):
+            shutil.rmtree(caminho, ignore_errors=True)
+        elif os.path.exists(caminho):
+            os.remove(caminho)
+
+
+def _resumo_arquivo(caminho):
+    resumo = hashlib.sha256()
+    with open(caminho, 'rb') as arquivo:
+        for bloco in iter(lambda: arquivo.read(TAMANHO_BLOCO), b''):
+            resumo.update(bloco)
+    return resumo.hexdigest()
+
+
+def _referenciar(chave, tamanho):
+    """+1 referência; devolve True se a chave ainda não estava registrada."""
+    atualizadas = database.session.execute(
+        update(ArquivoMidia)
+        .where(ArquivoMidia.chave == chave)
+        .values(referencias=ArquivoMidia.referencias + 1, atualizado_em=datetime.now(timezone.utc))
+    ).rowcount
+    if atualizadas:
+        return False
+
+    inserida = database.session.execute(
+        insert_ignorando_conflito(ArquivoMidia).values(
+            chave=chave,
+            referencias=1,
+            tamanho=tamanho,
+            atualizado_em=datetime.now(timezone.utc)
+        )
+    ).rowcount
+    if inserida:
+        return True
+
+    # Outra requisição registrou o mesmo conteúdo entre o UPDATE e o INSERT
+    return _referenciar(chave, tamanho)
+
+
+def guardar(pasta, origem, extensao, resumo=None):
+    """
+    Move o arquivo local origem para <pasta>/<sha256><extensao> e conta uma
+    referência a ele, na transação atual. Se o conteúdo já existe, só a
+    referência é contada. Devolve o nome que vai na coluna do modelo.
+    """
+    nome = (resumo or _resumo_arquivo(origem)) + extensao.lower()
+    chave = f'{pasta}/{nome}'
+
+    # A linha registrada primeiro trava a limpeza (ver coletar_orfaos): se
+    # ela já apagou o registro, o arquivo é gravado de novo.
+    novo = _referenciar(chave, os.path.getsize(origem))
+    if novo or armazenamento.info(chave) is None:
+        armazenamento.gravar(chave, origem)
+    else:
+        os.remove(origem)
+
+    return nome
+
+
+def guardar_fluxo(pasta, fluxo, extensao):
+    """guardar() de um upload, calculando o sha256 enquanto copia para o disco."""
+    resumo = hashlib.sha256()
+
+    with temporario(extensao) as caminho:
+        with open(caminho, 'wb') as arquivo:
+            for bloco in iter(lambda: fluxo.read(TAMANHO_BLOCO), b''):
+                resumo.update(bloco)
+                arquivo.write(bloco)
+
+        return guardar(pasta, caminho, extensao, resumo.hexdigest())
+
+
+def guardar_derivado(chave, origem):
+    """Grava sem contar referência: derivados (variantes, HLS) e arquivos de nome fixo."""
+    armazenamento.gravar(chave, origem)
+
+
+def liberar(pasta, nome):
+    """-1 referência, na transação atual. O arquivo fica até a próxima limpeza."""
+    if not nome or not NOME_GERADO.match(nome):
+        return
+
+    database.session.execute(
+        update(ArquivoMidia)
+        .where(ArquivoMidia.chave == f'{pasta}/{nome}', ArquivoMidia.referencias > 0)
+        .values(referencias=ArquivoMidia.referencias - 1, atualizado_em=datetime.now(timezone.utc))
+    )
+
+
+# ===============================
+# CONSULTA
+# ===============================
+# Os outros módulos passam sempre por estas funções (e não pelo objeto
+# armazenamento), para a troca do backend em tempo de execução valer para todos.
+def em_disco():
+    return armazenamento.em_disco
+
+
+def info(chave):
+    return armazenamento.info(chave)
+
+
+def existe(pasta, nome):
+    return bool(nome) and armazenamento.info(f'{pasta}/{nome}') is not None
+
+
+def caminho_local(chave):
+    return armazenamento.caminho_local(chave)
+
+
+def listar(prefixo):
+    return armazenamento.listar(prefixo)
+
+
+def url_midia(pasta, nome):
+    """URL pública de <pasta>/<nome>. Usado nos templates."""
+    return armazenamento.url(f'{pasta}/{nome}')
+
+
+# ===============================
+# LIMPEZA
+# ===============================
+def _prefixos_derivados(chave):
+    pasta, _, nome = chave.partition('/')
+    base = nome.rsplit('.', 1)[0]
+    prefixos = [f'{pasta}/{base}-']
+    if pasta == 'videos':
+        prefixos.append(f'hls/{base}/')
+    return prefixos
+
+
+def coletar_orfaos(carencia):
+    """
+    Apaga os arquivos sem referência há mais de carencia segundos, com seus
+    derivados. Devolve (arquivos, bytes) removidos.
+    """
+    limite = datetime.now(timezone.utc) - timedelta(seconds=carencia)
+    orfaos = database.session.execute(
+        select(ArquivoMidia.chave, ArquivoMidia.tamanho)
+        .where(ArquivoMidia.referencias <= 0, ArquivoMidia.atualizado_em < limite)
+    ).all()
+
+    removidos = liberados = 0
+    for chave, tamanho in orfaos:
+        # O DELETE trava a linha até o commit: um upload do mesmo conteúdo
+        # agora espera e, sem o registro, grava o arquivo outra vez.
+        apagada = database.session.execute(
+            delete(ArquivoMidia)
+            .where(
+                ArquivoMidia.chave == chave,
+                ArquivoMidia.referencias <= 0,
+                ArquivoMidia.atualizado_em < limite
+            )
+        ).rowcount
+
+        if apagada:
+            derivados = [
+                derivado
+                for prefixo in _prefixos_derivados(chave)
+                for derivado, _, _ in armazenamento.listar(prefixo)
+            ]
+            armazenamento.apagar(chave, *derivados)
+            removidos += 1
+            liberados += tamanho or 0
+
+        database.session.commit()
+
+    return removidos, liberados
+
+
+def varrer_nao_registrados(carencia):
+    """
+    Apaga arquivos gerados pelo app que nenhum registro cobre (upload cuja
+    transação falhou, ou anterior ao registro e sem nenhuma linha apontando
+    para ele) e mais velhos que carencia. Devolve (arquivos, bytes).
+    """
+    limite = datetime.now(timezone.utc) - timedelta(seconds=carencia)
+    registrados = {
+        chave.rsplit('.', 1)[0]
+        for chave in database.session.execute(select(ArquivoMidia.chave)).scalars()
+    }
+
+    lixo, liberados = [], 0
+    for pasta in (*REFERENCIAS, 'hls'):
+        for chave, tamanho, modificado_em in armazenamento.listar(f'{pasta}/'):
+            if modificado_em >= limite:
+                continue
+
+            nome = chave.split('/')[1]
+            if pasta == 'hls':
+                # hls/<base>/... pertence a videos/<base>.*
+                dono = f'videos/{nome}' if BASE_GERADA.fullmatch(nome) else None
+            else:
+                encontrado = NOME_GERADO.match(nome)
+                dono = f'{pasta}/{encontrado["base"]}' if encontrado else None
+
+            if dono is None or dono in registrados:
+                continue
+
+            lixo.append(chave)
+            liberados += tamanho
+
+    armazenamento.apagar(*lixo)
+    return len(lixo), liberados
+
+
+def recontar_referencias(executor=None):
+    """
+    Refaz a contagem de arquivo_midia a partir das colunas dos modelos (para
+    bancos anteriores ao registro, ou se a contagem se perder).
+    """
+    executor = executor or database.session
+    tabela = ArquivoMidia.__table__
+
+    contagem = Counter()
+    for pasta, colunas in REFERENCIAS.items():
+        for coluna in colunas:
+            for nome, quantidade in executor.execute(
+                select(coluna, func.count()).where(coluna.is_not(None)).group_by(coluna)
+            ):
+                if NOME_GERADO.match(nome):
+                    contagem[f'{pasta}/{nome}'] += quantidade
+
+    agora = datetime.now(timezone.utc)
+    atuais = dict(executor.execute(select(tabela.c.chave, tabela.c.referencias)).all())
+
+    alteradas = [
+        {'chave_arquivo': chave, 'novas_referencias': contagem.get(chave, 0), 'agora': agora}
+        for chave, referencias in atuais.items()
+        if referencias != contagem.get(chave, 0)
+    ]
+    if alteradas:
+        executor.execute(
+            update(tabela)
+            .where(tabela.c.chave == bindparam('chave_arquivo'))
+            .values(referencias=bindparam('novas_referencias'), atualizado_em=bindparam('agora')),
+            alteradas
+        )
+
+    novas = [
+        {'chave': chave, 'referencias': quantidade, 'atualizado_em': agora}
+        for chave, quantidade in contagem.items()
+        if chave not in atuais
+    ]
+    if novas:
+        executor.execute(insert(tabela), novas)
+
+
+def _megabytes(quantidade):
+    return f'{quantidade / 1024 / 1024:.1f} MB'
+
+
+@app.cli.command('limpar-midia')
+@click.option('--varrer', is_flag=True, help='Também apaga arquivos fora do registro.')
+@click.option('--carencia', type=int, default=None, help='Segundos sem referência antes de apagar.')
+def limpar_midia(varrer, carencia):
+    """Apaga arquivos de mídia que nenhum vídeo ou usuário usa mais."""
+    if carencia is None:
+        carencia = app.config['ARMAZENAMENTO_CARENCIA']
+
+    removidos, liberados = coletar_orfaos(carencia)
+    print(f"✅ {removidos} arquivo(s) sem referência removido(s) ({_megabytes(liberados)}).")
+
+    if varrer:
+        removidos, liberados = varrer_nao_registrados(carencia)
+        print(f"✅ {removidos} arquivo(s) fora do registro removido(s) ({_megabytes(liberados)}).")
+
+
+@app.cli.command('recontar-midia')
+def recontar_midia():
+    """Refaz a contagem de referências dos arquivos de mídia."""
+    recontar_referencias()
+    database.session.commit()
+    print("✅ Referências dos arquivos de mídia recontadas.")
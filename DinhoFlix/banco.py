@@ -0,0 +1,128 @@
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+# ===============================
+# URL / OPÇÕES DO ENGINE
+# ===============================
+def normalizar_url(url):
+    """
+    O Heroku ainda entrega postgres://, que o SQLAlchemy não aceita mais, e
+    postgresql:// sem driver hoje aponta para o psycopg 3. O driver instalado
+    (requirements.txt) é o psycopg2.
+    """
+    esquema, separador, resto = url.partition('://')
+    if esquema in ('postgres', 'postgresql'):
+        return 'postgresql+psycopg2' + separador + resto
+    return url
+
+
+def eh_sqlite(url):
+    return make_url(url).get_backend_name() == 'sqlite'
+
+
+def opcoes_engine(config):
+    """
+    SQLALCHEMY_ENGINE_OPTIONS a partir da configuração. O pool é por
+    processo: cada worker do gunicorn abre até BANCO_POOL_TAMANHO +
+    BANCO_POOL_EXCEDENTE conexões, então o total no servidor é isso vezes o
+    número de workers (e precisa caber no max_connections do PostgreSQL).
+    """
+    if eh_sqlite(config['SQLALCHEMY_DATABASE_URI']):
+        # Espera do driver ao abrir a conexão; o resto vem dos PRAGMAs abaixo
+        return {'connect_args': {'timeout': config['BANCO_SQLITE_ESPERA'] / 1000}}
+
+    return {
+        'pool_size': config['BANCO_POOL_TAMANHO'],
+        'max_overflow': config['BANCO_POOL_EXCEDENTE'],
+        'pool_timeout': config['BANCO_POOL_ESPERA'],
+        'pool_recycle': config['BANCO_POOL_RECICLAR'],
+        # Descarta conexões derrubadas pelo servidor/proxy antes de usar
+        'pool_pre_ping': True,
+        # Reusa as conexões mais recentes e deixa as ociosas expirarem
+        'pool_use_lifo': True,
+    }
+
+
+# ===============================
+# SQLITE
+# ===============================
+def configurar_sqlite(engine, espera_ms):
+    """
+    WAL deixa leituras rodarem durante uma escrita; busy_timeout faz a
+    escrita concorrente esperar a vez em vez de falhar com "database is
+    locked". foreign_keys continua desligado: as exclusões atuais contam com
+    o comportamento de sempre do SQLite.
+    """
+    @event.listens_for(engine, 'connect')
+    def _pragmas(conexao_dbapi, registro):
+        cursor = conexao_dbapi.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(espera_ms)}')
+        cursor.execute('PRAGMA synchronous=NORMAL')  # seguro com WAL
+        cursor.execute('PRAGMA cache_size=-20000')   # ~20 MB por conexão
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.close()
+
+
+# ===============================
+# ESTATÍSTICAS DO POOL
+# ===============================
+class MonitorPool:
+    """Conta uso do pool via eventos do SQLAlchemy (por processo)."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.trava = threading.Lock()
+        self.em_uso = 0
+        self.pico_em_uso = 0
+        self.retiradas = 0
+        self.conexoes_criadas = 0  # desde que o processo subiu (não as abertas agora)
+        self.esgotamentos = 0
+
+        event.listen(engine, 'connect', self._ao_conectar)
+        event.listen(engine, 'checkout', self._ao_retirar)
+        event.listen(engine, 'checkin', self._ao_devolver)
+
+    def _ao_conectar(self, conexao_dbapi, registro):
+        with self.trava:
+            self.conexoes_criadas += 1
+
+    def _ao_retirar(self, conexao_dbapi, registro, proxy):
+        with self.trava:
+            self.retiradas += 1
+            self.em_uso += 1
+            self.pico_em_uso = max(self.pico_em_uso, self.em_uso)
+
+    def _ao_devolver(self, conexao_dbapi, registro):
+        with self.trava:
+            self.em_uso -= 1
+
+    def registrar_esgotamento(self):
+        """Chamado quando uma requisição desistiu de esperar por conexão."""
+        with self.trava:
+            self.esgotamentos += 1
+
+    def estatisticas(self):
+        pool = self.engine.pool
+
+        # QueuePool (PostgreSQL / SQLite em arquivo) tem tamanho e excedente;
+        # outros pools só informam o que o monitor contou
+        tamanho = pool.size() if hasattr(pool, 'size') else None
+        # overflow() fica negativo enquanto o pool ainda não encheu
+        excedente = max(pool.overflow(), 0) if hasattr(pool, 'overflow') else None
+
+        with self.trava:
+            return {
+                'pool': type(pool).__name__,
+                'tamanho': tamanho,
+                'excedentes_abertas': excedente,
+                'ociosas': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+                'em_uso': self.em_uso,
+                'pico_em_uso': self.pico_em_uso,
+                'retiradas': self.retiradas,
+                'conexoes_criadas': self.conexoes_criadas,
+                'esgotamentos': self.esgotamentos,
+            }
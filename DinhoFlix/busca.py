@@ -0,0 +1,249 @@
+import re
+from dataclasses import dataclass
+
+from sqlalchemy import text
+
+from DinhoFlix import app, database
+
+
+# ===============================
+# ÍNDICE DE BUSCA
+# ===============================
+# Um índice invertido com um documento por vídeo/post/depoimento e um por
+# comentário (que aponta para o item comentado):
+#   SQLite     -> tabela virtual FTS5 "busca" (ranking bm25)
+#   PostgreSQL -> tabela "busca" com tsvector + índice GIN (ts_rank)
+# O índice é atualizado junto com a transação de quem cria/apaga o conteúdo;
+# `flask reindexar-busca` reconstrói tudo a partir das tabelas.
+
+# Id do documento: id do conteúdo * 8 + tipo (estável e sem consulta extra)
+CODIGOS = {
+    'video': 1,
+    'post': 2,
+    'depoimento': 3,
+    'comentario': 4,
+}
+
+# Peso de onde o termo apareceu: título > texto > comentário
+PESOS_SQLITE = 'bm25(10.0, 4.0, 1.0, 0.0, 0.0)'
+
+
+def _id_documento(tipo, conteudo_id):
+    return conteudo_id * 8 + CODIGOS[tipo]
+
+
+def _postgres():
+    return database.engine.dialect.name == 'postgresql'
+
+
+# ===============================
+# ESTRUTURA
+# ===============================
+def criar_estrutura(conexao):
+    """Cria o índice (idempotente). Chamado pelas migrações e na criação do banco."""
+    if _postgres():
+        conexao.execute(text('CREATE EXTENSION IF NOT EXISTS unaccent'))
+        conexao.execute(text(
+            'CREATE TABLE IF NOT EXISTS busca ('
+            ' id BIGINT PRIMARY KEY,'
+            ' tipo VARCHAR NOT NULL,'
+            ' conteudo_id INTEGER NOT NULL,'
+            ' documento TSVECTOR NOT NULL)'
+        ))
+        conexao.execute(text(
+            'CREATE INDEX IF NOT EXISTS ix_busca_documento ON busca USING GIN (documento)'
+        ))
+    else:
+        conexao.execute(text(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS busca USING fts5('
+            ' titulo, texto, comentario,'
+            ' tipo UNINDEXED, conteudo_id UNINDEXED,'
+            " tokenize = 'unicode61 remove_diacritics 2')"
+        ))
+
+
+# ===============================
+# ATUALIZAÇÃO
+# ===============================
+def _gravar(executor, documentos):
+    """documentos: dicts com id, tipo, conteudo_id, titulo, texto, comentario."""
+    if not documentos:
+        return
+
+    if _postgres():
+        executor.execute(text(
+            'INSERT INTO busca (id, tipo, conteudo_id, documento) VALUES ('
+            ' :id, :tipo, :conteudo_id,'
+            " setweight(to_tsvector('portuguese', unaccent(:titulo)), 'A') ||"
+            " setweight(to_tsvector('portuguese', unaccent(:texto)), 'B') ||"
+            " setweight(to_tsvector('portuguese', unaccent(:comentario)), 'C'))"
+            ' ON CONFLICT (id) DO UPDATE SET documento = EXCLUDED.documento'
+        ), documentos)
+    else:
+        executor.execute(text(
+            'INSERT OR REPLACE INTO busca (rowid, titulo, texto, comentario, tipo, conteudo_id)'
+            ' VALUES (:id, :titulo, :texto, :comentario, :tipo, :conteudo_id)'
+        ), documentos)
+
+
+def _remover_documentos(executor, ids):
+    if ids:
+        coluna = 'id' if _postgres() else 'rowid'
+        executor.execute(
+            text(f'DELETE FROM busca WHERE {coluna} IN ({", ".join(str(int(i)) for i in ids)})')
+        )
+
+
+def indexar(tipo, conteudo_id, titulo, texto, executor=None):
+    _gravar(executor or database.session, [{
+        'id': _id_documento(tipo, conteudo_id),
+        'tipo': tipo,
+        'conteudo_id': conteudo_id,
+        'titulo': titulo,
+        'texto': texto,
+        'comentario': '',
+    }])
+
+
+def indexar_comentario(comentario, executor=None):
+    tipo = next(t for t in ('video', 'post', 'depoimento') if getattr(comentario, f'{t}_id'))
+    _gravar(executor or database.session, [{
+        'id': _id_documento('comentario', comentario.id),
+        'tipo': tipo,
+        'conteudo_id': getattr(comentario, f'{tipo}_id'),
+        'titulo': '',
+        'texto': '',
+        'comentario': comentario.texto,
+    }])
+
+
+def remover(tipo, conteudo_id, executor=None):
+    """Tira do índice o item e os comentários dele (chamar antes do commit)."""
+    executor = executor or database.session
+    ids_comentarios = executor.execute(
+        text(f'SELECT id FROM comentario WHERE {tipo}_id = :id'), {'id': conteudo_id}
+    ).scalars()
+
+    _remover_documentos(executor, [
+        _id_documento(tipo, conteudo_id),
+        *(_id_documento('comentario', comentario_id) for comentario_id in ids_comentarios),
+    ])
+
+
+def remover_comentario(comentario_id, executor=None):
+    _remover_documentos(executor or database.session, [_id_documento('comentario', comentario_id)])
+
+
+def reindexar(executor=None):
+    """Reconstrói o índice inteiro a partir das tabelas de conteúdo."""
+    executor = executor or database.session
+    executor.execute(text('DELETE FROM busca'))
+
+    consultas = {
+        'video': "SELECT id, titulo, descricao FROM video WHERE status = 'pronto'",
+        'post': 'SELECT id, titulo, corpo FROM post',
+        'depoimento': 'SELECT id, titulo, corpo FROM depoimento',
+    }
+    for tipo, consulta in consultas.items():
+        _gravar(executor, [
+            {
+                'id': _id_documento(tipo, conteudo_id),
+                'tipo': tipo,
+                'conteudo_id': conteudo_id,
+                'titulo': titulo,
+                'texto': texto,
+                'comentario': '',
+            }
+            for conteudo_id, titulo, texto in executor.execute(text(consulta))
+        ])
+
+        # Só comentários de itens visíveis (vídeo pronto, item não apagado)
+        _gravar(executor, [
+            {
+                'id': _id_documento('comentario', comentario_id),
+                'tipo': tipo,
+                'conteudo_id': conteudo_id,
+                'titulo': '',
+                'texto': '',
+                'comentario': texto,
+            }
+            for comentario_id, conteudo_id, texto in executor.execute(text(
+                f'SELECT c.id, c.{tipo}_id, c.texto FROM comentario c'
+                f' JOIN ({consulta}) item ON item.id = c.{tipo}_id'
+            ))
+        ])
+
+
+# ===============================
+# CONSULTA
+# ===============================
+@dataclass
+class PaginaBusca:
+    resultados: list  # [(tipo, id)] do mais relevante para o menos
+    pagina: int
+    tem_proxima: bool
+
+
+def _termos(consulta):
+    # Só palavras: aspas e operadores digitados não viram sintaxe de busca
+    return re.findall(r'\w+', consulta.lower())[:10]
+
+
+def buscar(consulta, pagina=1, tipos=None):
+    """
+    Itens com algum documento (o próprio texto ou um comentário) que tenha
+    todas as palavras, por prefixo ("vid" acha "vídeo"), do mais relevante
+    para o menos. O item vale pelo melhor documento dele.
+    """
+    termos = _termos(consulta)
+    if not termos:
+        return PaginaBusca([], 1, False)
+
+    tamanho = app.config['BUSCA_TAMANHO_PAGINA']
+    parametros = {
+        'limite': tamanho + 1,
+        'deslocamento': (pagina - 1) * tamanho,
+    }
+
+    filtro_tipos = ''
+    if tipos:
+        for posicao, tipo in enumerate(tipos):
+            parametros[f'tipo{posicao}'] = tipo
+        filtro_tipos = f' AND tipo IN ({", ".join(f":tipo{posicao}" for posicao in range(len(tipos)))})'
+
+    if _postgres():
+        parametros['consulta'] = ' & '.join(f'{termo}:*' for termo in termos)
+        sql = (
+            'SELECT tipo, conteudo_id, max(ts_rank(documento, q)) AS relevancia'
+            " FROM busca, to_tsquery('portuguese', unaccent(:consulta)) q"
+            f' WHERE documento @@ q{filtro_tipos}'
+            ' GROUP BY tipo, conteudo_id'
+            ' ORDER BY relevancia DESC, conteudo_id DESC'
+            ' LIMIT :limite OFFSET :deslocamento'
+        )
+    else:
+        parametros['consulta'] = ' '.join(f'"{termo}"*' for termo in termos)
+        sql = (
+            'SELECT tipo, conteudo_id, min(rank) AS relevancia'
+            ' FROM busca'
+            f" WHERE busca MATCH :consulta AND rank MATCH '{PESOS_SQLITE}'{filtro_tipos}"
+            ' GROUP BY tipo, conteudo_id'
+            ' ORDER BY relevancia, conteudo_id DESC'
+            ' LIMIT :limite OFFSET :deslocamento'
+        )
+
+    linhas = database.session.execute(text(sql), parametros).all()
+
+    return PaginaBusca(
+        [(tipo, conteudo_id) for tipo, conteudo_id, _ in linhas[:tamanho]],
+        pagina,
+        len(linhas) > tamanho
+    )
+
+
+@app.cli.command('reindexar-busca')
+def reindexar_busca():
+    """Reconstrói o índice de busca."""
+    reindexar()
+    database.session.commit()
+    print("✅ Índice de busca reconstruído.")
@@ -0,0 +1,215 @@
+import glob
+import hashlib
+import os
+import pickle
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import current_user
+from markupsafe import Markup
+
+from DinhoFlix import app
+
+
+# ===============================
+# BACKENDS
+# ===============================
+# Todos têm a mesma interface: get / get_many / set / delete.
+# Valores ausentes ou expirados voltam como None.
+
+class CacheMemoria:
+    """LRU com validade por entrada, na memória do próprio processo."""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self.entradas = OrderedDict()
+        self.trava = threading.Lock()
+
+    def get(self, chave):
+        with self.trava:
+            entrada = self.entradas.get(chave)
+            if entrada is None:
+                return None
+
+            valor, expira_em = entrada
+            if expira_em is not None and expira_em <= time.monotonic():
+                del self.entradas[chave]
+                return None
+
+            self.entradas.move_to_end(chave)
+            return valor
+
+    def get_many(self, chaves):
+        return [self.get(chave) for chave in chaves]
+
+    def set(self, chave, valor, ttl=None):
+        expira_em = time.monotonic() + ttl if ttl else None
+        with self.trava:
+            self.entradas[chave] = (valor, expira_em)
+            self.entradas.move_to_end(chave)
+            while len(self.entradas) > self.maximo:
+                self.entradas.popitem(last=False)
+
+    def delete(self, *chaves):
+        with self.trava:
+            for chave in chaves:
+                self.entradas.pop(chave, None)
+
+
+class CacheCompartilhado:
+    """
+    Cache dividido entre processos/servidores sobre qualquer cliente com a
+    interface do redis-py (get, mget, set com ex=, delete). Os valores são
+    serializados com pickle.
+    """
+
+    def __init__(self, cliente, prefixo='dinhoflix:'):
+        self.cliente = cliente
+        self.prefixo = prefixo
+
+    def get(self, chave):
+        return self.get_many([chave])[0]
+
+    def get_many(self, chaves):
+        if not chaves:
+            return []
+        dados = self.cliente.mget([self.prefixo + chave for chave in chaves])
+        return [None if valor is None else pickle.loads(valor) for valor in dados]
+
+    def set(self, chave, valor, ttl=None):
+        self.cliente.set(self.prefixo + chave, pickle.dumps(valor), ex=ttl)
+
+    def delete(self, *chaves):
+        if chaves:
+            self.cliente.delete(*(self.prefixo + chave for chave in chaves))
+
+
+class SemCache:
+    """Usado com CACHE_TIPO = None: nada é guardado."""
+
+    def get(self, chave):
+        return None
+
+    def get_many(self, chaves):
+        return [None] * len(chaves)
+
+    def set(self, chave, valor, ttl=None):
+        pass
+
+    def delete(self, *chaves):
+        pass
+
+
+def criar_cache():
+    tipo = app.config['CACHE_TIPO']
+
+    if tipo == 'redis':
+        import redis  # dependência opcional, só para o cache compartilhado
+        return CacheCompartilhado(redis.Redis.from_url(app.config['CACHE_REDIS_URL']))
+
+    if tipo == 'memoria':
+        return CacheMemoria(app.config['CACHE_MAXIMO'])
+
+    return SemCache()
+
+
+# Trocável em tempo de execução (ex.: CacheCompartilhado(fakeredis.FakeRedis()))
+cache = criar_cache()
+
+
+def lembrar(chave, funcao, ttl=None):
+    """Devolve o valor em cache ou calcula com funcao() e guarda."""
+    valor = cache.get(chave)
+    if valor is None:
+        valor = funcao()
+        cache.set(chave, valor, ttl)
+    return valor
+
+
+# ===============================
+# GERAÇÕES (INVALIDAÇÃO DO FEED)
+# ===============================
+# Cada tipo de conteúdo tem uma "geração" aleatória que entra na chave das
+# páginas do feed. Invalidar é só apagar a geração: a próxima leitura sorteia
+# outra e as páginas antigas deixam de ser encontradas (e expiram sozinhas).
+# Se a geração sumir do cache por falta de espaço, o efeito é o mesmo.
+#
+# Likes e comentários só mexem nos contadores e na pontuação "em alta", então
+# trocam só a geração da pontuação, que entra apenas nas páginas ordenadas
+# por ela. As páginas de recentes seguem em cache com contadores até
+# CACHE_FEED_TTL segundos atrasados (abas abertas recebem os totais por
+# tempo real).
+
+def geracoes(tipos, pontuacao=False):
+    """Gerações dos tipos; com pontuacao=True, também as da pontuação."""
+    chaves = [f'geracao:{tipo}' for tipo in tipos]
+    if pontuacao:
+        chaves += [f'geracao:{tipo}:pontuacao' for tipo in tipos]
+    valores = cache.get_many(chaves)
+
+    for posicao, valor in enumerate(valores):
+        if valor is None:
+            valores[posicao] = secrets.token_hex(4)
+            cache.set(chaves[posicao], valores[posicao])
+
+    return valores
+
+
+def invalidar_feed(*tipos):
+    """Chamado depois do commit de qualquer alteração que aparece no feed."""
+    cache.delete(*(f'geracao:{tipo}' for tipo in tipos))
+
+
+def invalidar_pontuacao(*tipos):
+    """Chamado depois do commit de likes e comentários (só contadores mudaram)."""
+    cache.delete(*(f'geracao:{tipo}:pontuacao' for tipo in tipos))
+
+
+def invalidar_usuario(usuario_id):
+    """Chamado depois do commit de qualquer alteração no usuário (ver models.load_usuario)."""
+    cache.delete(f'usuario:{usuario_id}')
+
+
+# ===============================
+# FRAGMENTOS DE TEMPLATE
+# ===============================
+# A chave de um card é o hash do próprio ItemFeed: se likes, comentários ou o
+# autor mudam, a chave muda junto e o card antigo nunca é servido.
+# Os templates dos cards entram no hash para um deploy não reaproveitar HTML
+# antigo guardado no cache compartilhado.
+
+def _versao_templates():
+    resumo = hashlib.sha1()
+    for caminho in sorted(glob.glob(os.path.join(app.root_path, 'templates/components/*.html'))):
+        with open(caminho, 'rb') as arquivo:
+            resumo.update(arquivo.read())
+    return resumo.hexdigest()[:8]
+
+
+VERSAO_TEMPLATES = _versao_templates()
+
+
+def _visitante(curtido):
+    """
+    O card só muda conforme quem vê em dois pontos: logado ou não
+    (formulário de comentário) e se o visitante curtiu o item.
+    """
+    if not current_user.is_authenticated:
+        return 'anonimo'
+    return 'curtido' if curtido else 'logado'
+
+
+def chave_card(item, curtido=False):
+    conteudo = hashlib.sha1(pickle.dumps(item)).hexdigest()
+    return f'card:{VERSAO_TEMPLATES}:{item.tipo}:{item.id}:{conteudo}:{_visitante(curtido)}'
+
+
+def fragmento_cache(chave, caller):
+    """Uso nos templates: {% call fragmento_cache(chave) %}...{% endcall %}"""
+    html = cache.get(chave)
+    if html is None:
+        html = str(caller())
+        cache.set(chave, html, app.config['CACHE_FRAGMENTO_TTL'])
+    return Markup(html)
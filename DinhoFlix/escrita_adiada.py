@@ -0,0 +1,537 @@
+import atexit
+import fcntl
+import glob
+import json
+import os
+import secrets
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+from flask import render_template
+from flask_login import current_user
+from sqlalchemy import delete, select, tuple_
+from sqlalchemy.orm import joinedload
+
+from DinhoFlix import app, busca, database, interacoes, tempo_real
+from DinhoFlix.cache import invalidar_pontuacao
+from DinhoFlix.models import Comentario, Like, MODELOS
+
+
+# ===============================
+# ESCRITA ADIADA
+# ===============================
+# Com ESCRITA_ADIADA ligada, curtir e comentar não fazem commit na
+# requisição: o evento entra numa fila do processo e uma thread grava tudo
+# a cada ESCRITA_ADIADA_INTERVALO segundos (ou quando a fila chega a
+# ESCRITA_ADIADA_LOTE), numa transação só, com um INSERT/DELETE de várias
+# linhas por tipo e um UPDATE de contador por item, não por clique.
+#
+# A resposta já sai com o total otimista (banco + fila deste processo) e,
+# depois do commit, a thread publica os totais reais em tempo_real.
+#
+# Likes entram como estado pedido (curtido ou não), não como alternância,
+# e comentários levam uma chave única gerada na requisição: gravar o mesmo
+# evento duas vezes não muda nada. Com ESCRITA_ADIADA = 'arquivo' cada
+# evento também vai para um log em ESCRITA_ADIADA_PASTA (write + flush, sem
+# fsync: sobrevive à queda do processo, não à do servidor), apagado depois
+# do commit. Cada processo segura o próprio log com flock; logs que ninguém
+# segura são de processos que caíram e são reaplicados por quem sobe.
+
+@dataclass
+class LikePendente:
+    curtir: bool
+    no_banco: bool  # estado gravado quando o evento entrou na fila
+
+
+@dataclass
+class ComentarioPendente:
+    chave: str
+    usuario_id: int
+    tipo: str
+    conteudo_id: int
+    texto: str
+    data_criacao: datetime
+    autor: object = None  # só para o template (o current_user de quem comentou)
+    id: int = None        # preenchido quando é gravado
+
+
+# ===============================
+# GRAVAÇÃO DO LOTE
+# ===============================
+def _itens_existentes(pares):
+    """Itens da fila que ainda existem (os apagados nesse meio tempo são descartados)."""
+    ids_por_tipo = {}
+    for tipo, conteudo_id in pares:
+        ids_por_tipo.setdefault(tipo, set()).add(conteudo_id)
+
+    existentes = set()
+    for tipo, ids in ids_por_tipo.items():
+        modelo = MODELOS[tipo]
+        for conteudo_id in database.session.execute(select(modelo.id).where(modelo.id.in_(ids))).scalars():
+            existentes.add((tipo, conteudo_id))
+    return existentes
+
+
+def aplicar_lote(likes, comentarios):
+    """
+    Grava numa transação os likes ({(usuario_id, tipo, id): LikePendente})
+    e os comentários ({chave: ComentarioPendente}). Os contadores mudam pelo
+    que o banco devolveu como inserido/removido, então reaplicar o lote não
+    conta nada duas vezes. Devolve (delta de likes por item, comentários
+    gravados).
+    """
+    existentes = _itens_existentes(
+        {(tipo, conteudo_id) for _, tipo, conteudo_id in likes}
+        | {(comentario.tipo, comentario.conteudo_id) for comentario in comentarios.values()}
+    )
+
+    deltas_likes = Counter()
+    for tipo in MODELOS:
+        coluna = getattr(Like, f'{tipo}_id')
+        pedidos = {True: [], False: []}
+        for (usuario_id, tipo_like, conteudo_id), pendente in likes.items():
+            if tipo_like == tipo and (tipo, conteudo_id) in existentes:
+                pedidos[pendente.curtir].append((usuario_id, conteudo_id))
+
+        if pedidos[True]:
+            inseridos = database.session.execute(
+                interacoes.insert_ignorando_conflito(Like)
+                .values([{'usuario_id': usuario_id, f'{tipo}_id': conteudo_id} for usuario_id, conteudo_id in pedidos[True]])
+                .returning(coluna)
+            ).scalars()
+            for conteudo_id in inseridos:
+                deltas_likes[(tipo, conteudo_id)] += 1
+
+        if pedidos[False]:
+            removidos = database.session.execute(
+                delete(Like)
+                .where(tuple_(Like.usuario_id, coluna).in_(pedidos[False]))
+                .returning(coluna)
+            ).scalars()
+            for conteudo_id in removidos:
+                deltas_likes[(tipo, conteudo_id)] -= 1
+
+    gravados = []
+    novos = [c for c in comentarios.values() if (c.tipo, c.conteudo_id) in existentes]
+    if novos:
+        ids = dict(database.session.execute(
+            interacoes.insert_ignorando_conflito(Comentario)
+            .values([
+                {
+                    'chave': c.chave,
+                    'texto': c.texto,
+                    'usuario_id': c.usuario_id,
+                    'data_criacao': c.data_criacao,
+                    **{f'{tipo}_id': c.conteudo_id if tipo == c.tipo else None for tipo in MODELOS},
+                }
+                for c in novos
+            ])
+            .returning(Comentario.chave, Comentario.id)
+        ).all())
+
+        for comentario in novos:
+            if comentario.chave in ids:
+                comentario.id = ids[comentario.chave]
+                busca.indexar_comentario(Comentario(
+                    id=comentario.id,
+                    texto=comentario.texto,
+                    **{f'{comentario.tipo}_id': comentario.conteudo_id}
+                ))
+                gravados.append(comentario)
+
+    deltas_comentarios = Counter((c.tipo, c.conteudo_id) for c in gravados)
+
+    for (tipo, conteudo_id), delta in deltas_likes.items():
+        if delta:
+            interacoes.somar_contador(tipo, conteudo_id, 'total_likes', delta)
+            interacoes.somar_likes_recebidos(tipo, conteudo_id, delta)
+    for (tipo, conteudo_id), delta in deltas_comentarios.items():
+        interacoes.somar_contador(tipo, conteudo_id, 'total_comentarios', delta)
+
+    alterados = {item for item, delta in deltas_likes.items() if delta} | set(deltas_comentarios)
+    for tipo, conteudo_id in alterados:
+        interacoes.atualizar_pontuacao(tipo, conteudo_id)
+
+    database.session.commit()
+
+    if alterados:
+        invalidar_pontuacao(*{tipo for tipo, _ in alterados})
+
+    return {item: delta for item, delta in deltas_likes.items() if delta}, gravados
+
+
+def _publicar(deltas_likes, gravados):
+    """Totais reais (e os comentários, já com id) para quem está vendo os itens."""
+    for tipo, conteudo_id in deltas_likes:
+        tempo_real.publicar(
+            tipo, conteudo_id, 'likes',
+            total_likes=interacoes.ler_contador(tipo, conteudo_id, 'total_likes')
+        )
+
+    if not gravados:
+        return
+
+    carregados = {
+        comentario.id: comentario
+        for comentario in Comentario.query
+        .options(joinedload(Comentario.autor))
+        .filter(Comentario.id.in_([c.id for c in gravados]))
+    }
+    for pendente in gravados:
+        comentario = carregados.get(pendente.id)
+        if comentario is None:
+            continue
+        tempo_real.publicar(
+            pendente.tipo, pendente.conteudo_id, 'comentario',
+            comentario_id=comentario.id,
+            chave=pendente.chave,
+            html=render_template('components/comentarios.html', comentarios=[comentario], sem_acoes=True),
+            total_comentarios=interacoes.ler_contador(pendente.tipo, pendente.conteudo_id, 'total_comentarios')
+        )
+
+
+# ===============================
+# LOG LOCAL
+# ===============================
+def _evento_like(usuario_id, tipo, conteudo_id, curtir):
+    return {'evento': 'like', 'usuario_id': usuario_id, 'tipo': tipo, 'id': conteudo_id, 'curtir': curtir}
+
+
+def _evento_comentario(comentario):
+    return {
+        'evento': 'comentario',
+        'chave': comentario.chave,
+        'usuario_id': comentario.usuario_id,
+        'tipo': comentario.tipo,
+        'id': comentario.conteudo_id,
+        'texto': comentario.texto,
+        'data_criacao': comentario.data_criacao.isoformat(),
+    }
+
+
+def ler_log(arquivo):
+    """Eventos de um log na ordem em que entraram; a última linha pode estar cortada."""
+    likes, comentarios = {}, {}
+
+    for linha in arquivo:
+        try:
+            evento = json.loads(linha)
+        except ValueError:
+            continue
+
+        if evento.get('tipo') not in MODELOS:
+            continue
+
+        if evento.get('evento') == 'like':
+            chave = (evento['usuario_id'], evento['tipo'], evento['id'])
+            likes[chave] = LikePendente(evento['curtir'], not evento['curtir'])
+        elif evento.get('evento') == 'comentario':
+            comentarios[evento['chave']] = ComentarioPendente(
+                chave=evento['chave'],
+                usuario_id=evento['usuario_id'],
+                tipo=evento['tipo'],
+                conteudo_id=evento['id'],
+                texto=evento['texto'],
+                data_criacao=datetime.fromisoformat(evento['data_criacao']),
+            )
+
+    return likes, comentarios
+
+
+# ===============================
+# FILA
+# ===============================
+class FilaEscrita:
+    """
+    Likes e comentários esperando a próxima gravação. Um like por
+    (usuário, item): cliques seguidos só trocam o estado pedido.
+    """
+
+    def __init__(self, pasta, intervalo, lote):
+        self.pasta = pasta  # None: só memória
+        self.intervalo = intervalo
+        self.lote = lote
+
+        self.trava = threading.Lock()
+        self.likes = {}
+        self.comentarios = {}
+        self.log = None      # (arquivo, caminho) do segmento recebendo eventos
+        self.selados = []    # segmentos cobertos pelo lote em gravação
+
+        self.trava_gravacao = threading.Lock()
+        self.acordar = threading.Event()
+        self.gravador = None
+
+    # ---------- log ----------
+    def _anotar(self, evento):
+        """Chamado com self.trava."""
+        if self.pasta is None:
+            return
+
+        if self.log is None:
+            os.makedirs(self.pasta, exist_ok=True)
+            caminho = os.path.join(self.pasta, f'{os.getpid()}-{secrets.token_hex(4)}')
+            arquivo = open(caminho + '.tmp', 'a', encoding='utf-8')
+            # Travado antes de ganhar o nome .log, que é o que retomar() procura
+            fcntl.flock(arquivo, fcntl.LOCK_EX)
+            os.rename(caminho + '.tmp', caminho + '.log')
+            self.log = (arquivo, caminho + '.log')
+
+        arquivo = self.log[0]
+        arquivo.write(json.dumps(evento) + '\n')
+        arquivo.flush()
+
+    # ---------- eventos ----------
+    def _iniciar_gravador(self):
+        with self.trava:
+            if self.gravador is not None:
+                return
+            self.gravador = threading.Thread(target=self._executar, name='escrita-adiada', daemon=True)
+            self.gravador.start()
+
+    def registrar_like(self, usuario_id, tipo, conteudo_id, curtir, no_banco):
+        """Estado pedido (None alterna); devolve o estado que fica valendo."""
+        chave = (usuario_id, tipo, conteudo_id)
+
+        with self.trava:
+            pendente = self.likes.get(chave)
+            atual = pendente.curtir if pendente else no_banco
+            novo = (not atual) if curtir is None else curtir
+
+            if novo != atual:
+                self._anotar(_evento_like(usuario_id, tipo, conteudo_id, novo))
+                self.likes[chave] = LikePendente(novo, pendente.no_banco if pendente else no_banco)
+            tamanho = len(self.likes) + len(self.comentarios)
+
+        self._depois_de_registrar(tamanho)
+        return novo
+
+    def registrar_comentario(self, comentario):
+        with self.trava:
+            self._anotar(_evento_comentario(comentario))
+            self.comentarios[comentario.chave] = comentario
+            tamanho = len(self.likes) + len(self.comentarios)
+
+        self._depois_de_registrar(tamanho)
+
+    def _depois_de_registrar(self, tamanho):
+        self._iniciar_gravador()
+        if tamanho >= self.lote:
+            self.acordar.set()
+
+    # ---------- leitura (respostas otimistas) ----------
+    def pendentes_do_item(self, tipo, conteudo_id):
+        """(likes, comentários) que a fila ainda vai somar ao item."""
+        with self.trava:
+            likes = sum(
+                1 if pendente.curtir else -1
+                for (_, tipo_like, id_like), pendente in self.likes.items()
+                if (tipo_like, id_like) == (tipo, conteudo_id) and pendente.curtir != pendente.no_banco
+            )
+            comentarios = sum(
+                1 for comentario in self.comentarios.values()
+                if (comentario.tipo, comentario.conteudo_id) == (tipo, conteudo_id)
+            )
+        return likes, comentarios
+
+    def estado_pedido(self, usuario_id, tipo, conteudo_id):
+        """True/False se há like na fila para o item, senão None."""
+        with self.trava:
+            pendente = self.likes.get((usuario_id, tipo, conteudo_id))
+        return None if pendente is None else pendente.curtir
+
+    # ---------- gravação ----------
+    def gravar(self):
+        """Grava o que está na fila num lote só; devolve quantos eventos foram."""
+        with self.trava_gravacao:
+            with self.trava:
+                # Clicou e desfez antes da gravação: nada a escrever
+                for chave in [c for c, p in self.likes.items() if p.curtir == p.no_banco]:
+                    del self.likes[chave]
+
+                likes = dict(self.likes)
+                comentarios = dict(self.comentarios)
+                if self.log is not None:
+                    self.selados.append(self.log)
+                    self.log = None
+                selados = list(self.selados)
+
+            if not likes and not comentarios and not selados:
+                return 0
+
+            try:
+                deltas_likes, gravados = aplicar_lote(likes, comentarios)
+            except Exception:
+                # Fica tudo na fila (e nos logs) para a próxima rodada
+                database.session.rollback()
+                app.logger.exception('Falha ao gravar a escrita adiada (%d likes, %d comentários)', len(likes), len(comentarios))
+                return 0
+
+            with self.trava:
+                for chave, pendente in likes.items():
+                    atual = self.likes.get(chave)
+                    if atual is pendente:
+                        del self.likes[chave]
+                    elif atual is not None:
+                        # Mudou durante a gravação: o banco agora tem o estado do lote
+                        self.likes[chave] = LikePendente(atual.curtir, pendente.curtir)
+                for chave in comentarios:
+                    self.comentarios.pop(chave, None)
+                self.selados = [log for log in self.selados if log not in selados]
+
+            for arquivo, caminho in selados:
+                os.unlink(caminho)
+                arquivo.close()
+
+            try:
+                _publicar(deltas_likes, gravados)
+            except Exception:
+                app.logger.exception('Falha ao publicar a escrita adiada')
+
+            return len(likes) + len(comentarios)
+
+    def _executar(self):
+        while True:
+            self.acordar.wait(self.intervalo)
+            self.acordar.clear()
+            try:
+                with app.app_context():
+                    self.gravar()
+            except Exception:
+                app.logger.exception('Gravador da escrita adiada falhou')
+
+    def retomar(self):
+        """Reaplica os logs de processos que caíram antes de gravar."""
+        if self.pasta is None:
+            return 0
+
+        total = 0
+        for caminho in sorted(glob.glob(os.path.join(self.pasta, '*.log'))):
+            try:
+                arquivo = open(caminho, 'r', encoding='utf-8')
+            except FileNotFoundError:
+                continue  # outro processo acabou de reaplicar
+
+            with arquivo:
+                try:
+                    fcntl.flock(arquivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # de um processo vivo
+                if not os.path.exists(caminho):
+                    continue
+
+                likes, comentarios = ler_log(arquivo)
+                try:
+                    aplicar_lote(likes, comentarios)
+                except Exception:
+                    database.session.rollback()
+                    app.logger.exception('Falha ao reaplicar %s; fica para a próxima vez', caminho)
+                    continue
+
+                os.unlink(caminho)
+                total += len(likes) + len(comentarios)
+
+        return total
+
+
+def criar_fila():
+    modo = app.config['ESCRITA_ADIADA']
+    if modo is None:
+        return None
+
+    return FilaEscrita(
+        app.config['ESCRITA_ADIADA_PASTA'] if modo == 'arquivo' else None,
+        app.config['ESCRITA_ADIADA_INTERVALO'],
+        app.config['ESCRITA_ADIADA_LOTE']
+    )
+
+
+fila = criar_fila()
+
+
+def ativa():
+    return fila is not None
+
+
+# ===============================
+# USO NAS ROTAS
+# ===============================
+def curtir(usuario_id, tipo, conteudo_id, curtir=None):
+    """Como interacoes.alternar_like, mas só enfileira: (curtido, total otimista) ou None."""
+    total = interacoes.ler_contador(tipo, conteudo_id, 'total_likes')
+    if total is None:
+        return None
+
+    no_banco = (tipo, conteudo_id) in interacoes.ids_curtidos(usuario_id, [(tipo, conteudo_id)])
+    curtido = fila.registrar_like(usuario_id, tipo, conteudo_id, curtir, no_banco)
+
+    likes, _ = fila.pendentes_do_item(tipo, conteudo_id)
+    return curtido, max(total + likes, 0)
+
+
+def comentar(autor, tipo, conteudo_id, texto):
+    """Enfileira o comentário; (ComentarioPendente, total otimista) ou None se o item não existe."""
+    total = interacoes.ler_contador(tipo, conteudo_id, 'total_comentarios')
+    if total is None:
+        return None
+
+    comentario = ComentarioPendente(
+        chave=secrets.token_hex(16),
+        usuario_id=autor.id,
+        tipo=tipo,
+        conteudo_id=conteudo_id,
+        texto=texto,
+        data_criacao=datetime.now(timezone.utc),
+        autor=autor,
+    )
+    fila.registrar_comentario(comentario)
+
+    _, comentarios = fila.pendentes_do_item(tipo, conteudo_id)
+    return comentario, total + comentarios
+
+
+def curtidos_usuario(pares):
+    """interacoes.curtidos_usuario contando os likes do visitante ainda na fila."""
+    pares = list(pares)
+    curtidos = interacoes.curtidos_usuario(pares)
+    if fila is None or not current_user.is_authenticated:
+        return curtidos
+
+    curtidos = set(curtidos)
+    for tipo, conteudo_id in pares:
+        estado = fila.estado_pedido(current_user.id, tipo, conteudo_id)
+        if estado is True:
+            curtidos.add((tipo, conteudo_id))
+        elif estado is False:
+            curtidos.discard((tipo, conteudo_id))
+    return curtidos
+
+
+def retomar():
+    """Chamado ao subir o processo (ver __init__.py)."""
+    if fila is None:
+        return
+
+    with app.app_context():
+        reaplicados = fila.retomar()
+    if reaplicados:
+        print(f"✅ Escrita adiada: {reaplicados} evento(s) de logs antigos gravados")
+
+
+@atexit.register
+def _gravar_ao_sair():
+    if fila is None:
+        return
+    with app.app_context():
+        fila.gravar()
+
+
+@app.cli.command('gravar-escrita-adiada')
+def gravar_escrita_adiada():
+    """Reaplica os logs de escrita adiada deixados por processos parados."""
+    if fila is None:
+        print("ℹ️ ESCRITA_ADIADA está desligada.")
+        return
+    print(f"✅ {fila.retomar()} evento(s) gravados.")
@@ -0,0 +1,320 @@
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import datetime
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import joinedload
+
+from DinhoFlix import app, cache
+from DinhoFlix.models import MODELOS, Video
+from DinhoFlix.processamento import PRONTO
+
+
+# ===============================
+# TIPOS DE CONTEÚDO
+# ===============================
+TIPOS_EXPLORAR = {
+    'videos': 'video',
+    'posts': 'post',
+    'relatos': 'depoimento',
+}
+
+# Ordens do feed: mais novos primeiro ou maior pontuação "em alta"
+# (models.pontuacao_em_alta) primeiro
+RECENTES = 'recentes'
+EM_ALTA = 'em_alta'
+ORDENS = (RECENTES, EM_ALTA)
+
+
+# ===============================
+# ITENS DO FEED
+# ===============================
+# Cópias simples (sem sessão) do que os cards precisam renderizar.
+# Assim o template nunca dispara carregamentos preguiçosos.
+@dataclass
+class AutorResumo:
+    id: int
+    username: str
+    foto_perfil: str
+
+
+@dataclass
+class ItemFeed:
+    tipo: str
+    id: int
+    titulo: str
+    texto: str
+    data_criacao: datetime
+    autor: AutorResumo
+    thumbnail: str = None
+    duracao: float = None
+    total_likes: int = 0
+    total_comentarios: int = 0
+
+    @property
+    def chave(self):
+        return (self.tipo, self.id)
+
+
+@dataclass
+class PaginaFeed:
+    itens: list
+    cursor: str = None
+
+    @property
+    def blocos(self):
+        """Mesma interface de FeedEmPartes: os itens num bloco só."""
+        return [self.itens] if self.itens else []
+
+
+# ===============================
+# CURSOR
+# ===============================
+def codificar_cursor(posicoes):
+    dados = json.dumps(posicoes, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(dados).decode().rstrip('=')
+
+
+def _posicao_valida(valor, ordem):
+    if ordem == EM_ALTA:
+        return (
+            isinstance(valor, list) and len(valor) == 2
+            and isinstance(valor[0], (int, float)) and isinstance(valor[1], int)
+        )
+    return isinstance(valor, int)
+
+
+def decodificar_cursor(cursor, ordem=RECENTES):
+    """
+    Devolve {tipo: posição do último item visto}: o id, ou [pontuação, id]
+    em EM_ALTA. Cursores inválidos viram página inicial.
+    """
+    if not cursor:
+        return {}
+
+    try:
+        preenchimento = '=' * (-len(cursor) % 4)
+        posicoes = json.loads(base64.urlsafe_b64decode(cursor + preenchimento))
+    except (binascii.Error, ValueError):
+        return {}
+
+    if not isinstance(posicoes, dict):
+        return {}
+
+    return {
+        tipo: posicao
+        for tipo, posicao in posicoes.items()
+        if tipo in MODELOS and _posicao_valida(posicao, ordem)
+    }
+
+
+# ===============================
+# CONSULTAS
+# ===============================
+def _resumo_autor(usuario):
+    return AutorResumo(usuario.id, usuario.username, usuario.foto_perfil)
+
+
+def _consulta_visiveis(tipo):
+    modelo = MODELOS[tipo]
+    consulta = modelo.query.options(joinedload(modelo.autor))
+
+    # Vídeos ainda em processamento não entram no feed
+    if tipo == 'video':
+        consulta = consulta.filter(modelo.status == PRONTO)
+
+    return consulta
+
+
+def _buscar_objetos(tipo, antes_de, limite, ordem):
+    modelo = MODELOS[tipo]
+    consulta = _consulta_visiveis(tipo)
+
+    if ordem == EM_ALTA:
+        # Keyset em (pontuacao, id): índice ix_<tipo>_pontuacao_id
+        if antes_de is not None:
+            consulta = consulta.filter(tuple_(modelo.pontuacao, modelo.id) < tuple_(*antes_de))
+        consulta = consulta.order_by(modelo.pontuacao.desc(), modelo.id.desc())
+    else:
+        if antes_de is not None:
+            consulta = consulta.filter(modelo.id < antes_de)
+        consulta = consulta.order_by(modelo.id.desc())
+
+    return consulta.limit(limite).all()
+
+
+def _montar_itens(tipo, objetos):
+    itens = []
+    for objeto in objetos:
+        itens.append(ItemFeed(
+            tipo=tipo,
+            id=objeto.id,
+            titulo=objeto.titulo,
+            texto=objeto.descricao if tipo == 'video' else objeto.corpo,
+            data_criacao=objeto.data_criacao,
+            autor=_resumo_autor(objeto.autor),
+            thumbnail=getattr(objeto, 'thumbnail', None),
+            duracao=getattr(objeto, 'duracao', None),
+            total_likes=objeto.total_likes,
+            total_comentarios=objeto.total_comentarios,
+        ))
+    return itens
+
+
+def _chave_ordem(objeto, ordem):
+    if ordem == EM_ALTA:
+        return (objeto.pontuacao, objeto.id)
+    return (objeto.data_criacao or datetime.min, objeto.id)
+
+
+def _posicao(objeto, ordem):
+    if ordem == EM_ALTA:
+        return [objeto.pontuacao, objeto.id]
+    return objeto.id
+
+
+# ===============================
+# PÁGINA DO FEED
+# ===============================
+def carregar_feed(tipos, cursor=None, limite=None, ordem=RECENTES):
+    """
+    Página do feed vinda do cache quando nenhum dos tipos mudou desde que
+    foi montada (ver cache.geracoes / cache.invalidar_feed). Em EM_ALTA,
+    likes e comentários também renovam a página (cache.invalidar_pontuacao).
+    """
+    limite = limite or app.config['FEED_TAMANHO_PAGINA']
+    tipos = sorted(tipos)
+
+    chave = 'feed:{}:{}:{}:{}:{}'.format(
+        ordem,
+        ','.join(tipos),
+        ','.join(cache.geracoes(tipos, pontuacao=ordem == EM_ALTA)),
+        limite,
+        cursor or ''
+    )
+    return cache.lembrar(
+        chave,
+        lambda: consultar_feed(tipos, cursor, limite, ordem),
+        app.config['CACHE_FEED_TTL']
+    )
+
+
+class FeedEmPartes:
+    """
+    Página do feed buscada em dois blocos para renderizacao.renderizar_em_partes:
+    um pequeno (primeiro_bloco itens), que vira HTML enquanto o resto é
+    consultado, e o restante. É o mesmo que carregar_feed com o limite
+    inteiro, só que cursor só existe depois de percorrer blocos.
+    """
+
+    def __init__(self, tipos, cursor=None, limite=None, ordem=RECENTES, primeiro_bloco=None):
+        self.tipos = tipos
+        self.cursor_inicial = cursor
+        self.limite = limite or app.config['FEED_TAMANHO_PAGINA']
+        self.ordem = ordem
+        self.primeiro_bloco = min(primeiro_bloco or self.limite, self.limite)
+        self.cursor = None
+
+    @property
+    def blocos(self):
+        cursor = self.cursor_inicial
+
+        for tamanho in (self.primeiro_bloco, self.limite - self.primeiro_bloco):
+            if not tamanho:
+                continue
+
+            pagina = carregar_feed(self.tipos, cursor, tamanho, self.ordem)
+            cursor = self.cursor = pagina.cursor
+            if pagina.itens:
+                yield pagina.itens
+            if not cursor:
+                break
+
+
+def consultar_feed(tipos, cursor=None, limite=None, ordem=RECENTES):
+    """
+    Carrega uma página do feed misturando os tipos pedidos, do mais novo
+    para o mais antigo (ou da maior pontuação para a menor, em EM_ALTA).
+
+    Cada tipo é paginado por keyset no id (`id < último visto`), ou em
+    (pontuacao, id) no "em alta", então o custo não depende de quantas
+    páginas já foram lidas. É uma consulta por tipo: itens + autores, com
+    os contadores desnormalizados. Os comentários só são buscados quando a
+    caixa é aberta (/comentarios).
+    """
+    limite = limite or app.config['FEED_TAMANHO_PAGINA']
+    posicoes = decodificar_cursor(cursor, ordem)
+
+    # Busca um a mais por tipo para saber se ainda existe próxima página
+    candidatos = []
+    for tipo in tipos:
+        for objeto in _buscar_objetos(tipo, posicoes.get(tipo), limite + 1, ordem):
+            candidatos.append((tipo, objeto))
+
+    candidatos.sort(key=lambda par: _chave_ordem(par[1], ordem), reverse=True)
+    pagina = candidatos[:limite]
+
+    por_tipo = {tipo: [] for tipo in tipos}
+    for tipo, objeto in pagina:
+        por_tipo[tipo].append(objeto)
+        posicoes[tipo] = _posicao(objeto, ordem)
+
+    montados = {}
+    for tipo, objetos in por_tipo.items():
+        for item in _montar_itens(tipo, objetos):
+            montados[(tipo, item.id)] = item
+
+    itens = [montados[(tipo, objeto.id)] for tipo, objeto in pagina]
+
+    proximo = None
+    if len(candidatos) > len(pagina):
+        proximo = codificar_cursor({tipo: posicoes[tipo] for tipo in tipos if tipo in posicoes})
+
+    return PaginaFeed(itens, proximo)
+
+
+def carregar_itens(pares):
+    """
+    ItemFeed dos (tipo, id) pedidos, na mesma ordem, com as mesmas consultas
+    fixas por tipo do feed. Itens que não existem (ou não estão visíveis)
+    são omitidos.
+    """
+    ids_por_tipo = {}
+    for tipo, conteudo_id in pares:
+        ids_por_tipo.setdefault(tipo, []).append(conteudo_id)
+
+    montados = {}
+    for tipo, ids in ids_por_tipo.items():
+        objetos = _consulta_visiveis(tipo).filter(MODELOS[tipo].id.in_(ids)).all()
+        for item in _montar_itens(tipo, objetos):
+            montados[(tipo, item.id)] = item
+
+    return [montados[par] for par in pares if par in montados]
+
+
+# ===============================
+# VÍDEOS DE UM AUTOR (PERFIL)
+# ===============================
+def videos_do_autor(usuario_id, antes_de=None, limite=None, somente_prontos=True):
+    """
+    Página dos vídeos do autor, do mais novo para o mais antigo. Keyset pelo
+    id (índice (usuario_id, id)); devolve (videos, cursor da próxima página
+    ou None). O dono vê também os pendentes e com erro.
+    """
+    limite = limite or app.config['PERFIL_TAMANHO_PAGINA']
+    consulta = Video.query.filter(Video.usuario_id == usuario_id)
+
+    if somente_prontos:
+        consulta = consulta.filter(Video.status == PRONTO)
+    if antes_de is not None:
+        consulta = consulta.filter(Video.id < antes_de)
+
+    videos = consulta.order_by(Video.id.desc()).limit(limite + 1).all()
+
+    if len(videos) > limite:
+        videos = videos[:limite]
+        return videos, videos[-1].id
+
+    return videos, None
@@ -1,10 +1,36 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
-from wtforms import StringField, PasswordField, SubmitField, BooleanField, TextAreaField
-from wtforms.validators import DataRequired, length, Email, EqualTo, ValidationError
+from wtforms import StringField, PasswordField, SubmitField, BooleanField, TextAreaField, IntegerField
+from wtforms.validators import DataRequired, length, Email, EqualTo
+from sqlalchemy import or_, select
+from DinhoFlix import database
 from DinhoFlix.models import Usuario
 from flask_login import current_user
 
+
+def marcar_conflitos(form, exceto_id=None):
+    """
+    E-mail e nome de usuário já usados por outra conta, numa consulta só.
+    É só para a mensagem: quem garante são as constraints UNIQUE (o commit
+    ainda pode dar IntegrityError se duas contas forem criadas juntas).
+    """
+    consulta = select(Usuario.email, Usuario.username).where(
+        or_(Usuario.email == form.email.data, Usuario.username == form.username.data)
+    )
+    if exceto_id is not None:
+        consulta = consulta.where(Usuario.id != exceto_id)
+
+    valido = True
+    for email, username in database.session.execute(consulta.limit(2)):
+        if email == form.email.data:
+            form.email.errors.append('Já existe uma conta com este E-mail.')
+            valido = False
+        if username == form.username.data:
+            form.username.errors.append('Este nome de usuário já está em uso.')
+            valido = False
+    return valido
+
+
 class FormCriarConta(FlaskForm):
     username = StringField('Nome de Usuário', validators=[DataRequired()])
     email = StringField('E-mail', validators=[DataRequired(), Email()])
@@ -12,13 +38,8 @@ class FormCriarConta(FlaskForm):
     confirmacao_senha = PasswordField('Confirmação da Senha', validators=[DataRequired(), EqualTo('senha')])
     botao_submit_criarconta = SubmitField('Criar Conta')
 
-    def validate_email(self, email):
-        if Usuario.query.filter_by(email=email.data).first():
-            raise ValidationError('E-mail já cadastrado! Faça login para continuar.')
-
-    def validate_username(self, username):
-        if Usuario.query.filter_by(username=username.data).first():
-            raise ValidationError('Este nome de usuário já está em uso.')
+    def validate(self, extra_validators=None):
+        return super().validate(extra_validators) and marcar_conflitos(self)
 
 class FormLogin(FlaskForm):
     email = StringField('E-mail', validators=[DataRequired(), Email()])
@@ -32,15 +53,8 @@ class FormEditarPerfil(FlaskForm):
     foto_perfil = FileField('Atualizar Foto de Perfil', validators=[FileAllowed(['jpg', 'png', 'jpeg', 'webp'])])
     botao_submit_editarperfil = SubmitField('Confirmar Edição')
 
-    def validate_email(self, email):
-        if current_user.email != email.data:
-            if Usuario.query.filter_by(email=email.data).first():
-                raise ValidationError('Já existe um usuário com este E-mail.')
-
-    def validate_username(self, username):
-        if current_user.username != username.data:
-            if Usuario.query.filter_by(username=username.data).first():
-                raise ValidationError('Este nome de usuário já está em uso.')
+    def validate(self, extra_validators=None):
+        return super().validate(extra_validators) and marcar_conflitos(self, exceto_id=current_user.id)
 
 class FormUploadVideo(FlaskForm):
     titulo = StringField('Título do Vídeo', validators=[DataRequired(), length(2, 100)])
@@ -49,6 +63,13 @@ class FormUploadVideo(FlaskForm):
     thumbnail = FileField('Capa do Vídeo', validators=[FileAllowed(['jpg', 'png', 'jpeg'])])
     botao_submit = SubmitField('Publicar Vídeo')
 
+class FormSessaoUpload(FlaskForm):
+    titulo = StringField('Título do Vídeo', validators=[DataRequired(), length(2, 100)])
+    descricao = TextAreaField('Descrição', validators=[DataRequired()])
+    nome_arquivo = StringField('Arquivo', validators=[DataRequired()])
+    tamanho = IntegerField('Tamanho', validators=[DataRequired()])
+    thumbnail = FileField('Capa do Vídeo', validators=[FileAllowed(['jpg', 'png', 'jpeg'])])
+
 class FormCriarPost(FlaskForm):
     titulo = StringField('Título', validators=[DataRequired(), length(2, 140)])
     corpo = TextAreaField('Conteúdo', validators=[DataRequired()])
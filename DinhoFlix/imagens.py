@@ -0,0 +1,167 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image, ImageOps, features
+
+from DinhoFlix import app
+from DinhoFlix.armazenamento import caminho_local, guardar_derivado, info, listar, temporario, url_midia
+
+
+# ===============================
+# VARIANTES RESPONSIVAS
+# ===============================
+# Cada imagem enviada (capa de vídeo, foto de perfil) ganha, uma única vez,
+# cópias menores em formatos modernos ao lado do original:
+#   <nome>-<largura>.webp / <nome>-<largura>.avif
+# e, por último, a lista do que foi gerado em <nome>-variantes.json: os
+# templates (via <picture>/srcset, ver components/imagem.html) leem só ela,
+# sem listar a pasta.
+
+QUALIDADE = {
+    'avif': 50,
+    'webp': 80,
+}
+
+
+def formatos_disponiveis():
+    # AVIF depende do Pillow ter sido compilado com libavif
+    return [formato for formato in ('avif', 'webp') if features.check(formato)]
+
+
+def _nome_variante(nome, largura, formato):
+    return f'{nome.rsplit(".", 1)[0]}-{largura}.{formato}'
+
+
+def _nome_registro(nome):
+    return f'{nome.rsplit(".", 1)[0]}-variantes.json'
+
+
+def _registrar_variantes(pasta, nome, variantes):
+    """Grava {formato: [larguras]}; se o registro existe, as variantes também."""
+    with temporario('.json') as caminho:
+        with open(caminho, 'w') as arquivo:
+            json.dump(variantes, arquivo)
+        guardar_derivado(f'{pasta}/{_nome_registro(nome)}', caminho)
+
+
+def gerar_variantes(pasta, nome):
+    """Gera as larguras configuradas (sem ampliar) de <pasta>/<nome> em cada formato moderno."""
+    with caminho_local(f'{pasta}/{nome}') as caminho_original, Image.open(caminho_original) as original:
+        imagem = ImageOps.exif_transpose(original)
+        if imagem.mode not in ('RGB', 'RGBA'):
+            imagem = imagem.convert('RGBA' if 'transparency' in imagem.info else 'RGB')
+
+        larguras = [largura for largura in app.config['IMAGENS_LARGURAS'] if largura < imagem.width]
+        larguras.append(min(imagem.width, app.config['IMAGENS_LARGURAS'][-1]))
+        larguras = sorted(set(larguras))
+
+        for largura in larguras:
+            altura = round(imagem.height * largura / imagem.width)
+            reduzida = imagem.resize((largura, altura), Image.Resampling.LANCZOS)
+
+            for formato in formatos_disponiveis():
+                with temporario('.' + formato) as caminho:
+                    reduzida.save(caminho, formato.upper(), quality=QUALIDADE[formato])
+                    guardar_derivado(f'{pasta}/{_nome_variante(nome, largura, formato)}', caminho)
+
+    _registrar_variantes(pasta, nome, {formato: larguras for formato in formatos_disponiveis()})
+    _esquecer(pasta, nome)
+
+
+# ===============================
+# CONSULTA (TEMPLATES)
+# ===============================
+# Os nomes são o hash do conteúdo e as variantes nunca mudam depois de
+# geradas, então o que foi encontrado fica em memória. Ausências expiram logo,
+# porque a capa gerada pelo processamento do vídeo pode surgir depois.
+_encontradas = OrderedDict()
+_trava = threading.Lock()
+_MAXIMO = 4096
+_VALIDADE_AUSENCIA = 60
+
+
+def _esquecer(pasta, nome):
+    with _trava:
+        _encontradas.pop((pasta, nome), None)
+
+
+def _ler_variantes(pasta, nome):
+    chave = f'{pasta}/{_nome_registro(nome)}'
+    if info(chave) is None:
+        return {}
+
+    with caminho_local(chave) as caminho, open(caminho) as arquivo:
+        return json.load(arquivo)
+
+
+def _listar_variantes(pasta, nome):
+    chave = (pasta, nome)
+
+    with _trava:
+        if chave in _encontradas:
+            variantes, expira_em = _encontradas[chave]
+            if expira_em is None or expira_em > time.monotonic():
+                _encontradas.move_to_end(chave)
+                return variantes
+
+    variantes = _ler_variantes(pasta, nome)
+
+    with _trava:
+        expira_em = None if variantes else time.monotonic() + _VALIDADE_AUSENCIA
+        _encontradas[chave] = (variantes, expira_em)
+        if len(_encontradas) > _MAXIMO:
+            _encontradas.popitem(last=False)
+
+    return variantes
+
+
+def srcset_imagem(pasta, nome, formato):
+    """Valor do atributo srcset para <pasta>/<nome> no formato pedido."""
+    if not nome:
+        return ''
+
+    variantes = _listar_variantes(pasta, nome)
+    return ', '.join(
+        f"{url_midia(pasta, _nome_variante(nome, largura, formato))} {largura}w"
+        for largura in sorted(variantes.get(formato, []))
+    )
+
+
+@app.cli.command('gerar-variantes')
+def gerar_variantes_existentes():
+    """
+    Gera as variantes das imagens enviadas antes desta funcionalidade. As
+    que já têm variantes mas não o registro (geradas antes dele) só ganham
+    o registro, montado a partir da listagem.
+    """
+    geradas = registradas = 0
+    for pasta in ('thumbnails', 'fotos_perfil'):
+        originais, encontradas, com_registro = [], {}, set()
+
+        for chave, _, _ in list(listar(f'{pasta}/')):
+            nome = chave[len(pasta) + 1:]
+            base, extensao = nome.rsplit('.', 1) if '.' in nome else (nome, '')
+            dono, _, sufixo = base.rpartition('-')
+
+            if sufixo == 'variantes' and extensao == 'json':
+                com_registro.add(dono)
+            elif sufixo.isdigit() and extensao in QUALIDADE:
+                encontradas.setdefault(dono, {}).setdefault(extensao, []).append(int(sufixo))
+            elif extensao.lower() in ('jpg', 'jpeg', 'png', 'webp') and '-' not in base:
+                originais.append((nome, base))
+
+        for nome, base in originais:
+            if base in com_registro:
+                continue
+
+            if base in encontradas:
+                variantes = {formato: sorted(larguras) for formato, larguras in encontradas[base].items()}
+                _registrar_variantes(pasta, nome, variantes)
+                registradas += 1
+            else:
+                gerar_variantes(pasta, nome)
+                geradas += 1
+
+    print(f"✅ Variantes geradas para {geradas} imagem(ns) e registradas para {registradas}.")
@@ -0,0 +1,379 @@
+from flask_login import current_user
+from sqlalchemy import bindparam, delete, func, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import joinedload
+
+from DinhoFlix import app, busca, database
+from DinhoFlix.cache import invalidar_feed, invalidar_pontuacao
+from DinhoFlix.models import Like, Comentario, MODELOS, Usuario, pontuacao_em_alta
+
+
+# ===============================
+# AUXILIARES
+# ===============================
+def insert_ignorando_conflito(modelo):
+    """INSERT que não falha quando uma constraint UNIQUE já cobre a linha."""
+    if database.engine.dialect.name == 'postgresql':
+        return postgresql.insert(modelo).on_conflict_do_nothing()
+    return sqlite.insert(modelo).on_conflict_do_nothing()
+
+
+def somar_contador(tipo, conteudo_id, coluna, delta):
+    """Incremento atômico no próprio UPDATE; devolve False se o item não existe."""
+    modelo = MODELOS[tipo]
+    resultado = database.session.execute(
+        update(modelo)
+        .where(modelo.id == conteudo_id)
+        .values({coluna: getattr(modelo, coluna) + delta})
+    )
+    return resultado.rowcount > 0
+
+
+def pares_pedidos(parametro, limite=300):
+    """'video:1,post:7' -> [('video', 1), ('post', 7)], ignorando o que é inválido."""
+    pares = []
+    for par in parametro.split(','):
+        tipo, _, conteudo_id = par.partition(':')
+        if tipo in MODELOS and conteudo_id.isdigit():
+            pares.append((tipo, int(conteudo_id)))
+    return pares[:limite]
+
+
+def atualizar_pontuacao(tipo, conteudo_id):
+    """
+    Recalcula a pontuação "em alta" do item a partir dos contadores. Chamado
+    na mesma transação que mudou um contador, depois do UPDATE dele: a linha
+    já está travada, então requisições simultâneas não gravam valor velho.
+    """
+    modelo = MODELOS[tipo]
+    linha = database.session.execute(
+        select(modelo.total_likes, modelo.total_comentarios, modelo.data_criacao)
+        .where(modelo.id == conteudo_id)
+    ).one_or_none()
+
+    if linha is not None and linha.data_criacao is not None:
+        database.session.execute(
+            update(modelo)
+            .where(modelo.id == conteudo_id)
+            .values(pontuacao=pontuacao_em_alta(*linha))
+        )
+
+
+def ler_contador(tipo, conteudo_id, coluna):
+    modelo = MODELOS[tipo]
+    return database.session.execute(
+        select(getattr(modelo, coluna)).where(modelo.id == conteudo_id)
+    ).scalar()
+
+
+# ===============================
+# LIKES
+# ===============================
+def ids_curtidos(usuario_id, pares):
+    """
+    Quais dos itens (tipo, id) o usuário curtiu, numa única consulta para
+    qualquer quantidade de itens e tipos (usa as constraints UNIQUE
+    (usuario_id, <tipo>_id) de Like como índice).
+    """
+    ids_por_tipo = {}
+    for tipo, conteudo_id in pares:
+        ids_por_tipo.setdefault(tipo, set()).add(conteudo_id)
+
+    if not ids_por_tipo:
+        return set()
+
+    colunas = {tipo: getattr(Like, f'{tipo}_id') for tipo in ids_por_tipo}
+    linhas = database.session.execute(
+        select(*colunas.values())
+        .where(
+            Like.usuario_id == usuario_id,
+            or_(*(colunas[tipo].in_(ids) for tipo, ids in ids_por_tipo.items()))
+        )
+    )
+
+    curtidos = set()
+    for linha in linhas:
+        for tipo, conteudo_id in zip(colunas, linha):
+            if conteudo_id in ids_por_tipo[tipo]:
+                curtidos.add((tipo, conteudo_id))
+    return curtidos
+
+
+def curtidos_usuario(pares):
+    """ids_curtidos do visitante atual (sem consulta para anônimos). Usado nos templates."""
+    if not current_user.is_authenticated:
+        return set()
+    return ids_curtidos(current_user.id, pares)
+
+
+def alternar_like(usuario_id, tipo, conteudo_id, curtir=None):
+    """
+    Curte ou descurte o item e devolve (curtido, total_likes), ou None se o
+    item não existe. Com curtir=True/False grava esse estado em vez de
+    alternar; se o like já está assim, nada é escrito (cliques repetidos
+    não viram commits nem disputam o lock de escrita).
+
+    Não carrega a lista de likes: o DELETE diz se o like existia e o INSERT
+    ignora conflito nas constraints UNIQUE de Like, então duas requisições
+    simultâneas nunca contam o mesmo like duas vezes.
+    """
+    total = ler_contador(tipo, conteudo_id, 'total_likes')
+    if total is None:
+        return None
+
+    coluna = getattr(Like, f'{tipo}_id')
+
+    if curtir is not None:
+        existe = database.session.execute(
+            select(Like.id).where(Like.usuario_id == usuario_id, coluna == conteudo_id)
+        ).first() is not None
+        if existe == curtir:
+            return curtir, total
+
+    removido = 0
+    if not curtir:
+        removido = database.session.execute(
+            delete(Like).where(Like.usuario_id == usuario_id, coluna == conteudo_id)
+        ).rowcount
+
+    if removido:
+        curtido, delta = False, -1
+    elif curtir is False:
+        curtido, delta = False, 0
+    else:
+        inserido = database.session.execute(
+            insert_ignorando_conflito(Like).values(usuario_id=usuario_id, **{f'{tipo}_id': conteudo_id})
+        ).rowcount
+        curtido, delta = True, 1 if inserido else 0
+
+    if delta:
+        somar_contador(tipo, conteudo_id, 'total_likes', delta)
+        atualizar_pontuacao(tipo, conteudo_id)
+        somar_likes_recebidos(tipo, conteudo_id, delta)
+
+    total = ler_contador(tipo, conteudo_id, 'total_likes')
+    database.session.commit()
+
+    if delta:
+        invalidar_pontuacao(tipo)
+
+    return curtido, total
+
+
+# ===============================
+# COMENTÁRIOS
+# ===============================
+def registrar_comentario(usuario_id, tipo, conteudo_id, texto):
+    """Cria o comentário e atualiza o contador do item; None se o item não existe."""
+    if not somar_contador(tipo, conteudo_id, 'total_comentarios', 1):
+        database.session.rollback()
+        return None
+
+    atualizar_pontuacao(tipo, conteudo_id)
+
+    comentario = Comentario(texto=texto, usuario_id=usuario_id, **{f'{tipo}_id': conteudo_id})
+    database.session.add(comentario)
+    database.session.flush()
+    busca.indexar_comentario(comentario)
+    database.session.commit()
+    invalidar_pontuacao(tipo)
+
+    return comentario
+
+
+def listar_comentarios(tipo, conteudo_id, antes_de=None, limite=10):
+    """
+    Página de comentários do item, do mais novo para o mais antigo, com o
+    autor já carregado. Keyset pelo id (usa o índice (<tipo>_id, id));
+    devolve (comentarios, cursor da próxima página ou None).
+    """
+    coluna = getattr(Comentario, f'{tipo}_id')
+    consulta = (
+        Comentario.query
+        .options(joinedload(Comentario.autor))
+        .filter(coluna == conteudo_id)
+    )
+
+    if antes_de is not None:
+        consulta = consulta.filter(Comentario.id < antes_de)
+
+    comentarios = consulta.order_by(Comentario.id.desc()).limit(limite + 1).all()
+
+    if len(comentarios) > limite:
+        comentarios = comentarios[:limite]
+        return comentarios, comentarios[-1].id
+
+    return comentarios, None
+
+
+def item_do_comentario(comentario):
+    """(tipo, id) do item comentado; (None, None) se o item já foi apagado."""
+    for tipo in MODELOS:
+        conteudo_id = getattr(comentario, f'{tipo}_id')
+        if conteudo_id:
+            return tipo, conteudo_id
+    return None, None
+
+
+def apagar_comentario(comentario):
+    """
+    Remove o comentário, do índice de busca e do contador do item; devolve
+    o novo total de comentários do item.
+    """
+    tipo, conteudo_id = item_do_comentario(comentario)
+
+    total = None
+    if tipo:
+        somar_contador(tipo, conteudo_id, 'total_comentarios', -1)
+        atualizar_pontuacao(tipo, conteudo_id)
+        total = ler_contador(tipo, conteudo_id, 'total_comentarios')
+
+    busca.remover_comentario(comentario.id)
+    database.session.delete(comentario)
+    database.session.commit()
+
+    if tipo:
+        invalidar_pontuacao(tipo)
+
+    return total
+
+
+# ===============================
+# RESUMO DO PERFIL
+# ===============================
+# Colunas de Usuario com o total publicado de cada tipo
+COLUNAS_AUTOR = {
+    'video': 'total_videos',
+    'post': 'total_posts',
+    'depoimento': 'total_depoimentos',
+}
+
+
+def somar_resumo_autor(usuario_id, deltas):
+    """Incremento atômico das colunas de resumo do autor ({coluna: delta})."""
+    database.session.execute(
+        update(Usuario)
+        .where(Usuario.id == usuario_id)
+        .values({coluna: getattr(Usuario, coluna) + delta for coluna, delta in deltas.items()})
+    )
+
+
+def registrar_publicacao(tipo, usuario_id):
+    """Chamado na mesma transação que cria o item."""
+    somar_resumo_autor(usuario_id, {COLUNAS_AUTOR[tipo]: 1})
+
+
+def registrar_exclusao(tipo, item):
+    """
+    Chamado na mesma transação que apaga o item, antes do delete: apaga os
+    likes e comentários dele (os relacionamentos só zerariam a FK, deixando
+    linhas órfãs) e desconta o resumo do autor.
+    """
+    for modelo in (Like, Comentario):
+        database.session.execute(
+            delete(modelo).where(getattr(modelo, f'{tipo}_id') == item.id)
+        )
+
+    somar_resumo_autor(item.usuario_id, {
+        COLUNAS_AUTOR[tipo]: -1,
+        'total_likes_recebidos': -item.total_likes,
+    })
+
+
+def somar_likes_recebidos(tipo, conteudo_id, delta):
+    """Likes recebidos pelo autor do item, sem carregar o item."""
+    modelo = MODELOS[tipo]
+    database.session.execute(
+        update(Usuario)
+        .where(Usuario.id == select(modelo.usuario_id).where(modelo.id == conteudo_id).scalar_subquery())
+        .values(total_likes_recebidos=Usuario.total_likes_recebidos + delta)
+    )
+
+
+def recalcular_resumos(executor=None):
+    """Reescreve o resumo de todos os perfis a partir das tabelas de conteúdo."""
+    executor = executor or database.session
+    usuario = Usuario.__table__
+
+    totais = {}
+    likes = []
+    for tipo, coluna in COLUNAS_AUTOR.items():
+        tabela = MODELOS[tipo].__table__
+        totais[coluna] = (
+            select(func.count())
+            .where(tabela.c.usuario_id == usuario.c.id)
+            .scalar_subquery()
+        )
+        likes.append(
+            select(func.coalesce(func.sum(tabela.c.total_likes), 0))
+            .where(tabela.c.usuario_id == usuario.c.id)
+            .scalar_subquery()
+        )
+
+    totais['total_likes_recebidos'] = sum(likes[1:], likes[0])
+    executor.execute(update(usuario).values(**totais))
+
+
+# ===============================
+# MANUTENÇÃO
+# ===============================
+def recalcular_contadores():
+    """Recalcula todos os contadores a partir das tabelas Like e Comentario."""
+    for tipo, modelo in MODELOS.items():
+        for relacao, coluna in ((Like, 'total_likes'), (Comentario, 'total_comentarios')):
+            chave = getattr(relacao, f'{tipo}_id')
+            contagem = (
+                select(func.count())
+                .where(chave == modelo.id)
+                .correlate(modelo)
+                .scalar_subquery()
+            )
+            database.session.execute(update(modelo).values({coluna: contagem}))
+
+    database.session.commit()
+    recalcular_pontuacoes()
+    recalcular_resumos()
+    database.session.commit()
+    invalidar_feed(*MODELOS)
+
+
+def recalcular_pontuacoes(executor=None, lote=5000):
+    """
+    Reescreve a pontuação "em alta" de todos os itens a partir dos
+    contadores (para quando EM_ALTA_JANELA muda, ou depois de importar dados).
+    Feito em Python, por lotes, porque o SQLite não tem log10.
+    """
+    executor = executor or database.session
+
+    for modelo in MODELOS.values():
+        tabela = modelo.__table__
+        ultimo_id = 0
+        while True:
+            linhas = executor.execute(
+                select(tabela.c.id, tabela.c.total_likes, tabela.c.total_comentarios, tabela.c.data_criacao)
+                .where(tabela.c.id > ultimo_id, tabela.c.data_criacao.is_not(None))
+                .order_by(tabela.c.id)
+                .limit(lote)
+            ).all()
+            if not linhas:
+                break
+
+            executor.execute(
+                update(tabela)
+                .where(tabela.c.id == bindparam('id_item'))
+                .values(pontuacao=bindparam('nova_pontuacao')),
+                [
+                    {'id_item': linha.id, 'nova_pontuacao': pontuacao_em_alta(*linha[1:])}
+                    for linha in linhas
+                ]
+            )
+            ultimo_id = linhas[-1].id
+
+
+@app.cli.command('recalcular-pontuacao')
+def recalcular_pontuacao():
+    """Recalcula a pontuação "em alta" de todos os itens."""
+    recalcular_pontuacoes()
+    database.session.commit()
+    invalidar_feed(*MODELOS)
+    print("✅ Pontuações recalculadas.")
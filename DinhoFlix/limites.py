@@ -0,0 +1,175 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request
+from flask_login import current_user
+
+from DinhoFlix import app
+
+
+# ===============================
+# LIMITES DE REQUISIÇÕES
+# ===============================
+# Token bucket: cada balde começa cheio com `capacidade` fichas, cada
+# requisição gasta uma e elas voltam a `por_segundo`. Rajadas curtas passam;
+# quem insiste fica no ritmo de reposição e recebe 429 com Retry-After.
+#
+# Cada regra de LIMITES tem um balde por usuário (ou IP, sem login) e,
+# opcionalmente em LIMITES_ROTA, um balde da rota inteira, que segura o
+# total de escritas (e a fila no lock de escrita do SQLite) mesmo com
+# muitos usuários ao mesmo tempo.
+
+class LimiteExcedido(Exception):
+    """Balde vazio; espera = segundos até a próxima ficha."""
+
+    def __init__(self, regra, espera):
+        super().__init__(regra)
+        self.regra = regra
+        self.espera = espera
+
+
+def _repor(fichas, instante, agora, capacidade, por_segundo):
+    return min(capacidade, fichas + (agora - instante) * por_segundo)
+
+
+# ===============================
+# BACKENDS
+# ===============================
+# Todos têm a mesma interface: consumir(chave, capacidade, por_segundo)
+# gasta uma ficha e devolve 0, ou devolve os segundos de espera sem gastar.
+
+class LimitesMemoria:
+    """Baldes na memória do próprio processo (cada worker conta o seu)."""
+
+    def __init__(self, maximo):
+        self.maximo = maximo
+        self.baldes = OrderedDict()
+        self.trava = threading.Lock()
+
+    def consumir(self, chave, capacidade, por_segundo):
+        agora = time.monotonic()
+
+        with self.trava:
+            fichas, instante = self.baldes.get(chave, (capacidade, agora))
+            fichas = _repor(fichas, instante, agora, capacidade, por_segundo)
+
+            if fichas < 1:
+                espera = (1 - fichas) / por_segundo
+            else:
+                fichas -= 1
+                espera = 0
+
+            self.baldes[chave] = (fichas, agora)
+            self.baldes.move_to_end(chave)
+            # Sai o balde parado há mais tempo (já estaria cheio de novo)
+            while len(self.baldes) > self.maximo:
+                self.baldes.popitem(last=False)
+
+        return espera
+
+
+class LimitesCompartilhados:
+    """
+    Baldes divididos entre processos/servidores sobre qualquer cliente com a
+    interface do redis-py (pipeline com watch/multi). Cada balde é uma chave
+    "fichas instante" que expira quando ele estaria cheio de novo.
+    """
+
+    def __init__(self, cliente, prefixo='dinhoflix:limite:'):
+        from redis.exceptions import WatchError  # dependência opcional
+
+        self.cliente = cliente
+        self.prefixo = prefixo
+        self.conflito = WatchError
+
+    def consumir(self, chave, capacidade, por_segundo):
+        chave = self.prefixo + chave
+        validade = math.ceil(capacidade / por_segundo) + 1
+
+        with self.cliente.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(chave)
+                    agora = time.time()
+
+                    valor = pipe.get(chave)
+                    if valor is None:
+                        fichas = capacidade
+                    else:
+                        fichas, instante = map(float, valor.split())
+                        fichas = _repor(fichas, instante, agora, capacidade, por_segundo)
+
+                    if fichas < 1:
+                        pipe.unwatch()
+                        return (1 - fichas) / por_segundo
+
+                    pipe.multi()
+                    pipe.set(chave, f'{fichas - 1} {agora}', ex=validade)
+                    pipe.execute()
+                    return 0
+                except self.conflito:
+                    # Outra requisição mexeu no mesmo balde: lê de novo
+                    continue
+
+
+class SemLimites:
+    """Usado com LIMITES_TIPO = None: tudo passa."""
+
+    def consumir(self, chave, capacidade, por_segundo):
+        return 0
+
+
+def criar_limites():
+    tipo = app.config['LIMITES_TIPO']
+
+    if tipo == 'redis':
+        import redis  # dependência opcional, só para os limites compartilhados
+        return LimitesCompartilhados(redis.Redis.from_url(app.config['LIMITES_REDIS_URL']))
+
+    if tipo == 'memoria':
+        return LimitesMemoria(app.config['LIMITES_MAXIMO'])
+
+    return SemLimites()
+
+
+# Trocável em tempo de execução (ex.: LimitesCompartilhados(fakeredis.FakeRedis()))
+limites = criar_limites()
+
+
+# ===============================
+# USO NAS ROTAS
+# ===============================
+def _identidade():
+    if current_user.is_authenticated:
+        return f'usuario:{current_user.id}'
+    return f'ip:{request.remote_addr}'
+
+
+def verificar(regra):
+    """Gasta uma ficha da regra ou levanta LimiteExcedido."""
+    baldes = []
+    if regra in app.config['LIMITES']:
+        baldes.append((f'{regra}:{_identidade()}', *app.config['LIMITES'][regra]))
+    if regra in app.config['LIMITES_ROTA']:
+        baldes.append((regra, *app.config['LIMITES_ROTA'][regra]))
+
+    # O do usuário primeiro: quem já passou do próprio limite não gasta o da rota
+    for chave, capacidade, por_segundo in baldes:
+        espera = limites.consumir(chave, capacidade, por_segundo)
+        if espera:
+            raise LimiteExcedido(regra, espera)
+
+
+def limitar(regra):
+    """Decorador de rota; só conta requisições que escrevem (não GET/HEAD)."""
+    def decorador(funcao):
+        @wraps(funcao)
+        def rota(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                verificar(regra)
+            return funcao(*args, **kwargs)
+        return rota
+    return decorador
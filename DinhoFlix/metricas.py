@@ -0,0 +1,226 @@
+import threading
+import time
+from collections import Counter
+
+from flask import before_render_template, g, has_request_context, request, template_rendered
+from sqlalchemy import event
+
+
+# ===============================
+# MÉTRICAS POR REQUISIÇÃO
+# ===============================
+# Para cada requisição: quantas consultas SQL e quanto tempo nelas, tempo de
+# renderização de templates e latência total. Ao final:
+#   - requisições acima de METRICAS_LENTA_MS vão para o log;
+#   - a mesma consulta repetida METRICAS_N_MAIS_1 vezes ou mais (típico de
+#     relationship lazy acessado dentro de um loop no template) vai para o
+#     log como suspeita de N+1;
+#   - tudo é somado por endpoint e exportado em /metrics (Prometheus).
+#
+# O custo por consulta é um perf_counter e um incremento num Counter. Os
+# agregados são por processo: com vários workers, cada coleta do Prometheus
+# enxerga um deles (some por instância no painel).
+
+FAIXAS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MedicaoRequisicao:
+    __slots__ = ('inicio', 'consultas', 'tempo_sql', 'tempo_template', 'repeticoes', '_inicio_consulta', '_inicio_template')
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tempo_sql = 0.0
+        self.tempo_template = 0.0
+        self.repeticoes = Counter()
+        self._inicio_consulta = None
+        self._inicio_template = []
+
+
+class AgregadoEndpoint:
+    def __init__(self):
+        self.status = Counter()
+        self.faixas = [0] * len(FAIXAS_LATENCIA)
+        self.total = 0
+        self.soma_latencia = 0.0
+        self.consultas = 0
+        self.tempo_sql = 0.0
+        self.tempo_template = 0.0
+        self.lentas = 0
+        self.n_mais_1 = 0
+
+
+def _medicao():
+    if not has_request_context():
+        return None
+    return g.get('_medicao')
+
+
+class MonitorRequisicoes:
+    """Liga os eventos do SQLAlchemy e do Flask e guarda os agregados."""
+
+    def __init__(self, app, engine):
+        self.app = app
+        self.trava = threading.Lock()
+        self.endpoints = {}
+
+        event.listen(engine, 'before_cursor_execute', self._antes_consulta)
+        event.listen(engine, 'after_cursor_execute', self._depois_consulta)
+
+        before_render_template.connect(self._antes_template, app)
+        template_rendered.connect(self._depois_template, app)
+
+        app.before_request(self._iniciar)
+        app.after_request(self._finalizar)
+
+    # ---------- coleta ----------
+    def _iniciar(self):
+        g._medicao = MedicaoRequisicao()
+
+    def _antes_consulta(self, conexao, cursor, sql, parametros, contexto, executemany):
+        medicao = _medicao()
+        if medicao is not None:
+            medicao._inicio_consulta = time.perf_counter()
+
+    def _depois_consulta(self, conexao, cursor, sql, parametros, contexto, executemany):
+        medicao = _medicao()
+        if medicao is None or medicao._inicio_consulta is None:
+            return
+        medicao.tempo_sql += time.perf_counter() - medicao._inicio_consulta
+        medicao._inicio_consulta = None
+        medicao.consultas += 1
+        # O SQL já vem parametrizado: mesma string = mesma consulta
+        medicao.repeticoes[sql] += 1
+
+    def _antes_template(self, app, template, context, **extra):
+        medicao = _medicao()
+        if medicao is not None:
+            medicao._inicio_template.append(time.perf_counter())
+
+    def _depois_template(self, app, template, context, **extra):
+        medicao = _medicao()
+        if medicao is not None and medicao._inicio_template:
+            duracao = time.perf_counter() - medicao._inicio_template.pop()
+            # Só o render de fora conta: templates renderizados dentro de outro
+            # já estão no tempo dele
+            if not medicao._inicio_template:
+                medicao.tempo_template += duracao
+
+    def _finalizar(self, resposta):
+        medicao = g.get('_medicao')
+        if medicao is None:
+            return resposta
+
+        if self.app.config['METRICAS_SERVER_TIMING']:
+            # Em HTML renderizado em partes, só o que veio antes dos cabeçalhos
+            resposta.headers['Server-Timing'] = (
+                f'sql;dur={medicao.tempo_sql * 1000:.1f};desc="{medicao.consultas} consultas", '
+                f'template;dur={medicao.tempo_template * 1000:.1f}, '
+                f'total;dur={(time.perf_counter() - medicao.inicio) * 1000:.1f}'
+            )
+
+        dados = (request.endpoint or 'desconhecido', request.method, request.path, resposta.status_code)
+
+        # HTML renderizado em partes (renderizacao.py) ainda vai consultar o
+        # banco e renderizar depois daqui: a medição continua em g e é
+        # registrada quando o corpo termina. Outros streams (SSE, arquivos)
+        # contam só até os cabeçalhos.
+        if resposta.is_streamed and resposta.mimetype == 'text/html':
+            resposta.call_on_close(lambda: self._registrar(medicao, *dados))
+        else:
+            g.pop('_medicao', None)
+            self._registrar(medicao, *dados)
+
+        return resposta
+
+    def _registrar(self, medicao, endpoint, metodo, caminho, status):
+        latencia = time.perf_counter() - medicao.inicio
+        config = self.app.config
+
+        lenta = latencia * 1000 >= config['METRICAS_LENTA_MS']
+        sql_repetido, repeticoes = (medicao.repeticoes.most_common(1) or [(None, 0)])[0]
+        n_mais_1 = repeticoes >= config['METRICAS_N_MAIS_1']
+
+        if lenta:
+            self.app.logger.warning(
+                'Requisição lenta: %s %s %.0f ms (%d consultas, %.0f ms SQL, %.0f ms template)',
+                metodo, caminho, latencia * 1000,
+                medicao.consultas, medicao.tempo_sql * 1000, medicao.tempo_template * 1000
+            )
+        if n_mais_1:
+            self.app.logger.warning(
+                'Possível N+1 em %s %s: consulta repetida %d vezes: %s',
+                metodo, caminho, repeticoes, ' '.join(sql_repetido.split())[:300]
+            )
+
+        with self.trava:
+            agregado = self.endpoints.setdefault(endpoint, AgregadoEndpoint())
+            agregado.status[status] += 1
+            agregado.total += 1
+            agregado.soma_latencia += latencia
+            for posicao, limite in enumerate(FAIXAS_LATENCIA):
+                if latencia <= limite:
+                    agregado.faixas[posicao] += 1
+            agregado.consultas += medicao.consultas
+            agregado.tempo_sql += medicao.tempo_sql
+            agregado.tempo_template += medicao.tempo_template
+            agregado.lentas += lenta
+            agregado.n_mais_1 += n_mais_1
+
+    # ---------- exportação ----------
+    def exportar(self, medidores=None, contadores=None):
+        """
+        Texto no formato de exposição do Prometheus. medidores e contadores:
+        {nome: (ajuda, valor)} extras publicados como gauge (valor do momento)
+        ou counter (só cresce; o nome ganha _total), ex.: o pool do banco.
+        """
+        with self.trava:
+            endpoints = sorted(self.endpoints.items())
+            linhas = []
+
+            def metrica(nome, tipo, ajuda, amostras):
+                linhas.append(f'# HELP dinhoflix_{nome} {ajuda}')
+                linhas.append(f'# TYPE dinhoflix_{nome} {tipo}')
+                for rotulos, valor in amostras:
+                    texto_rotulos = ','.join(f'{chave}="{valor_rotulo}"' for chave, valor_rotulo in rotulos)
+                    if texto_rotulos:
+                        texto_rotulos = '{' + texto_rotulos + '}'
+                    linhas.append(f'dinhoflix_{nome}{texto_rotulos} {valor}')
+
+            metrica('requisicoes_total', 'counter', 'Requisições atendidas', [
+                ((('endpoint', endpoint), ('status', status)), quantidade)
+                for endpoint, agregado in endpoints
+                for status, quantidade in sorted(agregado.status.items())
+            ])
+
+            linhas.append('# HELP dinhoflix_requisicao_segundos Latência das requisições')
+            linhas.append('# TYPE dinhoflix_requisicao_segundos histogram')
+            for endpoint, agregado in endpoints:
+                for limite, quantidade in zip(FAIXAS_LATENCIA, agregado.faixas):
+                    linhas.append(f'dinhoflix_requisicao_segundos_bucket{{endpoint="{endpoint}",le="{limite}"}} {quantidade}')
+                linhas.append(f'dinhoflix_requisicao_segundos_bucket{{endpoint="{endpoint}",le="+Inf"}} {agregado.total}')
+                linhas.append(f'dinhoflix_requisicao_segundos_sum{{endpoint="{endpoint}"}} {agregado.soma_latencia:.6f}')
+                linhas.append(f'dinhoflix_requisicao_segundos_count{{endpoint="{endpoint}"}} {agregado.total}')
+
+            por_endpoint = [
+                ('sql_consultas_total', 'Consultas SQL feitas', 'consultas', '{}'),
+                ('sql_segundos_total', 'Tempo gasto em SQL', 'tempo_sql', '{:.6f}'),
+                ('template_segundos_total', 'Tempo renderizando templates', 'tempo_template', '{:.6f}'),
+                ('requisicoes_lentas_total', 'Requisições acima de METRICAS_LENTA_MS', 'lentas', '{}'),
+                ('n_mais_1_total', 'Requisições com consulta repetida (possível N+1)', 'n_mais_1', '{}'),
+            ]
+            for nome, ajuda, atributo, formato in por_endpoint:
+                metrica(nome, 'counter', ajuda, [
+                    ((('endpoint', endpoint),), formato.format(getattr(agregado, atributo)))
+                    for endpoint, agregado in endpoints
+                ])
+
+        for nome, (ajuda, valor) in (medidores or {}).items():
+            if valor is not None:
+                metrica(nome, 'gauge', ajuda, [((), valor)])
+
+        for nome, (ajuda, valor) in (contadores or {}).items():
+            if valor is not None:
+                metrica(f'{nome}_total', 'counter', ajuda, [((), valor)])
+
+        return '\n'.join(linhas) + '\n'
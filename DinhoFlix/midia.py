@@ -0,0 +1,151 @@
+import mimetypes
+import os
+from datetime import datetime, timezone
+
+from flask import abort, request, Response
+from werkzeug.http import http_date
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+from DinhoFlix import app
+
+
+# ===============================
+# ENTREGA DE MÍDIA
+# ===============================
+# Os arquivos de mídia têm como nome o hash do conteúdo (armazenamento.py) e
+# nunca são reescritos depois de publicados, então podem ficar em cache por
+# um ano.
+CACHE_IMUTAVEL = 'public, max-age=31536000, immutable'
+
+# Tipos do HLS que o mimetypes do Python não conhece (ou erra: .ts)
+mimetypes.add_type('application/vnd.apple.mpegurl', '.m3u8')
+mimetypes.add_type('video/mp2t', '.ts')
+
+
+class _ArquivoLimitado:
+    """
+    Arquivo já posicionado no início do trecho pedido. Expõe fileno() para o
+    gunicorn usar sendfile (cópia zero, a partir da posição atual e limitado
+    pelo Content-Length); quem não tem sendfile lê só os bytes do trecho.
+    """
+
+    def __init__(self, arquivo, tamanho):
+        self.arquivo = arquivo
+        self.restante = tamanho
+
+    def fileno(self):
+        return self.arquivo.fileno()
+
+    def read(self, tamanho=-1):
+        if self.restante <= 0:
+            return b''
+        if tamanho < 0 or tamanho > self.restante:
+            tamanho = self.restante
+        dados = self.arquivo.read(tamanho)
+        self.restante -= len(dados)
+        return dados
+
+    def close(self):
+        self.arquivo.close()
+
+
+def _etag(info):
+    return f'{info.st_size:x}-{info.st_mtime_ns:x}'
+
+
+def _nao_modificado(etag, modificado_em):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+
+    if request.if_modified_since:
+        return modificado_em <= request.if_modified_since
+
+    return False
+
+
+def _trecho_pedido(etag, modificado_em, tamanho):
+    """
+    Devolve (inicio, fim) do Range pedido, None para o arquivo inteiro ou
+    False quando o Range não pode ser atendido (416).
+    """
+    faixa = request.range
+    if faixa is None or faixa.units != 'bytes':
+        return None
+
+    # If-Range: só atende o trecho se o cliente ainda tem a mesma versão
+    if_range = request.if_range
+    if if_range.etag and if_range.etag != etag:
+        return None
+    if if_range.date and if_range.date < modificado_em:
+        return None
+
+    # Múltiplos trechos: responder o arquivo inteiro é permitido pela RFC
+    if len(faixa.ranges) != 1:
+        return None
+
+    trecho = faixa.range_for_length(tamanho)
+    if trecho is None:
+        return False
+
+    return trecho
+
+
+def servir_midia(diretorio, nome, prefixo_offload):
+    caminho = safe_join(diretorio, nome)
+    if caminho is None or not os.path.isfile(caminho):
+        abort(404)
+
+    info = os.stat(caminho)
+    etag = _etag(info)
+    modificado_em = datetime.fromtimestamp(int(info.st_mtime), timezone.utc)
+    tipo = mimetypes.guess_type(nome)[0] or 'application/octet-stream'
+
+    cabecalhos = {
+        'Cache-Control': CACHE_IMUTAVEL,
+        'ETag': f'"{etag}"',
+        'Last-Modified': http_date(modificado_em),
+        'Accept-Ranges': 'bytes',
+    }
+
+    if _nao_modificado(etag, modificado_em):
+        return Response(status=304, headers=cabecalhos)
+
+    # Proxy na frente (nginx/Apache) entrega os bytes e cuida do Range
+    offload = app.config['MIDIA_OFFLOAD']
+    if offload == 'x-accel':
+        cabecalhos['X-Accel-Redirect'] = prefixo_offload + nome
+        return Response(status=200, headers=cabecalhos, content_type=tipo)
+    if offload == 'x-sendfile':
+        cabecalhos['X-Sendfile'] = caminho
+        return Response(status=200, headers=cabecalhos, content_type=tipo)
+
+    trecho = _trecho_pedido(etag, modificado_em, info.st_size)
+    if trecho is False:
+        cabecalhos['Content-Range'] = f'bytes */{info.st_size}'
+        return Response(status=416, headers=cabecalhos)
+
+    if trecho:
+        inicio, fim = trecho
+        status = 206
+        cabecalhos['Content-Range'] = f'bytes {inicio}-{fim - 1}/{info.st_size}'
+    else:
+        inicio, fim = 0, info.st_size
+        status = 200
+
+    cabecalhos['Content-Length'] = str(fim - inicio)
+
+    if request.method == 'HEAD':
+        return Response(status=status, headers=cabecalhos, content_type=tipo)
+
+    arquivo = open(caminho, 'rb')
+    arquivo.seek(inicio)
+    corpo = wrap_file(request.environ, _ArquivoLimitado(arquivo, fim - inicio))
+
+    return Response(
+        corpo,
+        status=status,
+        headers=cabecalhos,
+        content_type=tipo,
+        direct_passthrough=True
+    )
@@ -0,0 +1,305 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable
+
+import sqlalchemy
+from sqlalchemy import inspect, select, text
+
+from DinhoFlix import app, armazenamento, busca, database, interacoes
+
+
+# ===============================
+# MIGRAÇÕES VERSIONADAS
+# ===============================
+# Cada migração é uma função numerada que altera um banco existente sem
+# apagar dados. A tabela versao_esquema guarda as que já foram aplicadas.
+#
+# Banco novo: create_all() já cria tudo no formato atual dos modelos, então
+# todas as versões são só registradas.
+#
+# As migrações usam SQL com os nomes das tabelas (e não os modelos) para
+# continuarem válidas quando os modelos mudarem, e os auxiliares conferem o
+# que já existe: bancos que receberam as colunas antes deste controle de
+# versão (ou duas instâncias migrando juntas) não quebram.
+
+versao_esquema = sqlalchemy.Table(
+    'versao_esquema',
+    database.metadata,
+    sqlalchemy.Column('versao', sqlalchemy.Integer, primary_key=True, autoincrement=False),
+    sqlalchemy.Column('descricao', sqlalchemy.String, nullable=False),
+    sqlalchemy.Column('aplicada_em', sqlalchemy.DateTime, nullable=False),
+)
+
+
+@dataclass
+class Migracao:
+    versao: int
+    descricao: str
+    funcao: Callable
+    # False: roda fora de transação (CREATE INDEX CONCURRENTLY no PostgreSQL)
+    transacional: bool = True
+
+
+MIGRACOES = []
+
+
+def migracao(versao, descricao, transacional=True):
+    def registrar(funcao):
+        MIGRACOES.append(Migracao(versao, descricao, funcao, transacional))
+        MIGRACOES.sort(key=lambda m: m.versao)
+        return funcao
+    return registrar
+
+
+# ===============================
+# AUXILIARES
+# ===============================
+def adicionar_coluna(conexao, tabela, coluna, definicao):
+    """ALTER TABLE ADD COLUMN só se a coluna ainda não existe; devolve se criou."""
+    if coluna in {c['name'] for c in inspect(conexao).get_columns(tabela)}:
+        return False
+
+    conexao.execute(text(f'ALTER TABLE "{tabela}" ADD COLUMN {coluna} {definicao}'))
+    return True
+
+
+def criar_indice(conexao, nome, tabela, colunas, unico=False):
+    """
+    CREATE INDEX IF NOT EXISTS. No PostgreSQL, fora de transação, usa
+    CONCURRENTLY para não travar escritas na tabela enquanto o índice é criado.
+    """
+    concorrente = (
+        conexao.dialect.name == 'postgresql'
+        and conexao.get_execution_options().get('isolation_level') == 'AUTOCOMMIT'
+    )
+
+    conexao.execute(text(
+        f'CREATE {"UNIQUE " if unico else ""}INDEX {"CONCURRENTLY " if concorrente else ""}'
+        f'IF NOT EXISTS {nome} ON "{tabela}" ({", ".join(colunas)})'
+    ))
+
+
+# ===============================
+# MIGRAÇÕES
+# ===============================
+@migracao(1, 'Contadores desnormalizados de likes e comentários')
+def _contadores(conexao):
+    for tabela in ('video', 'post', 'depoimento'):
+        criadas = [
+            adicionar_coluna(conexao, tabela, coluna, 'INTEGER NOT NULL DEFAULT 0')
+            for coluna in ('total_likes', 'total_comentarios')
+        ]
+
+        if any(criadas):
+            conexao.execute(text(
+                f'UPDATE {tabela} SET '
+                f'total_likes = (SELECT count(*) FROM "like" WHERE "like".{tabela}_id = {tabela}.id), '
+                f'total_comentarios = (SELECT count(*) FROM comentario WHERE comentario.{tabela}_id = {tabela}.id)'
+            ))
+
+
+@migracao(2, 'Status de processamento dos vídeos')
+def _status_video(conexao):
+    adicionar_coluna(conexao, 'video', 'status', "VARCHAR NOT NULL DEFAULT 'pronto'")
+
+
+@migracao(3, 'Variantes HLS dos vídeos')
+def _hls_video(conexao):
+    adicionar_coluna(conexao, 'video', 'possui_hls', 'BOOLEAN NOT NULL DEFAULT false')
+
+
+@migracao(4, 'Índices das consultas mais usadas', transacional=False)
+def _indices(conexao):
+    criar_indice(conexao, 'ix_usuario_username', 'usuario', ['username'])
+
+    for tabela in ('video', 'post', 'depoimento', 'comentario'):
+        criar_indice(conexao, f'ix_{tabela}_usuario_id', tabela, ['usuario_id'])
+
+    for tipo in ('video', 'post', 'depoimento'):
+        criar_indice(conexao, f'ix_like_{tipo}_id', 'like', [f'{tipo}_id'])
+        criar_indice(conexao, f'ix_comentario_{tipo}_id_id', 'comentario', [f'{tipo}_id', 'id'])
+
+    criar_indice(conexao, 'ix_video_status_id', 'video', ['status', 'id'])
+
+
+@migracao(5, 'Índice de busca textual')
+def _indice_busca(conexao):
+    busca.criar_estrutura(conexao)
+    busca.reindexar(conexao)
+
+
+@migracao(6, 'Pontuação do feed "em alta"')
+def _pontuacao(conexao):
+    criadas = [
+        adicionar_coluna(conexao, tabela, 'pontuacao', 'FLOAT NOT NULL DEFAULT 0')
+        for tabela in ('video', 'post', 'depoimento')
+    ]
+
+    if any(criadas):
+        interacoes.recalcular_pontuacoes(conexao)
+
+
+@migracao(7, 'Índices do feed "em alta"', transacional=False)
+def _indices_pontuacao(conexao):
+    criar_indice(conexao, 'ix_video_status_pontuacao_id', 'video', ['status', 'pontuacao', 'id'])
+
+    for tabela in ('post', 'depoimento'):
+        criar_indice(conexao, f'ix_{tabela}_pontuacao_id', tabela, ['pontuacao', 'id'])
+
+
+@migracao(8, 'Nome de usuário único', transacional=False)
+def _username_unico(conexao):
+    # Contas antigas com nome repetido: a mais nova vira "<nome>_<id>"
+    renomeadas = conexao.execute(text(
+        "UPDATE usuario SET username = username || '_' || id "
+        'WHERE id NOT IN (SELECT min(id) FROM usuario GROUP BY username)'
+    )).rowcount
+    if renomeadas:
+        print(f"⚠️ {renomeadas} conta(s) com nome de usuário repetido renomeada(s) para <nome>_<id>")
+
+    # Troca o índice comum da migração 4 pelo único, com o mesmo nome
+    concorrente = 'CONCURRENTLY ' if conexao.dialect.name == 'postgresql' else ''
+    conexao.execute(text(f'DROP INDEX {concorrente}IF EXISTS ix_usuario_username'))
+    criar_indice(conexao, 'ix_usuario_username', 'usuario', ['username'], unico=True)
+
+
+@migracao(9, 'Registro de referências dos arquivos de mídia')
+def _arquivos_midia(conexao):
+    conexao.execute(text(
+        'CREATE TABLE IF NOT EXISTS arquivo_midia ('
+        'chave VARCHAR NOT NULL PRIMARY KEY, '
+        'referencias INTEGER NOT NULL DEFAULT 0, '
+        'tamanho BIGINT, '
+        'atualizado_em TIMESTAMP NOT NULL)'
+    ))
+    # Arquivos de antes do registro: contados a partir das linhas que os usam
+    armazenamento.recontar_referencias(conexao)
+
+
+@migracao(10, 'Resumo do perfil (totais publicados e likes recebidos)')
+def _resumo_perfil(conexao):
+    criadas = [
+        adicionar_coluna(conexao, 'usuario', coluna, 'INTEGER NOT NULL DEFAULT 0')
+        for coluna in ('total_videos', 'total_posts', 'total_depoimentos', 'total_likes_recebidos')
+    ]
+
+    if any(criadas):
+        interacoes.recalcular_resumos(conexao)
+
+
+@migracao(11, 'Índices do conteúdo por autor', transacional=False)
+def _indices_autor(conexao):
+    for tabela in ('video', 'post', 'depoimento'):
+        criar_indice(conexao, f'ix_{tabela}_usuario_id_id', tabela, ['usuario_id', 'id'])
+
+
+@migracao(12, 'Chave única dos comentários gravados pela escrita adiada', transacional=False)
+def _chave_comentario(conexao):
+    adicionar_coluna(conexao, 'comentario', 'chave', 'VARCHAR')
+    criar_indice(conexao, 'ix_comentario_chave', 'comentario', ['chave'], unico=True)
+
+
+@migracao(13, 'Metadados dos vídeos (duração, resolução, codecs, bitrate, tamanho)')
+def _metadados_video(conexao):
+    # Preenchidos depois, sem travar a migração: flask metadados-videos
+    for coluna, definicao in (
+        ('duracao', 'FLOAT'),
+        ('largura', 'INTEGER'),
+        ('altura', 'INTEGER'),
+        ('codec_video', 'VARCHAR'),
+        ('codec_audio', 'VARCHAR'),
+        ('bitrate', 'INTEGER'),
+        ('tamanho', 'BIGINT'),
+    ):
+        adicionar_coluna(conexao, 'video', coluna, definicao)
+
+
+@migracao(14, 'Início do processamento dos vídeos (trava com validade)')
+def _processando_desde(conexao):
+    adicionar_coluna(conexao, 'video', 'processando_desde', 'TIMESTAMP')
+
+
+@migracao(15, 'Remove likes e comentários órfãos de itens excluídos')
+def _interacoes_orfas(conexao):
+    # A exclusão de um item só zerava a FK das interações dele
+    for tabela in ('"like"', 'comentario'):
+        conexao.execute(text(
+            f'DELETE FROM {tabela} '
+            'WHERE video_id IS NULL AND post_id IS NULL AND depoimento_id IS NULL'
+        ))
+
+
+# ===============================
+# EXECUÇÃO
+# ===============================
+def _registrar(conexao, migracoes):
+    conexao.execute(versao_esquema.insert(), [
+        {
+            'versao': m.versao,
+            'descricao': m.descricao,
+            'aplicada_em': datetime.now(timezone.utc),
+        }
+        for m in migracoes
+    ])
+
+
+def versoes_aplicadas(conexao):
+    if not inspect(conexao).has_table('versao_esquema'):
+        return None
+    return set(conexao.execute(select(versao_esquema.c.versao)).scalars())
+
+
+def aplicar_migracoes():
+    """Cria o banco do zero ou aplica, em ordem, as migrações pendentes."""
+    engine = database.engine
+
+    with engine.begin() as conexao:
+        if not inspect(conexao).has_table('usuario'):
+            database.metadata.create_all(conexao)
+            # Estruturas que não são modelos do SQLAlchemy
+            busca.criar_estrutura(conexao)
+            _registrar(conexao, MIGRACOES)
+            print("✅ Banco de dados criado com sucesso!")
+            return MIGRACOES
+
+        versao_esquema.create(conexao, checkfirst=True)
+        aplicadas = versoes_aplicadas(conexao)
+
+    pendentes = [m for m in MIGRACOES if m.versao not in aplicadas]
+
+    for m in pendentes:
+        if m.transacional:
+            with engine.begin() as conexao:
+                m.funcao(conexao)
+                _registrar(conexao, [m])
+        else:
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conexao:
+                m.funcao(conexao)
+                _registrar(conexao, [m])
+
+        print(f"✅ Migração {m.versao} aplicada: {m.descricao}")
+
+    return pendentes
+
+
+@app.cli.command('migrar')
+def migrar():
+    """Aplica as migrações pendentes do banco."""
+    if not aplicar_migracoes():
+        print("ℹ️ Banco de dados já está na versão mais recente.")
+
+
+@app.cli.command('versao-banco')
+def versao_banco():
+    """Mostra a versão do esquema e as migrações pendentes."""
+    with database.engine.connect() as conexao:
+        aplicadas = versoes_aplicadas(conexao)
+
+    if aplicadas is None:
+        print("Versão atual: sem controle de versão")
+        aplicadas = set()
+    else:
+        print(f"Versão atual: {max(aplicadas, default=0)}")
+
+    for m in MIGRACOES:
+        print(f"  [{'x' if m.versao in aplicadas else ' '}] {m.versao}: {m.descricao}")
@@ -1,14 +1,73 @@
-from DinhoFlix import database, login_manager
+from DinhoFlix import app, database, login_manager
+from DinhoFlix.cache import lembrar
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from flask_login import UserMixin
+import math
+import sqlalchemy
 
 
 # ===============================
 # LOGIN
 # ===============================
+# current_user é uma cópia só-leitura do usuário guardada no cache (chave
+# usuario:<id>, USUARIO_CACHE_TTL): páginas, likes e comentários não vão ao
+# banco só para saber quem está logado, e templates não conseguem disparar
+# os relacionamentos preguiçosos (videos, posts...). Para alterar o usuário,
+# carregue o Usuario do banco e chame cache.invalidar_usuario depois do
+# commit; os outros workers veem a mudança em até USUARIO_CACHE_TTL.
+@dataclass(frozen=True, eq=False)
+class UsuarioSessao(UserMixin):
+    id: int
+    username: str
+    email: str
+    foto_perfil: str
+
+
+def _projecao_usuario(usuario_id):
+    linha = database.session.execute(
+        sqlalchemy.select(Usuario.id, Usuario.username, Usuario.email, Usuario.foto_perfil)
+        .where(Usuario.id == usuario_id)
+    ).one_or_none()
+    return UsuarioSessao(*linha) if linha else None
+
+
 @login_manager.user_loader
 def load_usuario(usuario_id):
-    return Usuario.query.get(int(usuario_id))
+    usuario_id = int(usuario_id)
+    return lembrar(
+        f'usuario:{usuario_id}',
+        lambda: _projecao_usuario(usuario_id),
+        app.config['USUARIO_CACHE_TTL']
+    )
+
+
+# ===============================
+# PONTUAÇÃO "EM ALTA"
+# ===============================
+# log10 do engajamento + idade: um item EM_ALTA_JANELA segundos mais novo
+# precisa de 10x menos engajamento para ficar na mesma posição. Só muda
+# quando likes/comentários mudam (a idade entra como data de criação, não
+# como "agora"), então é mantida na própria linha e o ranking é uma leitura
+# do índice (pontuacao, id).
+EPOCA_EM_ALTA = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def pontuacao_em_alta(total_likes, total_comentarios, data_criacao):
+    engajamento = total_likes + 2 * total_comentarios
+    if data_criacao.tzinfo is None:
+        data_criacao = data_criacao.replace(tzinfo=timezone.utc)  # SQLite devolve sem fuso
+    idade = (data_criacao - EPOCA_EM_ALTA).total_seconds()
+    return round(math.log10(1 + engajamento) + idade / app.config['EM_ALTA_JANELA'], 7)
+
+
+def _pontuacao_inicial(contexto):
+    parametros = contexto.get_current_parameters()
+    return pontuacao_em_alta(
+        parametros.get('total_likes') or 0,
+        parametros.get('total_comentarios') or 0,
+        parametros.get('data_criacao') or datetime.now(timezone.utc)
+    )
 
 
 # ===============================
@@ -16,12 +75,19 @@ def load_usuario(usuario_id):
 # ===============================
 class Usuario(database.Model, UserMixin):
     id = database.Column(database.Integer, primary_key=True)
-    username = database.Column(database.String, nullable=False)
+    username = database.Column(database.String, nullable=False, unique=True, index=True)
     email = database.Column(database.String, nullable=False, unique=True)
     senha = database.Column(database.String, nullable=False)
 
     foto_perfil = database.Column(database.String, default='default.jpg')
 
+    # Resumo do perfil, mantido por interacoes.py junto com cada publicação,
+    # exclusão e like (o cabeçalho do perfil não conta nada)
+    total_videos = database.Column(database.Integer, nullable=False, default=0, server_default='0')
+    total_posts = database.Column(database.Integer, nullable=False, default=0, server_default='0')
+    total_depoimentos = database.Column(database.Integer, nullable=False, default=0, server_default='0')
+    total_likes_recebidos = database.Column(database.Integer, nullable=False, default=0, server_default='0')
+
     # RELACIONAMENTOS
     videos = database.relationship('Video', backref='autor', lazy=True)
     posts = database.relationship('Post', backref='autor', lazy=True)
@@ -41,16 +107,46 @@ class Video(database.Model):
     arquivo_video = database.Column(database.String, nullable=False)
     thumbnail = database.Column(database.String, nullable=False)
 
+    # pendente -> processando -> pronto | erro (ver processamento.py)
+    status = database.Column(database.String, nullable=False, default='pronto', server_default='pronto')
+    # Quando o job atual pegou o vídeo; a trava vence (ver processamento.py)
+    processando_desde = database.Column(database.DateTime)
+    # Variantes HLS em hls/<nome do arquivo sem extensão>/ (ver armazenamento.py)
+    possui_hls = database.Column(database.Boolean, nullable=False, default=False, server_default=sqlalchemy.false())
+
+    # Metadados do arquivo publicado (ver processamento.sondar_video); vazios
+    # até o processamento terminar ou o metadados-videos preencher
+    duracao = database.Column(database.Float)            # segundos
+    largura = database.Column(database.Integer)
+    altura = database.Column(database.Integer)
+    codec_video = database.Column(database.String)
+    codec_audio = database.Column(database.String)
+    bitrate = database.Column(database.Integer)          # bits/s
+    tamanho = database.Column(database.BigInteger)       # bytes
+
     data_criacao = database.Column(
         database.DateTime,
         default=lambda: datetime.now(timezone.utc)
     )
 
-    usuario_id = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
+    # Contadores desnormalizados (mantidos por interacoes.py)
+    total_likes = database.Column(database.Integer, nullable=False, default=0, server_default='0')
+    total_comentarios = database.Column(database.Integer, nullable=False, default=0, server_default='0')
+    pontuacao = database.Column(database.Float, nullable=False, default=_pontuacao_inicial, server_default='0')
+
+    usuario_id = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False, index=True)
 
     likes = database.relationship('Like', backref='video', lazy=True)
     comentarios = database.relationship('Comentario', backref='video', lazy=True)
 
+    # Feed: vídeos prontos, do mais novo para o mais antigo; perfil: vídeos
+    # de um autor, do mais novo para o mais antigo
+    __table_args__ = (
+        database.Index('ix_video_status_id', 'status', 'id'),
+        database.Index('ix_video_status_pontuacao_id', 'status', 'pontuacao', 'id'),
+        database.Index('ix_video_usuario_id_id', 'usuario_id', 'id'),
+    )
+
 
 # ===============================
 # POST
@@ -65,11 +161,22 @@ class Post(database.Model):
         default=lambda: datetime.now(timezone.utc)
     )
 
-    usuario_id = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
+    # Contadores desnormalizados (mantidos por interacoes.py)
+    total_likes = database.Column(database.Integer, nullable=False, default=0, server_default='0')
+    total_comentarios = database.Column(database.Integer, nullable=False, default=0, server_default='0')
+    pontuacao = database.Column(database.Float, nullable=False, default=_pontuacao_inicial, server_default='0')
+
+    usuario_id = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False, index=True)
 
     likes = database.relationship('Like', backref='post', lazy=True)
     comentarios = database.relationship('Comentario', backref='post', lazy=True)
 
+    # Feed "em alta" e perfil do autor
+    __table_args__ = (
+        database.Index('ix_post_pontuacao_id', 'pontuacao', 'id'),
+        database.Index('ix_post_usuario_id_id', 'usuario_id', 'id'),
+    )
+
 
 # ===============================
 # DEPOIMENTO
@@ -84,11 +191,22 @@ class Depoimento(database.Model):
         default=lambda: datetime.now(timezone.utc)
     )
 
-    usuario_id = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
+    # Contadores desnormalizados (mantidos por interacoes.py)
+    total_likes = database.Column(database.Integer, nullable=False, default=0, server_default='0')
+    total_comentarios = database.Column(database.Integer, nullable=False, default=0, server_default='0')
+    pontuacao = database.Column(database.Float, nullable=False, default=_pontuacao_inicial, server_default='0')
+
+    usuario_id = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False, index=True)
 
     likes = database.relationship('Like', backref='depoimento', lazy=True)
     comentarios = database.relationship('Comentario', backref='depoimento', lazy=True)
 
+    # Feed "em alta" e perfil do autor
+    __table_args__ = (
+        database.Index('ix_depoimento_pontuacao_id', 'pontuacao', 'id'),
+        database.Index('ix_depoimento_usuario_id_id', 'usuario_id', 'id'),
+    )
+
 
 # ===============================
 # LIKE (GENÉRICO)
@@ -98,9 +216,9 @@ class Like(database.Model):
 
     usuario_id = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
 
-    video_id = database.Column(database.Integer, database.ForeignKey('video.id'), nullable=True)
-    post_id = database.Column(database.Integer, database.ForeignKey('post.id'), nullable=True)
-    depoimento_id = database.Column(database.Integer, database.ForeignKey('depoimento.id'), nullable=True)
+    video_id = database.Column(database.Integer, database.ForeignKey('video.id'), nullable=True, index=True)
+    post_id = database.Column(database.Integer, database.ForeignKey('post.id'), nullable=True, index=True)
+    depoimento_id = database.Column(database.Integer, database.ForeignKey('depoimento.id'), nullable=True, index=True)
 
     __table_args__ = (
         database.UniqueConstraint('usuario_id', 'video_id', name='unique_like_video'),
@@ -121,8 +239,49 @@ class Comentario(database.Model):
         default=lambda: datetime.now(timezone.utc)
     )
 
-    usuario_id = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False)
+    usuario_id = database.Column(database.Integer, database.ForeignKey('usuario.id'), nullable=False, index=True)
 
     video_id = database.Column(database.Integer, database.ForeignKey('video.id'), nullable=True)
     post_id = database.Column(database.Integer, database.ForeignKey('post.id'), nullable=True)
     depoimento_id = database.Column(database.Integer, database.ForeignKey('depoimento.id'), nullable=True)
+
+    # Identificador gerado na requisição quando a gravação é adiada (ver
+    # escrita_adiada.py): reaplicar a fila não duplica o comentário
+    chave = database.Column(database.String, nullable=True, unique=True, index=True)
+
+    # Comentários de um item, do mais novo para o mais antigo
+    __table_args__ = (
+        database.Index('ix_comentario_video_id_id', 'video_id', 'id'),
+        database.Index('ix_comentario_post_id_id', 'post_id', 'id'),
+        database.Index('ix_comentario_depoimento_id_id', 'depoimento_id', 'id'),
+    )
+
+
+# ===============================
+# ARQUIVOS DE MÍDIA
+# ===============================
+# Quantas linhas (Video.arquivo_video, Video.thumbnail, Usuario.foto_perfil)
+# apontam para cada arquivo guardado (ver armazenamento.py).
+class ArquivoMidia(database.Model):
+    __tablename__ = 'arquivo_midia'
+
+    # <pasta>/<sha256>.<extensão>, ex.: videos/9f86d0...15b0.mp4
+    chave = database.Column(database.String, primary_key=True)
+    referencias = database.Column(database.Integer, nullable=False, default=0, server_default='0')
+    tamanho = database.Column(database.BigInteger, nullable=True)
+    atualizado_em = database.Column(
+        database.DateTime,
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc)
+    )
+
+
+# ===============================
+# TIPOS DE CONTEÚDO
+# ===============================
+# Nome usado nas rotas (/curtir/<tipo>, /comentario/<tipo>) -> modelo
+MODELOS = {
+    'video': Video,
+    'post': Post,
+    'depoimento': Depoimento,
+}
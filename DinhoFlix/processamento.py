@@ -0,0 +1,497 @@
+import multiprocessing
+import os
+import queue
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import click
+import imageio_ffmpeg as ffmpeg
+from sqlalchemy import or_, select, update
+
+from DinhoFlix import app, busca, database, imagens
+from DinhoFlix.armazenamento import caminho_local, existe, guardar, guardar_derivado, info, liberar, temporario
+from DinhoFlix.cache import invalidar_feed
+from DinhoFlix.models import Video
+
+
+# ===============================
+# STATUS DO VÍDEO
+# ===============================
+PENDENTE = 'pendente'
+PROCESSANDO = 'processando'
+PRONTO = 'pronto'
+ERRO = 'erro'
+
+
+def pasta_hls(nome_video):
+    """Prefixo das variantes HLS no armazenamento (hls/<nome sem extensão>)."""
+    return 'hls/' + nome_video.rsplit('.', 1)[0]
+
+
+def formatar_duracao(segundos):
+    """3:07 ou 1:02:03; vazio enquanto a duração não é conhecida."""
+    if segundos is None:
+        return ''
+    minutos, segundos = divmod(int(segundos), 60)
+    horas, minutos = divmod(minutos, 60)
+    if horas:
+        return f'{horas}:{minutos:02d}:{segundos:02d}'
+    return f'{minutos}:{segundos:02d}'
+
+
+def _executar_ffmpeg(argumentos):
+    comando = [ffmpeg.get_ffmpeg_exe(), '-hide_banner', *argumentos]
+    return subprocess.run(
+        comando,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        timeout=app.config['PROCESSAMENTO_TIMEOUT'],
+        text=True,
+        errors='replace'
+    )
+
+
+# ===============================
+# ETAPAS
+# ===============================
+def sondar_video(caminho):
+    """
+    Lê os metadados do arquivo a partir da saída do próprio ffmpeg
+    (o imageio-ffmpeg não traz o ffprobe).
+    """
+    saida = _executar_ffmpeg(['-i', caminho]).stderr
+    metadados = {
+        'duracao': None,
+        'bitrate': None,
+        'largura': None,
+        'altura': None,
+        'codec_video': None,
+        'codec_audio': None,
+    }
+
+    duracao = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', saida)
+    if duracao:
+        horas, minutos, segundos = duracao.groups()
+        metadados['duracao'] = int(horas) * 3600 + int(minutos) * 60 + float(segundos)
+
+    bitrate = re.search(r'bitrate: (\d+) kb/s', saida)
+    if bitrate:
+        metadados['bitrate'] = int(bitrate.group(1)) * 1000
+
+    stream_video = re.search(r'Stream #.*?: Video: (\w+).*?, (\d{2,5})x(\d{2,5})', saida)
+    if stream_video:
+        metadados['codec_video'] = stream_video.group(1)
+        metadados['largura'] = int(stream_video.group(2))
+        metadados['altura'] = int(stream_video.group(3))
+
+    stream_audio = re.search(r'Stream #.*?: Audio: (\w+)', saida)
+    if stream_audio:
+        metadados['codec_audio'] = stream_audio.group(1)
+
+    return metadados
+
+
+def metadados_do_arquivo(nome_video):
+    """
+    sondar_video + tamanho de um vídeo já guardado em videos/, no formato
+    das colunas de Video. None se o arquivo não existe.
+    """
+    estado = info(f'videos/{nome_video}')
+    if estado is None:
+        return None
+
+    with caminho_local(f'videos/{nome_video}') as caminho:
+        metadados = sondar_video(caminho)
+
+    metadados['tamanho'] = estado[0]
+    return metadados
+
+
+def gerar_thumbnail_automatica(caminho_video):
+    """Quadro de 1s do vídeo, guardado em thumbnails/; devolve o nome (None se falhar)."""
+    with temporario('.jpg') as caminho_thumb:
+        resultado = _executar_ffmpeg([
+            "-y",
+            "-i", caminho_video,
+            "-ss", "00:00:01",
+            "-vframes", "1",
+            caminho_thumb
+        ])
+
+        if resultado.returncode != 0 or not os.path.exists(caminho_thumb):
+            return None
+
+        return guardar('thumbnails', caminho_thumb, '.jpg')
+
+
+def normalizar_video(caminho_video, metadados):
+    """
+    Garante um MP4 reproduzível no navegador: H.264/AAC com o índice (moov)
+    no início do arquivo. Só re-encoda quando o codec não é H.264; nos
+    demais casos é apenas um remux sem perda. O resultado é um arquivo novo
+    em videos/ (com uma referência contada); devolve o nome.
+    """
+    if metadados['codec_video'] == 'h264' and metadados['codec_audio'] in (None, 'aac'):
+        codecs = ['-c', 'copy']
+    else:
+        codecs = ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23', '-c:a', 'aac', '-b:a', '128k']
+
+    with temporario('.mp4') as saida:
+        resultado = _executar_ffmpeg([
+            '-y',
+            '-i', caminho_video,
+            *codecs,
+            '-movflags', '+faststart',
+            saida
+        ])
+
+        if resultado.returncode != 0:
+            raise RuntimeError(f'ffmpeg falhou ao normalizar {caminho_video}: {resultado.stderr[-500:]}')
+
+        return guardar('videos', saida, '.mp4')
+
+
+def _gerar_variante_hls(origem, pasta, altura, bitrate):
+    os.makedirs(pasta)
+
+    resultado = _executar_ffmpeg([
+        '-y',
+        '-i', origem,
+        '-map', '0:v:0', '-map', '0:a:0?',
+        '-vf', f'scale=-2:{altura}',
+        '-c:v', 'libx264', '-preset', 'veryfast', '-profile:v', 'main',
+        '-b:v', str(bitrate), '-maxrate', str(int(bitrate * 1.07)), '-bufsize', str(int(bitrate * 1.5)),
+        # Keyframes a cada 2s em todas as variantes para o player poder trocar de qualidade
+        '-force_key_frames', 'expr:gte(t,n_forced*2)', '-sc_threshold', '0',
+        '-c:a', 'aac', '-b:a', '128k', '-ac', '2',
+        '-f', 'hls',
+        '-hls_time', '6',
+        '-hls_playlist_type', 'vod',
+        '-hls_segment_filename', os.path.join(pasta, 'seg_%03d.ts'),
+        os.path.join(pasta, 'index.m3u8')
+    ])
+
+    if resultado.returncode != 0:
+        raise RuntimeError(f'ffmpeg falhou na variante {altura}p: {resultado.stderr[-500:]}')
+
+
+def gerar_hls(nome_video, metadados):
+    """
+    Gera a escada de variantes HLS (só as que não passam da altura do
+    original) e a playlist master em hls/<nome>/master.m3u8. Tudo é montado
+    numa pasta temporária e a master vai por último: se ela existe, o resto
+    também. Como o nome é o hash do vídeo, o mesmo vídeo enviado de novo
+    reaproveita o HLS pronto.
+    """
+    largura, altura = metadados['largura'], metadados['altura']
+    if not largura or not altura:
+        raise RuntimeError(f'Resolução desconhecida para {nome_video}')
+
+    destino = pasta_hls(nome_video)
+    if info(f'{destino}/master.m3u8') is not None:
+        return
+
+    escada = [(h, b) for h, b in app.config['HLS_ESCADA'] if h <= altura]
+    if not escada:
+        escada = [(altura, app.config['HLS_ESCADA'][0][1])]
+
+    with caminho_local(f'videos/{nome_video}') as origem, temporario() as temporaria:
+        master = ['#EXTM3U', '#EXT-X-VERSION:3']
+        for altura_variante, bitrate in escada:
+            _gerar_variante_hls(
+                origem,
+                os.path.join(temporaria, f'{altura_variante}p'),
+                altura_variante,
+                bitrate
+            )
+            largura_variante = round(largura * altura_variante / altura / 2) * 2
+            master.append(
+                f'#EXT-X-STREAM-INF:BANDWIDTH={bitrate + 128000},'
+                f'RESOLUTION={largura_variante}x{altura_variante}'
+            )
+            master.append(f'{altura_variante}p/index.m3u8')
+
+        with open(os.path.join(temporaria, 'master.m3u8'), 'w') as arquivo:
+            arquivo.write('\n'.join(master) + '\n')
+
+        for atual, _, arquivos in os.walk(temporaria):
+            for nome in sorted(arquivos):
+                if atual != temporaria or nome != 'master.m3u8':
+                    relativo = os.path.relpath(os.path.join(atual, nome), temporaria).replace(os.sep, '/')
+                    guardar_derivado(f'{destino}/{relativo}', os.path.join(atual, nome))
+
+        guardar_derivado(f'{destino}/master.m3u8', os.path.join(temporaria, 'master.m3u8'))
+
+
+# ===============================
+# JOB
+# ===============================
+def processar_video(video_id):
+    """
+    Processa um vídeo pendente. O UPDATE condicional funciona como trava:
+    se outro worker (ou outro processo do gunicorn) já pegou o job, sai.
+    A trava vale PROCESSAMENTO_TRAVA_VALIDADE (ver liberar_travados).
+    """
+    with app.app_context():
+        reivindicado = database.session.execute(
+            update(Video)
+            .where(Video.id == video_id, Video.status == PENDENTE)
+            .values(status=PROCESSANDO, processando_desde=datetime.now(timezone.utc))
+        ).rowcount
+        database.session.commit()
+
+        if not reivindicado:
+            return
+
+        try:
+            video = database.session.get(Video, video_id)
+            enviado = video.arquivo_video
+
+            with caminho_local(f'videos/{enviado}') as caminho:
+                metadados = sondar_video(caminho)
+                video.arquivo_video = normalizar_video(caminho, metadados)
+
+                if not existe('thumbnails', video.thumbnail):
+                    capa = gerar_thumbnail_automatica(caminho)
+                    if capa:
+                        liberar('thumbnails', video.thumbnail)
+                        video.thumbnail = capa
+
+            # Do arquivo publicado (o remux/re-encode muda bitrate, codec e tamanho)
+            metadados = metadados_do_arquivo(video.arquivo_video)
+            for coluna, valor in metadados.items():
+                setattr(video, coluna, valor)
+
+            # O arquivo enviado só perde a referência; limpar-midia o apaga
+            liberar('videos', enviado)
+            database.session.commit()
+
+            try:
+                imagens.gerar_variantes('thumbnails', video.thumbnail)
+            except Exception:
+                # Sem variantes o feed usa a capa original; não impede a publicação
+                app.logger.exception('Falha ao gerar variantes da capa do vídeo %s', video_id)
+
+            video.status = PRONTO
+            busca.indexar('video', video.id, video.titulo, video.descricao)
+            database.session.commit()
+            invalidar_feed('video')
+        except Exception:
+            app.logger.exception('Falha ao processar o vídeo %s', video_id)
+            database.session.rollback()
+            database.session.execute(
+                update(Video).where(Video.id == video_id).values(status=ERRO)
+            )
+            database.session.commit()
+            database.session.remove()
+            return
+
+        # O MP4 já pode ser assistido; as variantes HLS vêm depois e, se
+        # falharem, o player continua usando o original.
+        try:
+            if app.config['HLS_ATIVO']:
+                gerar_hls(video.arquivo_video, metadados)
+                video.possui_hls = True
+                database.session.commit()
+        except Exception:
+            app.logger.exception('Falha ao gerar HLS do vídeo %s', video_id)
+            database.session.rollback()
+        finally:
+            database.session.remove()
+
+
+# ===============================
+# FILA / WORKERS
+# ===============================
+# A fila e a retomada só sobem no processo que atende requisições (na
+# primeira delas, já depois do fork do gunicorn): um comando `flask` que
+# pegasse um vídeo e saísse deixaria o job pela metade.
+
+class FilaProcessamento:
+    """
+    Fila local com um pool fixo de threads. Cada job roda isolado: uma
+    exceção marca só aquele vídeo como erro e o worker segue para o próximo.
+    """
+
+    def __init__(self, quantidade_workers):
+        self.quantidade_workers = quantidade_workers
+        self.fila = queue.Queue()
+        self.workers = []
+        self.na_fila = set()
+        self.vigia = None
+        self.trava = threading.Lock()
+
+    def _iniciar_workers(self):
+        with self.trava:
+            if self.workers:
+                return
+
+            for numero in range(self.quantidade_workers):
+                worker = threading.Thread(
+                    target=self._executar,
+                    name=f'processamento-{numero}',
+                    daemon=True
+                )
+                worker.start()
+                self.workers.append(worker)
+
+    def _executar(self):
+        while True:
+            video_id = self.fila.get()
+            with self.trava:
+                self.na_fila.discard(video_id)
+            try:
+                processar_video(video_id)
+            except Exception:
+                app.logger.exception('Worker de processamento falhou no vídeo %s', video_id)
+            finally:
+                self.fila.task_done()
+
+    def _vigiar(self):
+        while True:
+            try:
+                retomar_pendentes()
+            except Exception:
+                app.logger.exception('Falha ao buscar vídeos pendentes')
+            time.sleep(app.config['PROCESSAMENTO_VARREDURA'])
+
+    def iniciar(self):
+        """Sobe a busca periódica de vídeos pendentes e travados (uma vez por processo)."""
+        with self.trava:
+            if self.vigia is not None:
+                return
+            self.vigia = threading.Thread(target=self._vigiar, name='processamento-vigia', daemon=True)
+            self.vigia.start()
+
+    def enfileirar(self, video_id):
+        if app.config['PROCESSAMENTO_SINCRONO']:
+            processar_video(video_id)
+            return
+
+        self._iniciar_workers()
+        with self.trava:
+            if video_id in self.na_fila:
+                return
+            self.na_fila.add(video_id)
+        self.fila.put(video_id)
+
+
+fila = FilaProcessamento(app.config['PROCESSAMENTO_WORKERS'])
+
+
+@app.before_request
+def _iniciar_fila():
+    if fila.vigia is None and not app.config['PROCESSAMENTO_SINCRONO']:
+        fila.iniciar()
+
+
+def liberar_travados():
+    """Volta para pendente os vídeos cuja trava de processamento venceu."""
+    limite = datetime.now(timezone.utc) - timedelta(seconds=app.config['PROCESSAMENTO_TRAVA_VALIDADE'])
+    liberados = database.session.execute(
+        update(Video)
+        .where(
+            Video.status == PROCESSANDO,
+            # Sem início registrado: travados de antes da coluna existir
+            or_(Video.processando_desde.is_(None), Video.processando_desde < limite)
+        )
+        .values(status=PENDENTE, processando_desde=None)
+    ).rowcount
+    database.session.commit()
+
+    if liberados:
+        app.logger.warning('%s vídeo(s) com processamento interrompido voltaram para a fila', liberados)
+
+
+def retomar_pendentes():
+    """Reenfileira vídeos pendentes (ex.: o processo reiniciou) e os travados."""
+    with app.app_context():
+        liberar_travados()
+        ids = [
+            video_id for (video_id,) in
+            database.session.query(Video.id).filter(Video.status == PENDENTE)
+        ]
+
+    for video_id in ids:
+        fila.enfileirar(video_id)
+
+
+@app.cli.command('reprocessar-videos')
+def reprocessar_videos():
+    """Volta vídeos travados em processamento ou com erro para a fila."""
+    database.session.execute(
+        update(Video)
+        .where(Video.status.in_([PROCESSANDO, ERRO]))
+        .values(status=PENDENTE)
+    )
+    database.session.commit()
+    retomar_pendentes()
+    fila.fila.join()
+    print("✅ Vídeos reprocessados.")
+
+
+# ===============================
+# METADADOS DOS VÍDEOS ANTIGOS
+# ===============================
+# Vídeos publicados antes das colunas de metadados: cada arquivo é sondado
+# num processo separado (o ffmpeg e, no S3, o download rodam em paralelo) e
+# o resultado é gravado no banco em lotes pelo processo principal.
+
+def _iniciar_processo_sonda():
+    # As conexões herdadas do pai ficam com ele: não usar nem fechar aqui
+    database.engine.dispose(close=False)
+
+
+def _sondar_para_preencher(linha):
+    video_id, nome_video = linha
+    try:
+        return video_id, metadados_do_arquivo(nome_video)
+    except Exception:
+        return video_id, None
+
+
+@app.cli.command('metadados-videos')
+@click.option('--processos', type=int, default=os.cpu_count(), help='Arquivos sondados ao mesmo tempo.')
+@click.option('--lote', type=int, default=100, help='Vídeos gravados por commit.')
+@click.option('--todos', is_flag=True, help='Sonda de novo também os que já têm metadados.')
+def metadados_videos(processos, lote, todos):
+    """Preenche duração, resolução, codecs, bitrate e tamanho dos vídeos publicados."""
+    consulta = select(Video.id, Video.arquivo_video).where(Video.status == PRONTO).order_by(Video.id).limit(lote)
+    if not todos:
+        consulta = consulta.where(Video.duracao.is_(None))
+
+    preenchidos = falhas = 0
+    ultimo_id = 0
+
+    with ProcessPoolExecutor(
+        max_workers=processos,
+        mp_context=multiprocessing.get_context('fork'),
+        initializer=_iniciar_processo_sonda
+    ) as executor:
+        while True:
+            linhas = [tuple(linha) for linha in database.session.execute(consulta.where(Video.id > ultimo_id))]
+            if not linhas:
+                break
+            ultimo_id = linhas[-1][0]
+
+            valores = []
+            for video_id, metadados in executor.map(_sondar_para_preencher, linhas):
+                if metadados is None or metadados['duracao'] is None:
+                    falhas += 1
+                    print(f"⚠️ Vídeo {video_id}: arquivo ausente ou ilegível.")
+                else:
+                    valores.append({'id': video_id, **metadados})
+
+            if valores:
+                # UPDATE em lote pela chave primária
+                database.session.execute(update(Video), valores)
+            database.session.commit()
+
+            preenchidos += len(valores)
+            print(f"... {preenchidos} vídeos preenchidos")
+
+    print(f"✅ Metadados de {preenchidos} vídeos preenchidos ({falhas} falhas).")
@@ -0,0 +1,71 @@
+from flask import Response, get_flashed_messages, render_template, stream_template
+from flask_wtf.csrf import generate_csrf
+
+from DinhoFlix import app
+
+
+# ===============================
+# RENDERIZAÇÃO EM PARTES
+# ===============================
+# Para páginas cujo conteúdo depende de consultas (feed, explorar): o
+# template é renderizado com stream_template e o navegador recebe o <head>
+# e a navbar — e já começa a baixar CSS, JS e fontes — antes das consultas
+# do conteúdo rodarem.
+#
+# Os pedaços que o Jinja produz (um por trecho entre tags) são juntados
+# até RENDER_PARTES_BUFFER bytes para não virar uma escrita por tag.
+# {{ descarregar() }} no template manda na hora o que já foi juntado: use
+# logo antes de cada trecho que vai ao banco.
+#
+# Cuidados:
+#   - status e cabeçalhos saem antes do corpo: um erro no meio da
+#     renderização só corta a resposta (não vira página 500);
+#   - a sessão é salva junto com os cabeçalhos, então o que o template
+#     grava nela (mensagens flash, token CSRF) é resolvido antes.
+
+def descarregar():
+    """Fora de renderizar_em_partes não faz nada."""
+    return ''
+
+
+def _agrupar(pedacos, pedidos, tamanho):
+    buffer = []
+    juntado = 0
+
+    for pedaco in pedacos:
+        buffer.append(pedaco)
+        juntado += len(pedaco)
+
+        if juntado >= tamanho or pedidos:
+            yield ''.join(buffer)
+            buffer.clear()
+            pedidos.clear()
+            juntado = 0
+
+    if buffer:
+        yield ''.join(buffer)
+
+
+def renderizar_em_partes(template, **contexto):
+    """render_template que devolve o HTML aos poucos (RENDER_EM_PARTES)."""
+    if not app.config['RENDER_EM_PARTES']:
+        return render_template(template, **contexto)
+
+    # Tira da sessão agora; o template recebe as mesmas depois (cache da requisição)
+    get_flashed_messages()
+    if app.config.get('WTF_CSRF_ENABLED', True):
+        generate_csrf()
+
+    pedidos = []
+
+    def descarregar_agora():
+        pedidos.append(True)
+        return ''
+
+    pedacos = stream_template(template, descarregar=descarregar_agora, **contexto)
+
+    return Response(
+        _agrupar(pedacos, pedidos, app.config['RENDER_PARTES_BUFFER']),
+        mimetype='text/html',
+        headers={'X-Accel-Buffering': 'no'}  # nginx: repassar cada parte
+    )
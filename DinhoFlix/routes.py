@@ -2,11 +2,10 @@
 # IMPORTAÇÕES
 # ==========================================
 
+import math
 import os
 import secrets
-import subprocess
 
-import imageio_ffmpeg as ffmpeg
 from PIL import Image
 from flask import (
     render_template,
@@ -15,7 +14,8 @@ from flask import (
     request,
     flash,
     abort,
-    jsonify
+    jsonify,
+    Response
 )
 from flask_login import (
     login_user,
@@ -24,65 +24,124 @@ from flask_login import (
     login_required
 )
 
-from DinhoFlix import app, database, bcrypt
+from sqlalchemy.exc import IntegrityError, TimeoutError as TimeoutPool
+from werkzeug.datastructures import FileStorage
+
+from DinhoFlix import (
+    app,
+    database,
+    escrita_adiada,
+    senhas,
+    busca,
+    imagens,
+    processamento,
+    tempo_real,
+    upload_partes,
+    monitor_pool,
+    monitor_requisicoes
+)
 from DinhoFlix.forms import (
     FormLogin,
     FormCriarConta,
     FormEditarPerfil,
     FormCriarPost,
     FormUploadVideo,
-    FormDepoimento
+    FormSessaoUpload,
+    FormDepoimento,
+    marcar_conflitos
 )
 from DinhoFlix.models import (
     Usuario,
     Video,
     Post,
     Depoimento,
-    Comentario
+    Comentario,
+    MODELOS
+)
+from DinhoFlix.armazenamento import em_disco, guardar, guardar_fluxo, liberar, temporario, url_midia
+from DinhoFlix.cache import invalidar_feed, invalidar_usuario
+from DinhoFlix.feed import carregar_feed, carregar_itens, videos_do_autor, FeedEmPartes, ORDENS, RECENTES, TIPOS_EXPLORAR
+from DinhoFlix.interacoes import (
+    alternar_like,
+    apagar_comentario,
+    item_do_comentario,
+    ler_contador,
+    listar_comentarios,
+    pares_pedidos,
+    registrar_comentario,
+    registrar_exclusao,
+    registrar_publicacao
 )
+from DinhoFlix.escrita_adiada import curtidos_usuario
+from DinhoFlix.limites import LimiteExcedido, limitar
+from DinhoFlix.midia import servir_midia
+from DinhoFlix.renderizacao import renderizar_em_partes
 
 
 # ==========================================
 # FEED / NAVEGAÇÃO
 # ==========================================
 
+def ordem_pedida():
+    ordem = request.args.get('ordem', RECENTES)
+    return ordem if ordem in ORDENS else RECENTES
+
+
+def pagina_inicial_feed(tipos, ordem):
+    """Primeira página do feed; em blocos quando a página sai em partes."""
+    if not app.config['RENDER_EM_PARTES']:
+        return carregar_feed(tipos, ordem=ordem)
+    return FeedEmPartes(tipos, ordem=ordem, primeiro_bloco=app.config['FEED_PRIMEIRO_BLOCO'])
+
+
 @app.route('/')
 def home():
-    return render_template(
-        'home.html',
-        videos=Video.query.order_by(Video.id.desc()).all(),
-        posts=Post.query.order_by(Post.id.desc()).all(),
-        depoimentos=Depoimento.query.order_by(Depoimento.id.desc()).all()
-    )
+    ordem = ordem_pedida()
+    pagina = pagina_inicial_feed(list(MODELOS), ordem)
+    return renderizar_em_partes('home.html', pagina=pagina, tipos_feed='', ordem=ordem)
 
 
 @app.route('/explorar/<tipo>')
 def explorar(tipo):
-    if tipo == 'videos':
-        return render_template(
-            'home.html',
-            videos=Video.query.order_by(Video.id.desc()).all(),
-            posts=[],
-            depoimentos=[]
-        )
+    if tipo not in TIPOS_EXPLORAR:
+        abort(404)
 
-    if tipo == 'posts':
-        return render_template(
-            'home.html',
-            videos=[],
-            posts=Post.query.order_by(Post.id.desc()).all(),
-            depoimentos=[]
-        )
+    ordem = ordem_pedida()
+    pagina = pagina_inicial_feed([TIPOS_EXPLORAR[tipo]], ordem)
+    return renderizar_em_partes('home.html', pagina=pagina, tipos_feed=TIPOS_EXPLORAR[tipo], ordem=ordem)
+
+
+@app.route('/buscar')
+def buscar():
+    consulta = request.args.get('q', '').strip()
+    tipo = request.args.get('tipo', '')
+    pagina = max(request.args.get('pagina', 1, type=int), 1)
+
+    resultado = busca.buscar(
+        consulta,
+        pagina,
+        [TIPOS_EXPLORAR[tipo]] if tipo in TIPOS_EXPLORAR else None
+    )
+
+    return render_template(
+        'buscar.html',
+        consulta=consulta,
+        tipo=tipo,
+        resultado=resultado,
+        itens=carregar_itens(resultado.resultados)
+    )
 
-    if tipo == 'relatos':
-        return render_template(
-            'home.html',
-            videos=[],
-            posts=[],
-            depoimentos=Depoimento.query.order_by(Depoimento.id.desc()).all()
-        )
 
-    abort(404)
+@app.route('/api/feed')
+def feed_mais():
+    tipos = [tipo for tipo in request.args.get('tipos', '').split(',') if tipo in MODELOS]
+    pagina = carregar_feed(tipos or list(MODELOS), cursor=request.args.get('cursor'), ordem=ordem_pedida())
+
+    return jsonify({
+        'html': render_template('components/feed_itens.html', itens=pagina.itens),
+        'cursor': pagina.cursor,
+        'itens': [{'tipo': item.tipo, 'id': item.id} for item in pagina.itens]
+    })
 
 
 # ==========================================
@@ -94,27 +153,31 @@ def login():
     form_login = FormLogin()
     form_criar = FormCriarConta()
 
-    if form_login.validate_on_submit() and 'botao_submit_fazerlogin' in request.form:
+    if 'botao_submit_fazerlogin' in request.form and form_login.validate_on_submit():
         usuario = Usuario.query.filter_by(email=form_login.email.data).first()
-        if usuario and bcrypt.check_password_hash(usuario.senha, form_login.senha.data):
+        if senhas.autenticar(usuario, form_login.senha.data):
+            database.session.commit()  # hash refeito se o custo mudou
             login_user(usuario, remember=form_login.lembrar_dados.data)
             flash('Bem-vindo!', 'success')
             return redirect(url_for('home'))
         flash('Credenciais inválidas', 'danger')
 
-    if form_criar.validate_on_submit() and 'botao_submit_criarconta' in request.form:
-        senha_hash = bcrypt.generate_password_hash(form_criar.senha.data).decode()
-
+    if 'botao_submit_criarconta' in request.form and form_criar.validate_on_submit():
         usuario = Usuario(
             username=form_criar.username.data,
             email=form_criar.email.data,
-            senha=senha_hash
+            senha=senhas.gerar_hash(form_criar.senha.data)
         )
         database.session.add(usuario)
-        database.session.commit()
-
-        flash('Conta criada com sucesso!', 'success')
-        return redirect(url_for('login'))
+        try:
+            database.session.commit()
+        except IntegrityError:
+            # Outra conta com o mesmo e-mail/nome entrou entre a validação e o commit
+            database.session.rollback()
+            marcar_conflitos(form_criar)
+        else:
+            flash('Conta criada com sucesso!', 'success')
+            return redirect(url_for('login'))
 
     return render_template(
         'login.html',
@@ -137,7 +200,28 @@ def sair():
 @app.route('/perfil')
 @login_required
 def perfil():
-    return render_template('perfil.html')
+    return render_template('perfil.html', **contexto_perfil(current_user.id, proprio=True))
+
+
+@app.route('/usuario/<int:usuario_id>')
+def exibir_perfil_usuario(usuario_id):
+    return render_template('perfil_publico.html', **contexto_perfil(usuario_id))
+
+
+@app.route('/usuarios')
+def usuarios():
+    """Comunidade, em páginas por id (o resumo de cada perfil já está na linha)."""
+    limite = app.config['USUARIOS_TAMANHO_PAGINA']
+    consulta = Usuario.query.order_by(Usuario.id)
+
+    depois_de = request.args.get('depois', type=int)
+    if depois_de is not None:
+        consulta = consulta.filter(Usuario.id > depois_de)
+
+    lista_usuarios = consulta.limit(limite + 1).all()
+    proximo = lista_usuarios[limite - 1].id if len(lista_usuarios) > limite else None
+
+    return render_template('usuarios.html', lista_usuarios=lista_usuarios[:limite], proximo=proximo)
 
 
 @app.route('/perfil/editar', methods=['GET', 'POST'])
@@ -146,20 +230,32 @@ def editar_perfil():
     form = FormEditarPerfil()
 
     if form.validate_on_submit():
-        current_user.username = form.username.data
-        current_user.email = form.email.data
+        usuario = database.session.get(Usuario, current_user.id)
+        usuario.username = form.username.data
+        usuario.email = form.email.data
 
         if form.foto_perfil.data:
-            current_user.foto_perfil = salvar_imagem(form.foto_perfil.data)
-
-        database.session.commit()
+            foto_anterior = usuario.foto_perfil
+            usuario.foto_perfil = salvar_imagem(form.foto_perfil.data)
+            liberar('fotos_perfil', foto_anterior)
+
+        try:
+            database.session.commit()
+        except IntegrityError:
+            database.session.rollback()
+            marcar_conflitos(form, exceto_id=current_user.id)
+            return render_template('editarperfil.html', form=form, **contexto_perfil(current_user.id, proprio=True))
+
+        invalidar_usuario(usuario.id)
+        # Nome e foto aparecem nos cards de tudo que o usuário publicou
+        invalidar_feed(*MODELOS)
         flash('Perfil atualizado!', 'success')
         return redirect(url_for('perfil'))
 
     form.username.data = current_user.username
     form.email.data = current_user.email
 
-    return render_template('editarperfil.html', form=form)
+    return render_template('editarperfil.html', form=form, **contexto_perfil(current_user.id, proprio=True))
 
 
 # ==========================================
@@ -168,34 +264,105 @@ def editar_perfil():
 
 @app.route('/video/upload', methods=['GET', 'POST'])
 @login_required
+@limitar('upload')
 def upload_video():
     form = FormUploadVideo()
 
     if form.validate_on_submit():
         nome_video = salvar_video(form.arquivo.data)
 
+        # Sem capa enviada, o processamento gera <nome>.jpg a partir do vídeo
         if form.thumbnail.data:
             thumb = salvar_thumbnail(form.thumbnail.data)
         else:
-            thumb = gerar_thumbnail_automatica(nome_video)
-
-        video = Video(
-            titulo=form.titulo.data,
-            descricao=form.descricao.data,
-            arquivo_video=nome_video,
-            thumbnail=thumb,
-            autor=current_user
-        )
+            thumb = nome_video.rsplit('.', 1)[0] + '.jpg'
 
-        database.session.add(video)
-        database.session.commit()
+        video = publicar_video(form.titulo.data, form.descricao.data, nome_video, thumb)
 
-        flash('Vídeo publicado!', 'success')
-        return redirect(url_for('home'))
+        flash('Vídeo enviado! Ele aparece no feed assim que terminar de processar.', 'success')
+        return redirect(url_for('exibir_video', video_id=video.id))
 
     return render_template('upload_video.html', form=form)
 
 
+# Upload em partes: o navegador envia o arquivo em pedaços conferidos por
+# sha256 e pode retomar de onde parou se a conexão cair.
+@app.errorhandler(upload_partes.ErroUpload)
+def erro_upload(erro):
+    return jsonify({'erro': erro.mensagem}), erro.status
+
+
+@app.route('/video/upload/sessao', methods=['POST'])
+@login_required
+@limitar('upload')
+def iniciar_upload():
+    form = FormSessaoUpload()
+
+    if not form.validate_on_submit():
+        return jsonify({'erro': 'Dados inválidos', 'campos': form.errors}), 400
+
+    sessao = upload_partes.criar_sessao(
+        current_user.id,
+        form.titulo.data,
+        form.descricao.data,
+        form.nome_arquivo.data,
+        form.tamanho.data,
+        form.thumbnail.data
+    )
+    return jsonify(upload_partes.resumo_sessao(sessao)), 201
+
+
+@app.route('/video/upload/sessao/<sessao_id>')
+@login_required
+def status_upload(sessao_id):
+    sessao = upload_partes.carregar_sessao(sessao_id, current_user.id)
+    return jsonify(upload_partes.resumo_sessao(sessao))
+
+
+@app.route('/video/upload/sessao/<sessao_id>/parte/<int:numero>', methods=['PUT'])
+@login_required
+@limitar('upload_parte')
+def enviar_parte(sessao_id, numero):
+    sessao = upload_partes.carregar_sessao(sessao_id, current_user.id)
+
+    upload_partes.gravar_parte(
+        sessao,
+        numero,
+        request.stream,
+        request.content_length,
+        request.headers.get('X-Parte-SHA256')
+    )
+    return jsonify({'parte': numero})
+
+
+@app.route('/video/upload/sessao/<sessao_id>/concluir', methods=['POST'])
+@login_required
+def concluir_upload(sessao_id):
+    sessao = upload_partes.carregar_sessao(sessao_id, current_user.id)
+
+    # Repetir o POST (rede caiu antes da resposta) devolve o mesmo vídeo;
+    # se a publicação falhar, as partes continuam lá para outra tentativa
+    with upload_partes.concluindo(sessao):
+        resultado = upload_partes.resultado_conclusao(sessao)
+        if resultado is None:
+            nome_video = upload_partes.montar_arquivo(sessao)
+
+            capa = upload_partes.caminho_capa(sessao)
+            if capa:
+                with open(capa, 'rb') as arquivo:
+                    thumb = salvar_thumbnail(FileStorage(arquivo, filename=os.path.basename(capa)))
+            else:
+                thumb = nome_video.rsplit('.', 1)[0] + '.jpg'
+
+            video = publicar_video(sessao['titulo'], sessao['descricao'], nome_video, thumb)
+
+            resultado = {'video_id': video.id, 'url': url_for('exibir_video', video_id=video.id)}
+            upload_partes.registrar_conclusao(sessao, resultado)
+            flash('Vídeo enviado! Ele aparece no feed assim que terminar de processar.', 'success')
+
+    return jsonify(resultado)
+
+
 @app.route('/video/<int:video_id>')
 @login_required
 def exibir_video(video_id):
@@ -203,37 +370,65 @@ def exibir_video(video_id):
     return render_template('video.html', video=video)
 
 
-from flask import send_from_directory
+@app.route('/video/<int:video_id>/status')
+@login_required
+def status_video(video_id):
+    video = Video.query.get_or_404(video_id)
+    return jsonify({'status': video.status})
 
+
+# Com o armazenamento fora do disco (S3), o navegador vai direto ao bucket
 @app.route('/media/videos/<filename>')
 def media_video(filename):
+    if not em_disco():
+        return redirect(url_midia('videos', filename))
+
     caminho = os.path.join(app.root_path, 'static/videos')
-    return send_from_directory(caminho, filename)
+    return servir_midia(caminho, filename, app.config['MIDIA_X_ACCEL_PREFIXO'] + 'videos/')
+
+
+@app.route('/media/hls/<pasta>/<path:arquivo>')
+def media_hls(pasta, arquivo):
+    if not em_disco():
+        return redirect(url_midia(f'hls/{pasta}', arquivo))
+
+    caminho = os.path.join(app.root_path, 'static/hls', pasta)
+    return servir_midia(caminho, arquivo, app.config['MIDIA_X_ACCEL_PREFIXO'] + f'hls/{pasta}/')
 
 
 @app.route('/curtir/<tipo>/<int:id>', methods=['POST'])
 @login_required
+@limitar('curtir')
 def curtir(tipo, id):
+    if tipo not in MODELOS:
+        abort(404)
 
-    if tipo == 'video':
-        objeto = Video.query.get_or_404(id)
-    elif tipo == 'post':
-        objeto = Post.query.get_or_404(id)
-    elif tipo == 'depoimento':
-        objeto = Depoimento.query.get_or_404(id)
+    # curtido=1/0 pede o estado final de uma série de cliques (ver base.html);
+    # sem ele, alterna
+    curtido = {'1': True, '0': False}.get(request.form.get('curtido'))
 
-    if current_user in objeto.likes:
-        objeto.likes.remove(current_user)
-        liked = False
+    if escrita_adiada.ativa():
+        resultado = escrita_adiada.curtir(current_user.id, tipo, id, curtido)
     else:
-        objeto.likes.append(current_user)
-        liked = True
+        resultado = alternar_like(current_user.id, tipo, id, curtido)
+    if resultado is None:
+        abort(404)
 
-    database.session.commit()
+    liked, total_likes = resultado
+    tempo_real.publicar(tipo, id, 'likes', total_likes=total_likes)
 
     return jsonify({
         'liked': liked,
-        'total_likes': len(objeto.likes)
+        'total_likes': total_likes
+    })
+
+
+@app.route('/curtidos')
+def curtidos():
+    """Quais de ?itens=video:1,post:7,... o usuário atual curtiu (uma consulta)."""
+    pares = pares_pedidos(request.args.get('itens', ''))
+    return jsonify({
+        'curtidos': sorted(f'{tipo}:{conteudo_id}' for tipo, conteudo_id in curtidos_usuario(pares))
     })
 
 
@@ -242,11 +437,16 @@ def curtir(tipo, id):
 def excluir_video(video_id):
     video = Video.query.get_or_404(video_id)
 
-    if video.autor != current_user:
+    if video.usuario_id != current_user.id:
         abort(403)
 
+    busca.remover('video', video.id)
+    registrar_exclusao('video', video)
+    liberar('videos', video.arquivo_video)
+    liberar('thumbnails', video.thumbnail)
     database.session.delete(video)
     database.session.commit()
+    invalidar_feed('video')
     flash('Vídeo excluído', 'success')
     return redirect(url_for('home'))
 
@@ -264,28 +464,37 @@ def criar_post():
         post = Post(
             titulo=form.titulo.data,
             corpo=form.corpo.data,
-            autor=current_user
+            usuario_id=current_user.id
         )
         database.session.add(post)
+        database.session.flush()
+        busca.indexar('post', post.id, post.titulo, post.corpo)
+        registrar_publicacao('post', current_user.id)
         database.session.commit()
+        invalidar_feed('post')
         flash('Post criado!', 'success')
         return redirect(url_for('home'))
 
     return render_template('criarpost.html', form=form)
 
+
 @app.route('/post/excluir/<int:post_id>', methods=['POST'])
 @login_required
 def excluir_post(post_id):
     post = Post.query.get_or_404(post_id)
 
-    if post.autor != current_user:
+    if post.usuario_id != current_user.id:
         abort(403)
 
+    busca.remover('post', post.id)
+    registrar_exclusao('post', post)
     database.session.delete(post)
     database.session.commit()
+    invalidar_feed('post')
     flash('Post excluído', 'success')
     return redirect(url_for('home'))
 
+
 @app.route('/depoimento/novo', methods=['GET', 'POST'])
 @login_required
 def criar_depoimento():
@@ -295,25 +504,33 @@ def criar_depoimento():
         depoimento = Depoimento(
             titulo=form.titulo.data,
             corpo=form.corpo.data,
-            autor=current_user
+            usuario_id=current_user.id
         )
         database.session.add(depoimento)
+        database.session.flush()
+        busca.indexar('depoimento', depoimento.id, depoimento.titulo, depoimento.corpo)
+        registrar_publicacao('depoimento', current_user.id)
         database.session.commit()
+        invalidar_feed('depoimento')
         flash('Relato enviado!', 'success')
         return redirect(url_for('home'))
 
     return render_template('criar_depoimento.html', form=form)
 
+
 @app.route('/depoimento/excluir/<int:depoimento_id>', methods=['POST'])
 @login_required
 def excluir_depoimento(depoimento_id):
     depoimento = Depoimento.query.get_or_404(depoimento_id)
 
-    if depoimento.autor != current_user:
+    if depoimento.usuario_id != current_user.id:
         abort(403)
 
+    busca.remover('depoimento', depoimento.id)
+    registrar_exclusao('depoimento', depoimento)
     database.session.delete(depoimento)
     database.session.commit()
+    invalidar_feed('depoimento')
     flash('Relato excluído', 'success')
     return redirect(url_for('home'))
 
@@ -323,78 +540,234 @@ def excluir_depoimento(depoimento_id):
 
 @app.route('/comentario/<tipo>/<int:conteudo_id>', methods=['POST'])
 @login_required
+@limitar('comentar')
 def comentar(tipo, conteudo_id):
     texto = request.form.get('texto')
 
     if not texto:
         return jsonify({'erro': 'Comentário vazio'}), 400
 
-    comentario = Comentario(texto=texto, autor=current_user)
-
-    if tipo == 'video':
-        comentario.video_id = conteudo_id
-    elif tipo == 'post':
-        comentario.post_id = conteudo_id
-    elif tipo == 'depoimento':
-        comentario.depoimento_id = conteudo_id
-    else:
+    if tipo not in MODELOS:
         abort(400)
 
-    database.session.add(comentario)
-    database.session.commit()
+    # Vai para a fila: sai sem id (e sem "Apagar") e os outros visitantes
+    # recebem o comentário quando ele for gravado
+    if escrita_adiada.ativa():
+        resultado = escrita_adiada.comentar(current_user, tipo, conteudo_id, texto)
+        if resultado is None:
+            abort(404)
+
+        comentario, total_comentarios = resultado
+        return jsonify({
+            'id': None,
+            'texto': comentario.texto,
+            'usuario': current_user.username,
+            'html': render_template('components/comentarios.html', comentarios=[comentario]),
+            'total_comentarios': total_comentarios
+        })
+
+    comentario = registrar_comentario(current_user.id, tipo, conteudo_id, texto)
+    if comentario is None:
+        abort(404)
+
+    total_comentarios = ler_contador(tipo, conteudo_id, 'total_comentarios')
+
+    # Para os outros visitantes: sem o botão de apagar
+    tempo_real.publicar(
+        tipo, conteudo_id, 'comentario',
+        comentario_id=comentario.id,
+        html=render_template('components/comentarios.html', comentarios=[comentario], sem_acoes=True),
+        total_comentarios=total_comentarios
+    )
 
     return jsonify({
         'id': comentario.id,
         'texto': comentario.texto,
-        'usuario': current_user.username
+        'usuario': current_user.username,
+        'html': render_template('components/comentarios.html', comentarios=[comentario]),
+        'total_comentarios': total_comentarios
+    })
+
+
+# Páginas de comentários pedidas quando a caixa é aberta ("carregar anteriores"
+# usa o cursor devolvido)
+@app.route('/comentarios/<tipo>/<int:conteudo_id>')
+def comentarios(tipo, conteudo_id):
+    if tipo not in MODELOS:
+        abort(404)
+
+    pagina, cursor = listar_comentarios(
+        tipo,
+        conteudo_id,
+        antes_de=request.args.get('antes_de', type=int),
+        limite=app.config['COMENTARIOS_TAMANHO_PAGINA']
+    )
+
+    return jsonify({
+        # Mais antigos primeiro, na ordem em que aparecem na caixa
+        'html': render_template('components/comentarios.html', comentarios=pagina[::-1]),
+        'cursor': cursor,
+        'comentarios': [
+            {'id': comentario.id, 'texto': comentario.texto, 'usuario': comentario.autor.username}
+            for comentario in pagina
+        ]
     })
 
 
+# Canal de eventos (likes/comentários) dos itens que estão na tela
+@app.route('/eventos')
+def eventos():
+    canais = {f'{tipo}:{conteudo_id}' for tipo, conteudo_id in pares_pedidos(request.args.get('itens', ''))}
+    if not canais:
+        abort(400)
+    return tempo_real.resposta_eventos(canais)
+
+
+@app.route('/comentario/apagar/<int:comentario_id>', methods=['POST'])
+@login_required
+def excluir_comentario(comentario_id):
+    comentario = Comentario.query.get_or_404(comentario_id)
+
+    if comentario.usuario_id != current_user.id:
+        abort(403)
+
+    tipo, conteudo_id = item_do_comentario(comentario)
+    total_comentarios = apagar_comentario(comentario)
+
+    if tipo:
+        tempo_real.publicar(
+            tipo, conteudo_id, 'comentario_apagado',
+            comentario_id=comentario_id,
+            total_comentarios=total_comentarios
+        )
+
+    return jsonify({'id': comentario_id, 'total_comentarios': total_comentarios})
+
+
+# ==========================================
+# SAÚDE / MONITORAMENTO
+# ==========================================
+
+def exigir_token_metricas():
+    token = app.config['METRICAS_TOKEN']
+    if token and not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(401)
+
+
+@app.route('/saude/banco')
+def saude_banco():
+    exigir_token_metricas()
+    return jsonify(monitor_pool.estatisticas())
+
+
+@app.route('/metrics')
+def metricas():
+    if monitor_requisicoes is None:
+        abort(404)
+
+    exigir_token_metricas()
+
+    pool = monitor_pool.estatisticas()
+    texto = monitor_requisicoes.exportar(
+        medidores={
+            'pool_conexoes_em_uso': ('Conexões do pool em uso', pool['em_uso']),
+            'pool_conexoes_ociosas': ('Conexões abertas paradas no pool', pool['ociosas']),
+            'pool_tamanho': ('Tamanho configurado do pool', pool['tamanho']),
+        },
+        contadores={
+            'pool_esgotamentos': ('Requisições que desistiram de esperar conexão', pool['esgotamentos']),
+        }
+    )
+    return Response(texto, mimetype='text/plain; version=0.0.4')
+
+
+# Pool de hash de senhas cheio (pico de logins)
+@app.errorhandler(senhas.SenhasOcupadas)
+def senhas_ocupadas(erro):
+    app.logger.warning('Pool de senhas cheio; login recusado')
+    return 'Muitos logins ao mesmo tempo, tente novamente em instantes.', 503, {'Retry-After': '2'}
+
+
+# Balde de requisições vazio (ver limites.py)
+@app.errorhandler(LimiteExcedido)
+def limite_excedido(erro):
+    espera = str(math.ceil(erro.espera))
+    if request.accept_mimetypes.best == 'text/html':
+        return 'Muitas requisições, tente novamente em instantes.', 429, {'Retry-After': espera}
+    return jsonify({'erro': 'Muitas requisições', 'espera': erro.espera}), 429, {'Retry-After': espera}
+
+
+# Todas as conexões do pool ocupadas por mais de BANCO_POOL_ESPERA segundos
+@app.errorhandler(TimeoutPool)
+def banco_saturado(erro):
+    monitor_pool.registrar_esgotamento()
+    app.logger.warning('Pool de conexões esgotado: %s', monitor_pool.estatisticas())
+    return 'Servidor ocupado, tente novamente em instantes.', 503, {'Retry-After': '5'}
+
+
 # ==========================================
 # FUNÇÕES AUXILIARES
 # ==========================================
 
+def contexto_perfil(usuario_id, proprio=False):
+    """
+    Usuário (com o resumo já somado nas colunas total_*) e uma página dos
+    vídeos dele para perfil.html / perfil_publico.html. No próprio perfil
+    aparecem também os vídeos ainda em processamento.
+    """
+    usuario = database.session.get(Usuario, usuario_id)
+    if usuario is None:
+        abort(404)
+
+    videos, proximo = videos_do_autor(
+        usuario_id,
+        request.args.get('antes', type=int),
+        somente_prontos=not proprio
+    )
+    return {'usuario': usuario, 'videos': videos, 'proximo': proximo}
+
+
 def salvar_imagem(imagem):
-    nome = secrets.token_hex(8) + os.path.splitext(imagem.filename)[1]
-    caminho = os.path.join(app.root_path, 'static/fotos_perfil', nome)
+    extensao = os.path.splitext(imagem.filename)[1].lower()
+
+    with temporario(extensao) as caminho:
+        img = Image.open(imagem)
+        img.thumbnail((400, 400))
+        img.save(caminho)
+        nome = guardar('fotos_perfil', caminho, extensao)
 
-    img = Image.open(imagem)
-    img.thumbnail((400, 400))
-    img.save(caminho)
+    imagens.gerar_variantes('fotos_perfil', nome)
 
     return nome
 
 
-def salvar_video(arquivo):
-    nome = secrets.token_hex(8) + os.path.splitext(arquivo.filename)[1]
-    caminho = os.path.join(app.root_path, 'static/videos', nome)
-    arquivo.save(caminho)
-    return nome
+def publicar_video(titulo, descricao, nome_video, thumb):
+    video = Video(
+        titulo=titulo,
+        descricao=descricao,
+        arquivo_video=nome_video,
+        thumbnail=thumb,
+        status=processamento.PENDENTE,
+        usuario_id=current_user.id
+    )
 
+    database.session.add(video)
+    registrar_publicacao('video', current_user.id)
+    database.session.commit()
+    invalidar_feed('video')
 
-def salvar_thumbnail(imagem):
-    nome = secrets.token_hex(8) + os.path.splitext(imagem.filename)[1]
-    caminho = os.path.join(app.root_path, 'static/thumbnails', nome)
-    Image.open(imagem).save(caminho)
-    return nome
+    processamento.fila.enfileirar(video.id)
+    return video
 
 
-def gerar_thumbnail_automatica(nome_video):
-    caminho_video = os.path.join(app.root_path, 'static/videos', nome_video)
-    nome_thumb = nome_video.rsplit('.', 1)[0] + '.jpg'
-    caminho_thumb = os.path.join(app.root_path, 'static/thumbnails', nome_thumb)
+def salvar_video(arquivo):
+    return guardar_fluxo('videos', arquivo.stream, os.path.splitext(arquivo.filename)[1])
 
-    ffmpeg_path = ffmpeg.get_ffmpeg_exe()
 
-    comando = [
-        ffmpeg_path,
-        "-y",
-        "-i", caminho_video,
-        "-ss", "00:00:01",
-        "-vframes", "1",
-        caminho_thumb
-    ]
+def salvar_thumbnail(imagem):
+    extensao = os.path.splitext(imagem.filename)[1].lower()
 
-    subprocess.run(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with temporario(extensao) as caminho:
+        Image.open(imagem).save(caminho)
+        return guardar('thumbnails', caminho, extensao)
 
-    return nome_thumb
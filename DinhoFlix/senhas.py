@@ -0,0 +1,96 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as TimeoutFuturo
+
+from DinhoFlix import app, bcrypt
+
+
+# ===============================
+# POOL DE HASH
+# ===============================
+# bcrypt é só CPU (~0,25 s por hash no custo 12). Rodando direto na thread da
+# requisição, um pico de logins ocupa todas as threads do worker e o feed
+# para junto. Aqui todo hash passa por um pool próprio de SENHAS_WORKERS
+# threads (o bcrypt solta o GIL, então cada uma usa um núcleo), com no máximo
+# SENHAS_FILA_MAXIMA pedidos esperando: além disso a requisição recebe 503
+# na hora em vez de segurar uma thread.
+
+class SenhasOcupadas(Exception):
+    """Pool de hash cheio ou lento demais."""
+
+
+class PoolSenhas:
+    def __init__(self, quantidade_workers, fila_maxima, espera):
+        self.executor = ThreadPoolExecutor(quantidade_workers, thread_name_prefix='senhas')
+        self.vagas = threading.BoundedSemaphore(quantidade_workers + fila_maxima)
+        self.espera = espera
+
+    def executar(self, funcao, *argumentos):
+        if not self.vagas.acquire(blocking=False):
+            raise SenhasOcupadas()
+
+        # A vaga só volta quando o hash termina, mesmo se quem pediu desistiu
+        futuro = self.executor.submit(funcao, *argumentos)
+        futuro.add_done_callback(lambda _: self.vagas.release())
+
+        try:
+            return futuro.result(timeout=self.espera)
+        except TimeoutFuturo:
+            raise SenhasOcupadas()
+
+
+pool = PoolSenhas(
+    app.config['SENHAS_WORKERS'],
+    app.config['SENHAS_FILA_MAXIMA'],
+    app.config['SENHAS_ESPERA']
+)
+
+
+# ===============================
+# SENHAS
+# ===============================
+def gerar_hash(senha):
+    """Hash no custo atual (BCRYPT_LOG_ROUNDS)."""
+    return pool.executar(bcrypt.generate_password_hash, senha, app.config['BCRYPT_LOG_ROUNDS']).decode()
+
+
+def custo_do_hash(hash_senha):
+    """'$2b$12$...' -> 12; None se não for um hash bcrypt."""
+    try:
+        return int(hash_senha.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def precisa_rehash(hash_senha):
+    return custo_do_hash(hash_senha) != app.config['BCRYPT_LOG_ROUNDS']
+
+
+_hash_ficticio = None
+
+
+def _hash_para_usuario_inexistente():
+    # Conferir contra este hash quando o e-mail não existe gasta o mesmo
+    # tempo de uma senha errada (não revela quais e-mails têm conta)
+    global _hash_ficticio
+    if _hash_ficticio is None or precisa_rehash(_hash_ficticio):
+        _hash_ficticio = gerar_hash('senha-ficticia')
+    return _hash_ficticio
+
+
+def autenticar(usuario, senha):
+    """
+    Confere a senha do usuário (None = e-mail não encontrado). Se o hash
+    guardado foi gerado com outro custo, troca pelo atual; quem chama faz o
+    commit.
+    """
+    if usuario is None:
+        pool.executar(bcrypt.check_password_hash, _hash_para_usuario_inexistente(), senha)
+        return False
+
+    if not pool.executar(bcrypt.check_password_hash, usuario.senha, senha):
+        return False
+
+    if precisa_rehash(usuario.senha):
+        usuario.senha = gerar_hash(senha)
+
+    return True
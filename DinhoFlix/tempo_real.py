@@ -0,0 +1,185 @@
+import json
+import queue
+import threading
+import time
+
+from flask import Response
+
+from DinhoFlix import app
+
+
+# ===============================
+# TEMPO REAL (SERVER-SENT EVENTS)
+# ===============================
+# Cada aba abre uma única conexão em /eventos?itens=video:1,post:7,... com
+# os itens que estão na tela e recebe, para eles:
+#   likes               -> {tipo, id, total_likes}
+#   comentario          -> {tipo, id, comentario_id, html, total_comentarios}
+#   comentario_apagado  -> {tipo, id, comentario_id, total_comentarios}
+# Quando os itens na tela mudam (ex.: "carregar mais"), o navegador reconecta
+# com a lista nova.
+#
+# Cada conexão aberta ocupa uma thread do worker (gthread) parada na fila.
+# O limite por processo (TEMPO_REAL_MAX_CONEXOES) é somado às threads do
+# gunicorn no Procfile: as páginas continuam com as GUNICORN_THREADS delas e
+# cada aba aberta custa uma thread ociosa (a pilha, sem conexão do banco).
+# Acima do limite a aba fica sem tempo real e tenta de novo depois.
+
+TAMANHO_FILA = 100
+
+
+class Assinatura:
+    def __init__(self, canais):
+        self.canais = canais
+        self.fila = queue.Queue(maxsize=TAMANHO_FILA)
+
+    def entregar(self, evento, dados):
+        try:
+            self.fila.put_nowait((evento, dados))
+        except queue.Full:
+            # Cliente lento: perde o evento, o próximo traz o total atualizado
+            pass
+
+
+# ===============================
+# BARRAMENTOS (PUB/SUB)
+# ===============================
+class BarramentoMemoria:
+    """Pub/sub dentro do processo: só alcança conexões deste worker."""
+
+    def __init__(self):
+        self.assinaturas = {}  # canal -> set(Assinatura)
+        self.trava = threading.Lock()
+        self.conexoes = 0
+
+    def assinar(self, canais):
+        assinatura = Assinatura(canais)
+        with self.trava:
+            if self.conexoes >= app.config['TEMPO_REAL_MAX_CONEXOES']:
+                return None
+            self.conexoes += 1
+            for canal in canais:
+                self.assinaturas.setdefault(canal, set()).add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura):
+        with self.trava:
+            self.conexoes -= 1
+            for canal in assinatura.canais:
+                inscritos = self.assinaturas.get(canal)
+                if inscritos is not None:
+                    inscritos.discard(assinatura)
+                    if not inscritos:
+                        del self.assinaturas[canal]
+
+    def _distribuir(self, canal, evento, dados):
+        with self.trava:
+            inscritos = list(self.assinaturas.get(canal, ()))
+        for assinatura in inscritos:
+            assinatura.entregar(evento, dados)
+
+    def publicar(self, canal, evento, dados):
+        self._distribuir(canal, evento, dados)
+
+
+class BarramentoRedis(BarramentoMemoria):
+    """
+    Publica num canal do Redis; cada worker tem uma thread ouvindo esse
+    canal e repassa os eventos às conexões locais. Serve qualquer cliente
+    com a interface do redis-py (publish / pubsub).
+    """
+
+    def __init__(self, cliente, canal_redis='dinhoflix:eventos'):
+        super().__init__()
+        self.cliente = cliente
+        self.canal_redis = canal_redis
+        self.ouvinte = None
+
+    def _iniciar_ouvinte(self):
+        with self.trava:
+            if self.ouvinte is not None:
+                return
+            self.ouvinte = threading.Thread(target=self._ouvir, name='tempo-real', daemon=True)
+            self.ouvinte.start()
+
+    def _ouvir(self):
+        while True:
+            try:
+                pubsub = self.cliente.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.canal_redis)
+                for mensagem in pubsub.listen():
+                    if mensagem.get('type') != 'message':
+                        continue
+                    canal, evento, dados = json.loads(mensagem['data'])
+                    self._distribuir(canal, evento, dados)
+            except Exception:
+                app.logger.exception('Conexão de tempo real com o Redis caiu; reconectando')
+                time.sleep(1)
+
+    def assinar(self, canais):
+        self._iniciar_ouvinte()
+        return super().assinar(canais)
+
+    def publicar(self, canal, evento, dados):
+        self.cliente.publish(self.canal_redis, json.dumps([canal, evento, dados]))
+
+
+def criar_barramento():
+    if app.config['TEMPO_REAL_BROKER'] == 'redis':
+        import redis  # dependência opcional, só para vários workers/servidores
+        return BarramentoRedis(redis.Redis.from_url(app.config['TEMPO_REAL_REDIS_URL']))
+    return BarramentoMemoria()
+
+
+# Trocável em tempo de execução, como o cache
+barramento = criar_barramento()
+
+
+# ===============================
+# PUBLICAÇÃO / CONEXÃO
+# ===============================
+def publicar(tipo, conteudo_id, evento, **dados):
+    """Chamado depois do commit; falhas aqui nunca derrubam a requisição."""
+    try:
+        barramento.publicar(f'{tipo}:{conteudo_id}', evento, {'tipo': tipo, 'id': conteudo_id, **dados})
+    except Exception:
+        app.logger.exception('Falha ao publicar evento %s de %s:%s', evento, tipo, conteudo_id)
+
+
+def _formatar(evento, dados):
+    return f'event: {evento}\ndata: {json.dumps(dados)}\n\n'
+
+
+def resposta_eventos(canais):
+    assinatura = barramento.assinar(canais)
+    if assinatura is None:
+        return Response('Muitas conexões de tempo real', status=503, headers={'Retry-After': '30'})
+
+    intervalo = app.config['TEMPO_REAL_HEARTBEAT']
+    duracao = app.config['TEMPO_REAL_DURACAO']
+
+    def fluxo():
+        try:
+            # O navegador reconecta sozinho quando a resposta termina
+            yield 'retry: 3000\n\n'
+
+            fim = time.monotonic() + duracao
+            while time.monotonic() < fim:
+                try:
+                    evento, dados = assinatura.fila.get(timeout=intervalo)
+                except queue.Empty:
+                    # Mantém proxies e o próprio navegador sabendo que a conexão vive
+                    yield ': ping\n\n'
+                    continue
+                yield _formatar(evento, dados)
+        finally:
+            barramento.cancelar(assinatura)
+
+    return Response(
+        fluxo(),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',  # nginx: não segurar o stream em buffer
+        }
+    )
@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import time
+from contextlib import contextmanager
+
+from DinhoFlix import app
+from DinhoFlix.armazenamento import guardar
+
+
+# ===============================
+# UPLOAD EM PARTES (RETOMÁVEL)
+# ===============================
+# Cada sessão é uma pasta em instance/uploads/<id> com:
+#   sessao.json  -> dados do vídeo e do arquivo
+#   <n>.parte    -> partes já recebidas e conferidas (sha256)
+#   concluindo   -> marca de uma conclusão em andamento
+#   conclusao.json -> resultado da conclusão (o vídeo publicado)
+# Uma parte só ganha o nome final depois de conferida, então listar a pasta
+# diz exatamente o que falta enviar, mesmo após uma conexão cair no meio.
+
+TAMANHO_BLOCO = 64 * 1024
+
+# Marca de conclusão mais velha que isso é de um processo que caiu no meio
+VALIDADE_CONCLUSAO = 15 * 60
+
+
+class ErroUpload(Exception):
+    def __init__(self, mensagem, status=400):
+        super().__init__(mensagem)
+        self.mensagem = mensagem
+        self.status = status
+
+
+def _pasta_uploads():
+    return os.path.join(app.instance_path, 'uploads')
+
+
+def _pasta_sessao(sessao_id):
+    # ids são sempre hex; qualquer outra coisa é rejeitada antes de virar caminho
+    if not sessao_id or not all(c in '0123456789abcdef' for c in sessao_id):
+        raise ErroUpload('Sessão de upload inválida', 404)
+    return os.path.join(_pasta_uploads(), sessao_id)
+
+
+def _caminho_parte(sessao_id, numero):
+    return os.path.join(_pasta_sessao(sessao_id), f'{numero}.parte')
+
+
+# ===============================
+# SESSÃO
+# ===============================
+def criar_sessao(usuario_id, titulo, descricao, nome_arquivo, tamanho, thumbnail=None):
+    extensao = os.path.splitext(nome_arquivo)[1].lower()
+    if extensao not in ('.mp4', '.mov'):
+        raise ErroUpload('Apenas arquivos .mp4 ou .mov')
+
+    if tamanho <= 0 or tamanho > app.config['UPLOAD_VIDEO_TAMANHO_MAXIMO']:
+        raise ErroUpload('Tamanho de arquivo inválido', 413)
+
+    sessao_id = secrets.token_hex(16)
+    pasta = _pasta_sessao(sessao_id)
+    os.makedirs(pasta)
+
+    tamanho_parte = app.config['UPLOAD_TAMANHO_PARTE']
+    sessao = {
+        'id': sessao_id,
+        'usuario_id': usuario_id,
+        'titulo': titulo,
+        'descricao': descricao,
+        'extensao': extensao,
+        'tamanho': tamanho,
+        'tamanho_parte': tamanho_parte,
+        'total_partes': -(-tamanho // tamanho_parte),
+        'thumbnail': None,
+    }
+
+    if thumbnail:
+        sessao['thumbnail'] = 'capa' + os.path.splitext(thumbnail.filename)[1].lower()
+        thumbnail.save(os.path.join(pasta, sessao['thumbnail']))
+
+    with open(os.path.join(pasta, 'sessao.json'), 'w') as arquivo:
+        json.dump(sessao, arquivo)
+
+    return sessao
+
+
+def carregar_sessao(sessao_id, usuario_id):
+    try:
+        with open(os.path.join(_pasta_sessao(sessao_id), 'sessao.json')) as arquivo:
+            sessao = json.load(arquivo)
+    except FileNotFoundError:
+        raise ErroUpload('Sessão de upload não encontrada', 404)
+
+    if sessao['usuario_id'] != usuario_id:
+        raise ErroUpload('Sessão de upload não encontrada', 404)
+
+    return sessao
+
+
+def partes_recebidas(sessao):
+    recebidas = []
+    for nome in os.listdir(_pasta_sessao(sessao['id'])):
+        if nome.endswith('.parte'):
+            recebidas.append(int(nome.split('.')[0]))
+    return sorted(recebidas)
+
+
+def resumo_sessao(sessao):
+    return {
+        'id': sessao['id'],
+        'tamanho_parte': sessao['tamanho_parte'],
+        'total_partes': sessao['total_partes'],
+        'recebidas': partes_recebidas(sessao),
+        'conclusao': resultado_conclusao(sessao),
+    }
+
+
+# ===============================
+# PARTES
+# ===============================
+def tamanho_esperado(sessao, numero):
+    if numero == sessao['total_partes'] - 1:
+        return sessao['tamanho'] - numero * sessao['tamanho_parte']
+    return sessao['tamanho_parte']
+
+
+def gravar_parte(sessao, numero, fluxo, tamanho, sha256_esperado):
+    """
+    Copia o corpo da requisição direto para o disco em blocos de 64 KB,
+    calculando o sha256 no caminho. Memória usada não depende do tamanho.
+    """
+    if not 0 <= numero < sessao['total_partes']:
+        raise ErroUpload('Número de parte inválido')
+
+    # Sem Content-Length (ex.: chunked) não dá para recusar antes de ler
+    if tamanho is None:
+        raise ErroUpload('Cabeçalho Content-Length obrigatório', 411)
+
+    if tamanho != tamanho_esperado(sessao, numero):
+        raise ErroUpload('Tamanho da parte não confere')
+
+    if not sha256_esperado:
+        raise ErroUpload('Cabeçalho X-Parte-SHA256 obrigatório')
+
+    destino = _caminho_parte(sessao['id'], numero)
+    temporario = destino + f'.{secrets.token_hex(4)}.tmp'
+    resumo = hashlib.sha256()
+    restante = tamanho
+
+    try:
+        with open(temporario, 'wb') as arquivo:
+            while restante:
+                bloco = fluxo.read(min(TAMANHO_BLOCO, restante))
+                if not bloco:
+                    raise ErroUpload('Parte incompleta')
+                resumo.update(bloco)
+                arquivo.write(bloco)
+                restante -= len(bloco)
+
+        if resumo.hexdigest() != sha256_esperado.lower():
+            raise ErroUpload('Checksum da parte não confere', 422)
+
+        os.replace(temporario, destino)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+
+# ===============================
+# CONCLUSÃO
+# ===============================
+def montar_arquivo(sessao):
+    """
+    Junta as partes, em ordem e em blocos, no arquivo final do vídeo (em
+    videos/, ver armazenamento.guardar); devolve o nome.
+    """
+    faltando = set(range(sessao['total_partes'])) - set(partes_recebidas(sessao))
+    if faltando:
+        raise ErroUpload(f'Faltam {len(faltando)} parte(s)', 409)
+
+    destino = os.path.join(_pasta_sessao(sessao['id']), 'video' + sessao['extensao'])
+    resumo = hashlib.sha256()
+
+    with open(destino, 'wb') as saida:
+        for numero in range(sessao['total_partes']):
+            with open(_caminho_parte(sessao['id'], numero), 'rb') as parte:
+                for bloco in iter(lambda: parte.read(TAMANHO_BLOCO), b''):
+                    resumo.update(bloco)
+                    saida.write(bloco)
+
+    return guardar('videos', destino, sessao['extensao'], resumo.hexdigest())
+
+
+@contextmanager
+def concluindo(sessao):
+    """
+    Uma conclusão por sessão de cada vez: a marca é criada com O_EXCL e
+    sai no fim, deu certo ou não (para o cliente poder tentar de novo).
+    """
+    marca = os.path.join(_pasta_sessao(sessao['id']), 'concluindo')
+
+    for _ in range(2):
+        try:
+            os.close(os.open(marca, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(marca) < VALIDADE_CONCLUSAO:
+                    raise ErroUpload('O upload já está sendo concluído', 409)
+                os.remove(marca)
+            except FileNotFoundError:
+                pass  # a outra conclusão acabou agora; tenta de novo
+    else:
+        raise ErroUpload('O upload já está sendo concluído', 409)
+
+    try:
+        yield
+    finally:
+        os.remove(marca)
+
+
+def resultado_conclusao(sessao):
+    """O que a conclusão devolveu, se a sessão já foi concluída."""
+    try:
+        with open(os.path.join(_pasta_sessao(sessao['id']), 'conclusao.json')) as arquivo:
+            return json.load(arquivo)
+    except FileNotFoundError:
+        return None
+
+
+def registrar_conclusao(sessao, resultado):
+    """
+    Chamado depois do commit do vídeo: guarda o resultado (repetições do
+    POST recebem o mesmo) e apaga as partes. O resto da pasta sai no
+    limpar-uploads.
+    """
+    pasta = _pasta_sessao(sessao['id'])
+    temporario = os.path.join(pasta, 'conclusao.json.tmp')
+    with open(temporario, 'w') as arquivo:
+        json.dump(resultado, arquivo)
+    os.replace(temporario, os.path.join(pasta, 'conclusao.json'))
+
+    for nome in os.listdir(pasta):
+        if nome.endswith('.parte') or nome == 'video' + sessao['extensao'] or nome == sessao['thumbnail']:
+            os.remove(os.path.join(pasta, nome))
+
+
+def caminho_capa(sessao):
+    if not sessao['thumbnail']:
+        return None
+    return os.path.join(_pasta_sessao(sessao['id']), sessao['thumbnail'])
+
+
+@app.cli.command('limpar-uploads')
+def limpar_uploads():
+    """Apaga sessões de upload abandonadas ou concluídas (sem atividade há mais de 24h)."""
+    pasta = _pasta_uploads()
+    if not os.path.isdir(pasta):
+        return
+
+    limite = time.time() - 24 * 3600
+    removidas = 0
+    for nome in os.listdir(pasta):
+        caminho = os.path.join(pasta, nome)
+        if os.path.isdir(caminho) and os.path.getmtime(caminho) < limite:
+            shutil.rmtree(caminho, ignore_errors=True)
+            removidas += 1
+
+    print(f"✅ {removidas} sessão(ões) de upload removida(s).")
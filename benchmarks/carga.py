@@ -0,0 +1,305 @@
+"""
+Gera carga nas rotas principais e mede latência (p50/p90/p99), vazão e
+consultas SQL por requisição. Roda sem rede externa, em dois modos:
+
+  - dentro do processo (padrão): a aplicação com o DATABASE_URL atual,
+    via test client do Flask, uma thread por usuário simulado;
+  - --url http://127.0.0.1:8000: contra um servidor já rodando (gunicorn),
+    para medir a pilha inteira.
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.popular --escala 100000
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.carga --concorrencia 8 --duracao 30
+
+Os usuários simulados curtem e comentam bem mais rápido que uma pessoa:
+para medir capacidade, rode o servidor (ou este processo) com LIMITES_TIPO=
+vazio, senão boa parte vira 429 (limites.py) e entra na coluna de erros.
+
+As consultas por requisição vêm de /metrics (metricas.py), lidas antes e
+depois da rodada. Os usuários simulados são os usuario1..N criados por
+popular.py.
+"""
+import argparse
+import http.cookiejar
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+SENHA = 'benchmark'
+
+# cenário -> (endpoint do Flask, peso na mistura padrão)
+CENARIOS = {
+    'home': ('home', 30),
+    'explorar': ('explorar', 20),
+    'curtir': ('curtir', 20),
+    'comentar': ('comentar', 10),
+    'login': ('login', 5),
+    'media_video': ('media_video', 15),
+}
+
+
+# ===============================
+# CLIENTES HTTP
+# ===============================
+class ClienteLocal:
+    """Test client do Flask: mesma aplicação, sem servidor."""
+
+    def __init__(self, app):
+        self.cliente = app.test_client()
+
+    def requisitar(self, metodo, caminho, dados=None, cabecalhos=None):
+        # Fechar a resposta é o que registra as métricas das páginas em partes
+        with self.cliente.open(caminho, method=metodo, data=dados, headers=cabecalhos or {}) as resposta:
+            return resposta.status_code, resposta.get_data()
+
+
+class ClienteRemoto:
+    """urllib com cookies, contra um servidor de verdade."""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.abridor = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()),
+            _SemRedirecionar,
+        )
+
+    def requisitar(self, metodo, caminho, dados=None, cabecalhos=None):
+        corpo = urllib.parse.urlencode(dados).encode() if dados is not None else None
+        pedido = urllib.request.Request(self.url + caminho, data=corpo, method=metodo, headers=cabecalhos or {})
+        try:
+            with self.abridor.open(pedido, timeout=60) as resposta:
+                return resposta.status, resposta.read()
+        except urllib.error.HTTPError as erro:
+            return erro.code, erro.read()
+
+
+class _SemRedirecionar(urllib.request.HTTPRedirectHandler):
+    # Mede a rota pedida, não a página para onde ela redireciona
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+# ===============================
+# USUÁRIO SIMULADO
+# ===============================
+def _csrf(html):
+    achado = re.search(rb'name="csrf-token" content="([^"]+)"', html) or \
+        re.search(rb'name="csrf_token" type="hidden" value="([^"]+)"', html)
+    return achado.group(1).decode() if achado else ''
+
+
+class Usuario:
+    def __init__(self, cliente, numero, sorteio, maximo_id, video_mb):
+        self.cliente = cliente
+        self.video_mb = video_mb
+        self.email = f'usuario{numero}@benchmark.dinhoflix.com'
+        self.sorteio = sorteio
+        self.maximo_id = maximo_id
+        self.token = ''
+
+    def entrar(self):
+        _, html = self.cliente.requisitar('GET', '/login')
+        status, _ = self.cliente.requisitar('POST', '/login', {
+            'csrf_token': _csrf(html),
+            'email': self.email,
+            'senha': SENHA,
+            'botao_submit_fazerlogin': '1',
+        })
+        # Token da sessão logada, para os POSTs via fetch (X-CSRFToken)
+        _, html = self.cliente.requisitar('GET', '/')
+        self.token = _csrf(html)
+        return status
+
+    def _item(self):
+        return self.sorteio.choice(('video', 'post', 'depoimento')), self.sorteio.randint(1, self.maximo_id)
+
+    def executar(self, cenario):
+        if cenario == 'home':
+            return self.cliente.requisitar('GET', '/')[0]
+        if cenario == 'explorar':
+            tipo = self.sorteio.choice(('videos', 'posts', 'relatos'))
+            return self.cliente.requisitar('GET', f'/explorar/{tipo}')[0]
+        if cenario == 'curtir':
+            tipo, conteudo_id = self._item()
+            return self.cliente.requisitar('POST', f'/curtir/{tipo}/{conteudo_id}', {}, {'X-CSRFToken': self.token})[0]
+        if cenario == 'comentar':
+            tipo, conteudo_id = self._item()
+            return self.cliente.requisitar(
+                'POST', f'/comentario/{tipo}/{conteudo_id}',
+                {'texto': 'comentário de carga'}, {'X-CSRFToken': self.token}
+            )[0]
+        if cenario == 'login':
+            return self.entrar()
+        if cenario == 'media_video':
+            # Como um player: um pedaço de 1 MB a partir de um ponto qualquer
+            inicio = self.sorteio.randrange(self.video_mb) * 1024 * 1024
+            return self.cliente.requisitar(
+                'GET', '/media/videos/benchmark.mp4', cabecalhos={'Range': f'bytes={inicio}-{inicio + 1024 * 1024 - 1}'}
+            )[0]
+        raise ValueError(cenario)
+
+
+# ===============================
+# MÉTRICAS DO SERVIDOR
+# ===============================
+def _ler_metricas(cliente, token):
+    """{(nome, endpoint): valor} dos contadores por endpoint de /metrics."""
+    status, texto = cliente.requisitar('GET', '/metrics', cabecalhos={'Authorization': f'Bearer {token}'} if token else {})
+    if status != 200:
+        return {}
+
+    valores = defaultdict(float)
+    for nome, endpoint, valor in re.findall(
+        r'^dinhoflix_(requisicoes_total|sql_consultas_total|sql_segundos_total)\{endpoint="([^"]+)"[^}]*\} (\S+)$',
+        texto.decode(), re.MULTILINE
+    ):
+        valores[(nome, endpoint)] += float(valor)
+    return valores
+
+
+def _percentil(ordenados, fracao):
+    if not ordenados:
+        return 0.0
+    return ordenados[min(int(len(ordenados) * fracao), len(ordenados) - 1)]
+
+
+# ===============================
+# EXECUÇÃO
+# ===============================
+def rodar(criar_cliente, cenarios, concorrencia, duracao, aquecimento, maximo_id, video_mb, semente, token):
+    nomes = list(cenarios)
+    pesos = [CENARIOS[nome][1] for nome in nomes]
+
+    usuarios = []
+    for numero in range(1, concorrencia + 1):
+        usuario = Usuario(criar_cliente(), numero, random.Random(semente + numero), maximo_id, video_mb)
+        usuario.entrar()
+        usuarios.append(usuario)
+
+    latencias = defaultdict(list)
+    erros = defaultdict(int)
+    trava = threading.Lock()
+    medir = threading.Event()
+    parar = threading.Event()
+
+    def trabalhar(usuario):
+        while not parar.is_set():
+            cenario = usuario.sorteio.choices(nomes, pesos)[0]
+            inicio = time.perf_counter()
+            try:
+                status = usuario.executar(cenario)
+            except Exception:
+                status = None
+            duracao_requisicao = time.perf_counter() - inicio
+
+            if medir.is_set():
+                with trava:
+                    latencias[cenario].append(duracao_requisicao)
+                    if status is None or status >= 400:
+                        erros[cenario] += 1
+
+    threads = [threading.Thread(target=trabalhar, args=(usuario,), daemon=True) for usuario in usuarios]
+    for thread in threads:
+        thread.start()
+
+    time.sleep(aquecimento)
+    antes = _ler_metricas(criar_cliente(), token)
+    medir.set()
+    inicio = time.perf_counter()
+    time.sleep(duracao)
+    medir.clear()
+    decorrido = time.perf_counter() - inicio
+    depois = _ler_metricas(criar_cliente(), token)
+    parar.set()
+    for thread in threads:
+        thread.join()
+
+    resultado = {}
+    for cenario in nomes:
+        ordenadas = sorted(latencias[cenario])
+        endpoint = CENARIOS[cenario][0]
+        requisicoes_servidor = depois.get(('requisicoes_total', endpoint), 0) - antes.get(('requisicoes_total', endpoint), 0)
+        consultas = depois.get(('sql_consultas_total', endpoint), 0) - antes.get(('sql_consultas_total', endpoint), 0)
+        tempo_sql = depois.get(('sql_segundos_total', endpoint), 0) - antes.get(('sql_segundos_total', endpoint), 0)
+
+        resultado[cenario] = {
+            'requisicoes': len(ordenadas),
+            'erros': erros[cenario],
+            'por_segundo': len(ordenadas) / decorrido,
+            'p50_ms': _percentil(ordenadas, 0.50) * 1000,
+            'p90_ms': _percentil(ordenadas, 0.90) * 1000,
+            'p99_ms': _percentil(ordenadas, 0.99) * 1000,
+            'max_ms': (ordenadas[-1] if ordenadas else 0) * 1000,
+            'consultas_por_requisicao': consultas / requisicoes_servidor if requisicoes_servidor else None,
+            'sql_ms_por_requisicao': tempo_sql * 1000 / requisicoes_servidor if requisicoes_servidor else None,
+        }
+
+    total = sum(len(valores) for valores in latencias.values())
+    resultado['_total'] = {'requisicoes': total, 'por_segundo': total / decorrido, 'segundos': decorrido}
+    return resultado
+
+
+def imprimir(resultado):
+    print(f"{'cenário':<12} {'req':>7} {'erros':>6} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8} {'SQL/req':>8} {'SQL ms':>7}")
+    for cenario, dados in resultado.items():
+        if cenario.startswith('_'):
+            continue
+        consultas = dados['consultas_por_requisicao']
+        tempo_sql = dados['sql_ms_por_requisicao']
+        print(
+            f"{cenario:<12} {dados['requisicoes']:>7} {dados['erros']:>6} {dados['por_segundo']:>8.1f} "
+            f"{dados['p50_ms']:>8.1f} {dados['p90_ms']:>8.1f} {dados['p99_ms']:>8.1f} {dados['max_ms']:>8.1f} "
+            f"{'-' if consultas is None else f'{consultas:.1f}':>8} {'-' if tempo_sql is None else f'{tempo_sql:.1f}':>7}"
+        )
+    total = resultado['_total']
+    print(f"total: {total['requisicoes']} requisições em {total['segundos']:.1f}s ({total['por_segundo']:.1f} req/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='servidor já rodando; sem isso, roda dentro do processo')
+    parser.add_argument('--cenarios', default=','.join(CENARIOS), help=f'subconjunto de {",".join(CENARIOS)}')
+    parser.add_argument('--concorrencia', type=int, default=8, help='usuários simultâneos')
+    parser.add_argument('--duracao', type=float, default=20, help='segundos medidos')
+    parser.add_argument('--aquecimento', type=float, default=3, help='segundos antes de medir')
+    parser.add_argument('--escala', type=int, default=10_000, help='a mesma usada em popular.py')
+    parser.add_argument('--video-mb', type=int, default=8, help='o mesmo usado em popular.py')
+    parser.add_argument('--semente', type=int, default=42)
+    parser.add_argument('--token-metricas', help='METRICAS_TOKEN do servidor, se configurado')
+    parser.add_argument('--json', help='grava o resultado neste arquivo (para comparar rodadas)')
+    argumentos = parser.parse_args()
+
+    cenarios = [nome for nome in argumentos.cenarios.split(',') if nome]
+    desconhecidos = set(cenarios) - set(CENARIOS)
+    if desconhecidos:
+        parser.error(f'cenários desconhecidos: {", ".join(sorted(desconhecidos))}')
+
+    if argumentos.url:
+        def criar_cliente():
+            return ClienteRemoto(argumentos.url)
+    else:
+        from DinhoFlix import app
+        app.logger.setLevel('ERROR')  # sem um aviso por requisição lenta no meio da tabela
+
+        def criar_cliente():
+            return ClienteLocal(app)
+
+    resultado = rodar(
+        criar_cliente, cenarios, argumentos.concorrencia, argumentos.duracao, argumentos.aquecimento,
+        argumentos.escala, argumentos.video_mb, argumentos.semente, argumentos.token_metricas
+    )
+    imprimir(resultado)
+
+    if argumentos.json:
+        with open(argumentos.json, 'w') as arquivo:
+            json.dump(resultado, arquivo, indent=2)
+
+
+if __name__ == '__main__':
+    main()
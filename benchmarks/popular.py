@@ -0,0 +1,212 @@
+"""
+Popula o banco configurado em DATABASE_URL com dados sintéticos para os
+benchmarks (ver carga.py). Tudo é gerado localmente, sem rede:
+
+    DATABASE_URL=sqlite:////tmp/bench.db python -m benchmarks.popular --escala 100000
+
+--escala é o número de vídeos, de posts e de depoimentos. A partir dela:
+usuários = escala / 10, likes = 3 x escala, comentários = 2 x escala
+(escala 10k ~ 100k linhas; escala 1M ~ 9M linhas).
+
+Todos os usuários entram com a senha SENHA; o e-mail é
+usuarioN@benchmark.dinhoflix.com.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from PIL import Image
+from sqlalchemy import func, insert, select, text
+
+from DinhoFlix import app, bcrypt, busca, database, imagens
+from DinhoFlix.armazenamento import guardar_derivado, info, temporario
+from DinhoFlix.interacoes import recalcular_contadores
+from DinhoFlix.migracoes import aplicar_migracoes
+from DinhoFlix.models import Comentario, Depoimento, Like, Post, Usuario, Video
+
+SENHA = 'benchmark'
+ARQUIVO_VIDEO = 'benchmark.mp4'
+THUMBNAIL = 'benchmark.jpg'
+TAMANHO_LOTE = 5000
+
+PALAVRAS = (
+    'vídeo filme série trailer música show jogo viagem receita aula tutorial '
+    'comédia drama documentário entrevista bastidores cena episódio final '
+    'temporada estreia crítica resenha favorito clássico novo antigo'
+).split()
+
+
+def _frase(sorteio, minimo, maximo):
+    return ' '.join(sorteio.choices(PALAVRAS, k=sorteio.randint(minimo, maximo))).capitalize()
+
+
+def _inserir(modelo, linhas):
+    """INSERT em lotes (executemany), sem passar pelo ORM."""
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= TAMANHO_LOTE:
+            database.session.execute(insert(modelo), lote)
+            lote = []
+    if lote:
+        database.session.execute(insert(modelo), lote)
+    database.session.commit()
+
+
+def _proximo_id(modelo):
+    return (database.session.execute(select(func.max(modelo.id))).scalar() or 0) + 1
+
+
+def _ajustar_sequencia(modelo):
+    """Os ids são gerados aqui; no PostgreSQL a sequência precisa acompanhar."""
+    if database.engine.dialect.name == 'postgresql':
+        tabela = modelo.__tablename__
+        database.session.execute(text(
+            f"SELECT setval(pg_get_serial_sequence('\"{tabela}\"', 'id'), max(id)) FROM \"{tabela}\""
+        ))
+        database.session.commit()
+
+
+def _datas(quantidade, dias=365):
+    """Datas crescentes até agora, na ordem dos ids (como no uso real)."""
+    agora = datetime.now(timezone.utc)
+    passo = timedelta(days=dias) / max(quantidade, 1)
+    return (agora - passo * (quantidade - posicao) for posicao in range(quantidade))
+
+
+# ===============================
+# ARQUIVOS DE MÍDIA
+# ===============================
+def criar_midia(tamanho_mb):
+    """
+    Um vídeo (bytes aleatórios) e uma thumbnail com variantes, compartilhados
+    por todos os vídeos. Nomes fixos: ficam fora da contagem de referências.
+    """
+    video = info(f'videos/{ARQUIVO_VIDEO}')
+    if video is None or video[0] != tamanho_mb * 1024 * 1024:
+        with temporario('.mp4') as caminho:
+            with open(caminho, 'wb') as arquivo:
+                for _ in range(tamanho_mb):
+                    arquivo.write(os.urandom(1024 * 1024))
+            guardar_derivado(f'videos/{ARQUIVO_VIDEO}', caminho)
+
+    if info(f'thumbnails/{THUMBNAIL}') is None:
+        with temporario('.jpg') as caminho:
+            Image.new('RGB', (1280, 720), (20, 20, 30)).save(caminho, 'JPEG')
+            guardar_derivado(f'thumbnails/{THUMBNAIL}', caminho)
+        imagens.gerar_variantes('thumbnails', THUMBNAIL)
+
+
+# ===============================
+# TABELAS
+# ===============================
+def popular(escala, sorteio):
+    quantidade_usuarios = max(escala // 10, 10)
+    quantidade_likes = escala * 3
+    quantidade_comentarios = escala * 2
+
+    inicio = time.perf_counter()
+
+    def etapa(nome, quantidade=None):
+        linhas = '' if quantidade is None else f': {quantidade} linhas'
+        print(f'  {nome}{linhas} ({time.perf_counter() - inicio:.1f}s)')
+
+    # Um hash só: bcrypt por usuário levaria horas em escala 1M
+    senha = bcrypt.generate_password_hash(SENHA).decode()
+    primeiro_usuario = _proximo_id(Usuario)
+    _inserir(Usuario, (
+        {
+            'id': usuario_id,
+            'username': f'usuario{usuario_id}',
+            'email': f'usuario{usuario_id}@benchmark.dinhoflix.com',
+            'senha': senha,
+        }
+        for usuario_id in range(primeiro_usuario, primeiro_usuario + quantidade_usuarios)
+    ))
+    usuarios = range(primeiro_usuario, primeiro_usuario + quantidade_usuarios)
+    _ajustar_sequencia(Usuario)
+    etapa('usuario', quantidade_usuarios)
+
+    faixas = {}
+    for modelo, colunas in (
+        (Video, lambda: {
+            'descricao': _frase(sorteio, 10, 40),
+            'arquivo_video': ARQUIVO_VIDEO,
+            'thumbnail': THUMBNAIL,
+            'status': 'pronto',
+        }),
+        (Post, lambda: {'corpo': _frase(sorteio, 30, 120)}),
+        (Depoimento, lambda: {'corpo': _frase(sorteio, 30, 120)}),
+    ):
+        primeiro = _proximo_id(modelo)
+        _inserir(modelo, (
+            {
+                'id': conteudo_id,
+                'titulo': _frase(sorteio, 2, 6),
+                'data_criacao': data,
+                'usuario_id': sorteio.choice(usuarios),
+                **colunas(),
+            }
+            for conteudo_id, data in zip(range(primeiro, primeiro + escala), _datas(escala))
+        ))
+        _ajustar_sequencia(modelo)
+        faixas[modelo.__tablename__] = range(primeiro, primeiro + escala)
+        etapa(modelo.__tablename__, escala)
+
+    # Likes concentrados nos itens mais novos (distribuição de cauda longa)
+    def item_sorteado():
+        tipo = sorteio.choice(list(faixas))
+        faixa = faixas[tipo]
+        return tipo, faixa[-1 - min(int(sorteio.expovariate(1 / (escala / 20))), escala - 1)]
+
+    def likes():
+        vistos = set()
+        while len(vistos) < quantidade_likes:
+            tipo, conteudo_id = item_sorteado()
+            usuario_id = sorteio.choice(usuarios)
+            if (usuario_id, tipo, conteudo_id) not in vistos:
+                vistos.add((usuario_id, tipo, conteudo_id))
+                yield {'usuario_id': usuario_id, f'{tipo}_id': conteudo_id}
+    _inserir(Like, likes())
+    etapa('like', quantidade_likes)
+
+    def comentarios():
+        for data in _datas(quantidade_comentarios):
+            tipo, conteudo_id = item_sorteado()
+            yield {
+                'texto': _frase(sorteio, 3, 25),
+                'data_criacao': data,
+                'usuario_id': sorteio.choice(usuarios),
+                f'{tipo}_id': conteudo_id,
+            }
+    _inserir(Comentario, comentarios())
+    etapa('comentario', quantidade_comentarios)
+
+    recalcular_contadores()
+    etapa('contadores, pontuação e resumo dos perfis')
+
+    busca.reindexar()
+    database.session.commit()
+    etapa('índice de busca')
+
+    print(f'✅ Banco populado em {time.perf_counter() - inicio:.1f}s. '
+          f'Login: usuario{primeiro_usuario}@benchmark.dinhoflix.com / {SENHA}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--escala', type=int, default=10_000)
+    parser.add_argument('--semente', type=int, default=42, help='mesma semente, mesmos dados')
+    parser.add_argument('--video-mb', type=int, default=8, help='tamanho do arquivo de vídeo servido')
+    argumentos = parser.parse_args()
+
+    with app.app_context():
+        aplicar_migracoes()
+        criar_midia(argumentos.video_mb)
+        popular(argumentos.escala, random.Random(argumentos.semente))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
-from DinhoFlix import app, database
+from DinhoFlix import app
+from DinhoFlix.migracoes import aplicar_migracoes
 
 with app.app_context():
-    database.create_all()
-    print("Tabelas criadas com sucesso!")
+    aplicar_migracoes()
+    print("Tabelas criadas/atualizadas com sucesso!")
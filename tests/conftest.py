@@ -0,0 +1,120 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# A aplicação lê a configuração do ambiente ao ser importada: banco próprio
+# dos testes, hash de senha barato e nada de escrita adiada
+_PASTA = tempfile.mkdtemp(prefix='dinhoflix-testes-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_PASTA, 'testes.db')
+os.environ['SENHA_CUSTO'] = '4'
+os.environ['ESCRITA_ADIADA'] = ''
+os.environ['CACHE_TIPO'] = 'memoria'
+os.environ['LIMITES_TIPO'] = 'memoria'
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from DinhoFlix import app, armazenamento, bcrypt, database  # noqa: E402
+from DinhoFlix.models import Post, Usuario  # noqa: E402
+
+app.config.update(
+    TESTING=True,
+    WTF_CSRF_ENABLED=False,
+    PROCESSAMENTO_SINCRONO=True,
+)
+
+SENHA = '123456'
+
+
+class Relogio:
+    """time.monotonic/time.time controlados pelo teste."""
+
+    def __init__(self):
+        self.agora = 1000.0
+
+    def monotonic(self):
+        return self.agora
+
+    def time(self):
+        return self.agora
+
+    def avancar(self, segundos):
+        self.agora += segundos
+
+
+@pytest.fixture(autouse=True)
+def banco_limpo():
+    with app.app_context():
+        yield
+        database.session.rollback()
+        for tabela in reversed(database.metadata.sorted_tables):
+            database.session.execute(tabela.delete())
+        database.session.commit()
+
+
+@pytest.fixture
+def relogio():
+    return Relogio()
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """ArmazenamentoS3 sobre um bucket do moto (pulado sem moto/boto3)."""
+    moto = pytest.importorskip('moto')
+    boto3 = pytest.importorskip('boto3')
+    for variavel, valor in (
+        ('AWS_ACCESS_KEY_ID', 'teste'),
+        ('AWS_SECRET_ACCESS_KEY', 'teste'),
+        ('AWS_DEFAULT_REGION', 'us-east-1'),
+    ):
+        monkeypatch.setenv(variavel, valor)
+
+    with moto.mock_aws():
+        cliente = boto3.client('s3')
+        cliente.create_bucket(Bucket='dinhoflix')
+        yield armazenamento.ArmazenamentoS3(cliente, 'dinhoflix', prefixo='midia/')
+
+
+@pytest.fixture(params=['local', 's3'])
+def midia(request, tmp_path, monkeypatch):
+    """O armazenamento em uso, numa pasta temporária ou num bucket do moto."""
+    if request.param == 's3':
+        backend = request.getfixturevalue('s3')
+    else:
+        backend = armazenamento.ArmazenamentoLocal(str(tmp_path / 'midia'))
+    monkeypatch.setattr(armazenamento, 'armazenamento', backend)
+    return backend
+
+
+@pytest.fixture
+def usuario():
+    usuario = Usuario(
+        username='teste',
+        email='teste@teste.com',
+        senha=bcrypt.generate_password_hash(SENHA).decode()
+    )
+    database.session.add(usuario)
+    database.session.commit()
+    return usuario
+
+
+@pytest.fixture
+def post(usuario):
+    post = Post(titulo='Post de teste', corpo='corpo', usuario_id=usuario.id)
+    database.session.add(post)
+    database.session.commit()
+    return post
+
+
+@pytest.fixture
+def cliente(usuario):
+    """Test client já logado como `usuario`."""
+    cliente = app.test_client()
+    resposta = cliente.post('/login', data={
+        'email': usuario.email,
+        'senha': SENHA,
+        'botao_submit_fazerlogin': '1',
+    })
+    assert resposta.status_code == 302
+    return cliente
@@ -0,0 +1,135 @@
+import io
+
+from DinhoFlix import armazenamento, database
+from DinhoFlix.midia import CACHE_IMUTAVEL
+from DinhoFlix.models import ArquivoMidia
+
+
+def _arquivo(tmp_path, nome, conteudo):
+    caminho = tmp_path / nome
+    caminho.write_bytes(conteudo)
+    return str(caminho)
+
+
+def _referencias(chave):
+    return database.session.get(ArquivoMidia, chave).referencias
+
+
+def test_mesmo_conteudo_vira_um_arquivo_so(tmp_path, midia):
+    primeiro = armazenamento.guardar('videos', _arquivo(tmp_path, 'a.mp4', b'video'), '.mp4')
+    segundo = armazenamento.guardar('videos', _arquivo(tmp_path, 'b.mp4', b'video'), '.MP4')
+    database.session.commit()
+
+    assert primeiro == segundo
+    assert [chave for chave, _, _ in midia.listar('videos/')] == [f'videos/{primeiro}']
+    assert _referencias(f'videos/{primeiro}') == 2
+    assert not (tmp_path / 'b.mp4').exists()
+
+
+def test_liberar_e_coletar_apaga_com_os_derivados(tmp_path, midia):
+    nome = armazenamento.guardar('thumbnails', _arquivo(tmp_path, 'capa.jpg', b'capa'), '.jpg')
+    armazenamento.guardar('thumbnails', _arquivo(tmp_path, 'capa2.jpg', b'capa'), '.jpg')
+    base = nome.rsplit('.', 1)[0]
+    for derivado in (f'{base}-160.webp', f'{base}-variantes.json'):
+        armazenamento.guardar_derivado(f'thumbnails/{derivado}', _arquivo(tmp_path, derivado, b'x'))
+    database.session.commit()
+
+    # Ainda referenciado por uma linha
+    armazenamento.liberar('thumbnails', nome)
+    database.session.commit()
+    assert _referencias(f'thumbnails/{nome}') == 1
+    assert armazenamento.coletar_orfaos(0) == (0, 0)
+
+    # Sem referências, mas dentro da carência
+    armazenamento.liberar('thumbnails', nome)
+    database.session.commit()
+    assert armazenamento.coletar_orfaos(3600) == (0, 0)
+    assert armazenamento.existe('thumbnails', nome)
+
+    assert armazenamento.coletar_orfaos(0) == (1, len(b'capa'))
+    assert list(midia.listar('thumbnails/')) == []
+    assert database.session.get(ArquivoMidia, f'thumbnails/{nome}') is None
+
+
+def test_liberar_nao_fica_negativo(tmp_path, midia):
+    nome = armazenamento.guardar('videos', _arquivo(tmp_path, 'a.mp4', b'video'), '.mp4')
+    database.session.commit()
+
+    for _ in range(3):
+        armazenamento.liberar('videos', nome)
+    database.session.commit()
+    assert _referencias(f'videos/{nome}') == 0
+
+
+def test_nomes_fixos_nao_sao_contados(midia):
+    armazenamento.liberar('fotos_perfil', 'default.jpg')
+    database.session.commit()
+    assert database.session.get(ArquivoMidia, 'fotos_perfil/default.jpg') is None
+
+
+def test_guardar_depois_da_coleta_grava_de_novo(tmp_path, midia):
+    nome = armazenamento.guardar('videos', _arquivo(tmp_path, 'a.mp4', b'video'), '.mp4')
+    armazenamento.liberar('videos', nome)
+    database.session.commit()
+    armazenamento.coletar_orfaos(0)
+    assert not armazenamento.existe('videos', nome)
+
+    assert armazenamento.guardar('videos', _arquivo(tmp_path, 'b.mp4', b'video'), '.mp4') == nome
+    database.session.commit()
+    assert armazenamento.existe('videos', nome)
+    assert _referencias(f'videos/{nome}') == 1
+
+
+def test_guardar_fluxo_e_ler_de_volta(midia):
+    nome = armazenamento.guardar_fluxo('videos', io.BytesIO(b'enviado em partes'), '.mp4')
+    database.session.commit()
+
+    assert armazenamento.existe('videos', nome)
+    assert not armazenamento.existe('videos', 'f' * 64 + '.mp4')
+    assert armazenamento.info(f'videos/{nome}')[0] == len(b'enviado em partes')
+    with armazenamento.caminho_local(f'videos/{nome}') as caminho:
+        with open(caminho, 'rb') as arquivo:
+            assert arquivo.read() == b'enviado em partes'
+
+
+def test_listar_so_o_prefixo(tmp_path, midia):
+    capa = armazenamento.guardar('thumbnails', _arquivo(tmp_path, 'capa.jpg', b'capa'), '.jpg')
+    armazenamento.guardar('videos', _arquivo(tmp_path, 'a.mp4', b'video'), '.mp4')
+    base = capa.rsplit('.', 1)[0]
+    armazenamento.guardar_derivado(f'thumbnails/{base}-160.webp', _arquivo(tmp_path, 'v.webp', b'v'))
+
+    listados = {chave: tamanho for chave, tamanho, _ in armazenamento.listar(f'thumbnails/{base}')}
+    assert listados == {f'thumbnails/{capa}': 4, f'thumbnails/{base}-160.webp': 1}
+
+    midia.apagar(f'thumbnails/{base}-160.webp')
+    assert [chave for chave, _, _ in armazenamento.listar('thumbnails/')] == [f'thumbnails/{capa}']
+
+
+def test_s3_grava_com_cabecalhos_de_cache(tmp_path, s3, monkeypatch):
+    monkeypatch.setattr(armazenamento, 'armazenamento', s3)
+    nome = armazenamento.guardar('videos', _arquivo(tmp_path, 'a.mp4', b'video'), '.mp4')
+
+    objeto = s3.cliente.head_object(Bucket='dinhoflix', Key=f'midia/videos/{nome}')
+    assert objeto['ContentType'] == 'video/mp4'
+    assert objeto['CacheControl'] == CACHE_IMUTAVEL
+
+
+def test_s3_url_publica_ou_assinada(s3, monkeypatch):
+    monkeypatch.setattr(armazenamento, 'armazenamento', s3)
+    assinada = armazenamento.url_midia('videos', 'a.mp4')
+    assert '/midia/videos/a.mp4' in assinada
+    assert 'Signature' in assinada or 'X-Amz-Signature' in assinada
+
+    s3.url_publica = 'https://cdn.exemplo.com'
+    assert armazenamento.url_midia('videos', 'a.mp4') == 'https://cdn.exemplo.com/midia/videos/a.mp4'
+
+
+def test_s3_apagar_em_lotes_de_mil(s3):
+    for numero in range(1001):
+        s3.cliente.put_object(Bucket='dinhoflix', Key=f'midia/hls/x/{numero}.ts', Body=b'')
+
+    chaves = [chave for chave, _, _ in s3.listar('hls/x/')]
+    assert len(chaves) == 1001  # mais de uma página do list_objects_v2
+
+    s3.apagar(*chaves)
+    assert list(s3.listar('hls/')) == []
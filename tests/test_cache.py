@@ -0,0 +1,76 @@
+import pytest
+
+from DinhoFlix import cache, database, feed, interacoes
+from DinhoFlix.models import Post
+
+
+def _backends():
+    yield pytest.param(lambda: cache.CacheMemoria(maximo=100), id='memoria')
+
+    def compartilhado():
+        fakeredis = pytest.importorskip('fakeredis')
+        return cache.CacheCompartilhado(fakeredis.FakeRedis())
+    yield pytest.param(compartilhado, id='compartilhado')
+
+
+@pytest.fixture(params=_backends())
+def backend(request, monkeypatch):
+    instancia = request.param()
+    monkeypatch.setattr(cache, 'cache', instancia)
+    return instancia
+
+
+def test_memoria_expira_e_descarta_o_mais_antigo(relogio, monkeypatch):
+    monkeypatch.setattr(cache, 'time', relogio)
+    memoria = cache.CacheMemoria(maximo=2)
+
+    memoria.set('a', 1, ttl=10)
+    memoria.set('b', 2)
+    relogio.avancar(10)
+    assert memoria.get('a') is None
+
+    memoria.set('c', 3)
+    memoria.set('d', 4)
+    assert memoria.get_many(['b', 'c', 'd']) == [None, 3, 4]
+
+
+def test_geracao_estavel_ate_invalidar(backend):
+    primeira = cache.geracoes(['video', 'post'])
+    assert cache.geracoes(['video', 'post']) == primeira
+
+    cache.invalidar_feed('post')
+    depois = cache.geracoes(['video', 'post'])
+    assert depois[0] == primeira[0]
+    assert depois[1] != primeira[1]
+
+
+def test_pagina_do_feed_muda_so_depois_de_invalidar(backend, usuario):
+    database.session.add(Post(titulo='Primeiro', corpo='c', usuario_id=usuario.id))
+    database.session.commit()
+
+    def titulos():
+        return [item.titulo for item in feed.carregar_feed(['post']).itens]
+
+    assert titulos() == ['Primeiro']
+
+    database.session.add(Post(titulo='Segundo', corpo='c', usuario_id=usuario.id))
+    database.session.commit()
+    # Página em cache: o post novo só aparece com a geração nova
+    assert titulos() == ['Primeiro']
+
+    cache.invalidar_feed('post')
+    assert titulos() == ['Segundo', 'Primeiro']
+
+
+def test_like_nao_invalida_pagina_de_recentes(backend, usuario, post):
+    def likes(ordem):
+        return feed.carregar_feed(['post'], ordem=ordem).itens[0].total_likes
+
+    assert likes(feed.RECENTES) == 0
+    assert likes(feed.EM_ALTA) == 0
+
+    interacoes.alternar_like(usuario.id, 'post', post.id)
+
+    # Só a ordem que depende da pontuação é montada de novo
+    assert likes(feed.RECENTES) == 0
+    assert likes(feed.EM_ALTA) == 1
@@ -0,0 +1,103 @@
+import shutil
+from datetime import datetime, timezone
+
+import pytest
+
+from DinhoFlix import database, escrita_adiada
+from DinhoFlix.models import Comentario, Like, Post
+
+
+@pytest.fixture
+def pasta(tmp_path):
+    return str(tmp_path / 'escrita_adiada')
+
+
+def _fila(pasta):
+    # Intervalo longo: nada é gravado sozinho durante o teste
+    return escrita_adiada.FilaEscrita(pasta, intervalo=3600, lote=10_000)
+
+
+def _comentario(usuario, post, texto):
+    return escrita_adiada.ComentarioPendente(
+        chave=f'chave-{texto}',
+        usuario_id=usuario.id,
+        tipo='post',
+        conteudo_id=post.id,
+        texto=texto,
+        data_criacao=datetime.now(timezone.utc),
+    )
+
+
+def _cair(fila):
+    """Processo que morreu sem gravar: o log fica, sem o flock."""
+    arquivo, caminho = fila.log
+    arquivo.close()
+    return caminho
+
+
+def _totais(post):
+    database.session.expire_all()
+    post = database.session.get(Post, post.id)
+    return post.total_likes, post.total_comentarios
+
+
+def test_log_de_processo_que_caiu_e_reaplicado(pasta, usuario, post):
+    fila = _fila(pasta)
+    fila.registrar_like(usuario.id, 'post', post.id, True, False)
+    fila.registrar_comentario(_comentario(usuario, post, 'um'))
+    _cair(fila)
+
+    assert _fila(pasta).retomar() == 2
+    assert _totais(post) == (1, 1)
+    assert Like.query.filter_by(post_id=post.id).count() == 1
+    assert Comentario.query.filter_by(chave='chave-um').one().texto == 'um'
+
+
+def test_reaplicar_o_mesmo_log_de_novo_nao_duplica(pasta, usuario, post):
+    fila = _fila(pasta)
+    fila.registrar_like(usuario.id, 'post', post.id, True, False)
+    fila.registrar_comentario(_comentario(usuario, post, 'um'))
+    caminho = _cair(fila)
+    copia = caminho + '.copia'
+    shutil.copy(caminho, copia)
+
+    _fila(pasta).retomar()
+    # Caiu de novo depois do commit, antes de apagar o log
+    shutil.move(copia, caminho)
+    _fila(pasta).retomar()
+
+    assert _totais(post) == (1, 1)
+    assert Comentario.query.filter_by(post_id=post.id).count() == 1
+
+
+def test_linha_cortada_no_fim_e_ignorada(pasta, usuario, post):
+    fila = _fila(pasta)
+    fila.registrar_comentario(_comentario(usuario, post, 'inteiro'))
+    caminho = _cair(fila)
+    with open(caminho, 'a') as arquivo:
+        arquivo.write('{"evento": "comentario", "chave": "cort')
+
+    assert _fila(pasta).retomar() == 1
+    assert _totais(post) == (0, 1)
+
+
+def test_log_de_processo_vivo_nao_e_reaplicado(pasta, usuario, post):
+    fila = _fila(pasta)
+    fila.registrar_like(usuario.id, 'post', post.id, True, False)
+
+    assert _fila(pasta).retomar() == 0
+    assert _totais(post) == (0, 0)
+
+    assert fila.gravar() == 1
+    assert _totais(post) == (1, 0)
+    assert fila.log is None and fila.selados == []
+
+
+def test_cliques_que_se_desfazem_nao_gravam(pasta, usuario, post):
+    fila = _fila(pasta)
+    fila.registrar_like(usuario.id, 'post', post.id, None, False)
+    fila.registrar_like(usuario.id, 'post', post.id, None, False)
+
+    assert fila.pendentes_do_item('post', post.id) == (0, 0)
+    fila.gravar()
+    assert _totais(post) == (0, 0)
@@ -0,0 +1,98 @@
+import pytest
+
+from DinhoFlix import app, limites
+
+
+@pytest.fixture
+def baldes(relogio, monkeypatch):
+    monkeypatch.setattr(limites, 'time', relogio)
+    return limites.LimitesMemoria(maximo=100)
+
+
+def test_balde_cheio_deixa_passar_a_rajada(baldes):
+    assert [baldes.consumir('k', 3, 1) for _ in range(3)] == [0, 0, 0]
+    assert baldes.consumir('k', 3, 1) == pytest.approx(1)
+
+
+def test_fichas_voltam_no_ritmo_de_reposicao(baldes, relogio):
+    for _ in range(3):
+        baldes.consumir('k', 3, 2)
+
+    relogio.avancar(0.25)
+    assert baldes.consumir('k', 3, 2) == pytest.approx(0.25)
+
+    relogio.avancar(0.25)
+    assert baldes.consumir('k', 3, 2) == 0
+    assert baldes.consumir('k', 3, 2) > 0
+
+    # Parado por muito tempo, enche só até a capacidade
+    relogio.avancar(60)
+    assert [baldes.consumir('k', 3, 2) for _ in range(4)][-1] > 0
+
+
+def test_esperar_nao_gasta_ficha(baldes, relogio):
+    baldes.consumir('k', 1, 1)
+    baldes.consumir('k', 1, 1)
+    baldes.consumir('k', 1, 1)
+
+    relogio.avancar(1)
+    assert baldes.consumir('k', 1, 1) == 0
+
+
+def test_baldes_separados_por_chave(baldes):
+    baldes.consumir('a', 1, 1)
+    assert baldes.consumir('a', 1, 1) > 0
+    assert baldes.consumir('b', 1, 1) == 0
+
+
+def test_baldes_compartilhados(relogio, monkeypatch):
+    fakeredis = pytest.importorskip('fakeredis')
+    monkeypatch.setattr(limites, 'time', relogio)
+    baldes = limites.LimitesCompartilhados(fakeredis.FakeRedis())
+
+    assert [baldes.consumir('k', 2, 1) for _ in range(2)] == [0, 0]
+    assert baldes.consumir('k', 2, 1) == pytest.approx(1)
+
+    relogio.avancar(1)
+    assert baldes.consumir('k', 2, 1) == 0
+
+
+@pytest.fixture
+def limite_curtir(baldes, monkeypatch):
+    monkeypatch.setattr(limites, 'limites', baldes)
+    monkeypatch.setitem(app.config, 'LIMITES', {'curtir': (2, 0.5)})
+    monkeypatch.setitem(app.config, 'LIMITES_ROTA', {})
+
+
+def test_rota_responde_429_com_retry_after(cliente, post, limite_curtir):
+    url = f'/curtir/post/{post.id}'
+    assert cliente.post(url).status_code == 200
+    assert cliente.post(url).status_code == 200
+
+    resposta = cliente.post(url, headers={'Accept': 'application/json'})
+    assert resposta.status_code == 429
+    assert resposta.headers['Retry-After'] == '2'
+    assert resposta.get_json()['espera'] == pytest.approx(2)
+
+    resposta = cliente.post(url, headers={'Accept': 'text/html'})
+    assert resposta.status_code == 429
+    assert resposta.mimetype == 'text/html'
+
+
+def test_rota_libera_depois_da_espera(cliente, post, limite_curtir, relogio):
+    url = f'/curtir/post/{post.id}'
+    for _ in range(3):
+        cliente.post(url)
+
+    relogio.avancar(2)
+    assert cliente.post(url).status_code == 200
+
+
+def test_get_nao_conta(limite_curtir):
+    @limites.limitar('curtir')
+    def rota():
+        return 'ok'
+
+    with app.test_request_context(method='GET'):
+        for _ in range(5):
+            assert rota() == 'ok'